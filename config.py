@@ -4,6 +4,8 @@
 """
 
 import os
+import sys
+import logging
 from dotenv import load_dotenv
 
 # 加载 .env 文件（如果存在）
@@ -40,6 +42,13 @@ DB_PATH = DB_PATH_OVERRIDE if DB_PATH_OVERRIDE else os.path.join(DB_DIR, 'report
 # SQLite 配置
 DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL')  # WAL 模式（仅在本地磁盘）
 DB_BUSY_TIMEOUT = int(os.getenv('DB_BUSY_TIMEOUT', '10000'))  # 10秒超时
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')  # WAL 下 NORMAL 足够安全
+
+# 连接池配置（每个数据库全进程共享一个引擎）
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '3600'))  # 连接最长复用 1 小时
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'false').lower() == 'true'  # SQLite 本地文件无需预检，切换到 MySQL/PG 时开启
 
 # ============================================
 # 历史数据导出配置
@@ -60,6 +69,12 @@ REPORT_MINUTE = int(os.getenv('REPORT_MINUTE', '0'))
 # 日报时间范围（过去24小时）
 REPORT_WINDOW_HOURS = int(os.getenv('REPORT_WINDOW_HOURS', '24'))
 
+# ============================================
+# 消息监听配置
+# ============================================
+# 入站消息队列上限（超过时丢弃最旧消息，防止突发流量导致内存暴涨）
+LISTENER_QUEUE_MAXSIZE = int(os.getenv('LISTENER_QUEUE_MAXSIZE', '200'))
+
 # ============================================
 # 邮件配置
 # ============================================
@@ -114,6 +129,12 @@ ETH_VOLUME_THRESHOLD = int(os.getenv('ETH_VOLUME_THRESHOLD', '5000'))  # ETH opt
 ALERT_TEST_MODE = os.getenv('ALERT_TEST_MODE', 'false').lower() == 'true'
 ETH_VOLUME_THRESHOLD_TEST = int(os.getenv('ETH_VOLUME_THRESHOLD_TEST', '1000'))  # 测试模式下 ETH 阈值
 
+# 预警邮件并发发送上限（防止突发大宗交易打满 SMTP 连接）
+ALERT_SEND_CONCURRENCY = int(os.getenv('ALERT_SEND_CONCURRENCY', '4'))
+# 预警邮件发送失败重试（指数退避：2s, 4s, 8s ... 上限 ALERT_RETRY_MAX_BACKOFF 秒）
+ALERT_SEND_MAX_RETRIES = int(os.getenv('ALERT_SEND_MAX_RETRIES', '3'))
+ALERT_RETRY_MAX_BACKOFF = int(os.getenv('ALERT_RETRY_MAX_BACKOFF', '60'))
+
 # ============================================
 # 权利金预警配置（单笔大宗交易）
 # ============================================
@@ -126,6 +147,12 @@ PREMIUM_USD_THRESHOLD = int(os.getenv('PREMIUM_USD_THRESHOLD', '1000000'))  # 
 # ============================================
 REPORT_TEMPLATE_VERSION = os.getenv('REPORT_TEMPLATE_VERSION', 'v1')  # v1 或 v2
 
+# 消息解析缓存（按原文缓存 parse_block_trade_message 结果，回补多天/重复生成时复用）
+PARSE_CACHE_SIZE = int(os.getenv('PARSE_CACHE_SIZE', '8192'))
+
+# 日报聚合时打印 BTC Top3 明细日志（[TOP] 行，排查排名问题时开启）
+REPORT_DEBUG_TOP = os.getenv('REPORT_DEBUG_TOP', 'false').lower() == 'true'
+
 # ============================================
 # 日志配置
 # ============================================
@@ -186,6 +213,16 @@ def print_config():
     print("=" * 60)
 
 
+def setup_logging():
+    """配置日志输出（格式与结构化 print 日志一致：[时间] [TAG] key=value）"""
+    logging.basicConfig(
+        level=LOG_LEVEL.upper(),
+        format='[%(asctime)s] %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        stream=sys.stdout
+    )
+
+
 def print_email_config():
     """打印邮件路由配置（启动时必须调用）"""
     mode = EMAIL_MODE
@@ -15,6 +15,7 @@ from datetime import datetime, timedelta
 from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, Index, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.engine import Engine
 import os
 import json
@@ -86,6 +87,7 @@ class DailyReport(Base):
     - eth_spot_price: ETH 现货价格
     - report_data: 完整报告数据（JSON 格式）
     - html_content: HTML 邮件内容
+    - content_hash: report_data 内容哈希（SHA-256，用于跳过未变化的重复写入）
     - is_sent: 是否已发送邮件
     - sent_at: 邮件发送时间
     - created_at: 报告生成时间
@@ -106,6 +108,7 @@ class DailyReport(Base):
     eth_spot_price = Column(String(20), nullable=True)
     report_data = Column(Text, nullable=True)  # JSON string
     html_content = Column(Text, nullable=True)
+    content_hash = Column(String(64), nullable=True)
     is_sent = Column(Boolean, default=False, index=True)
     sent_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -250,11 +253,15 @@ def set_sqlite_pragma(dbapi_conn, connection_record):
     cursor = dbapi_conn.cursor()
 
     # 使用 WAL 模式（仅在本地磁盘，不在 NFS）
-    # WAL 模式支持更高的并发性
-    cursor.execute(f"PRAGMA journal_mode = {config.DB_JOURNAL_MODE}")
+    # WAL 模式支持更高的并发性；journal_mode 持久化在库文件里，
+    # 已是目标模式时不再切换（切换需要拿写锁，发送循环并发连接时容易撞 busy）
+    cursor.execute("PRAGMA journal_mode")
+    row = cursor.fetchone()
+    if not row or row[0].upper() != config.DB_JOURNAL_MODE.upper():
+        cursor.execute(f"PRAGMA journal_mode = {config.DB_JOURNAL_MODE}")
 
-    # 设置同步模式为 NORMAL（在 WAL 模式下足够安全）
-    cursor.execute("PRAGMA synchronous = NORMAL")
+    # 设置同步模式（默认 NORMAL，在 WAL 模式下足够安全，小事务提交只在 checkpoint 时 fsync）
+    cursor.execute(f"PRAGMA synchronous = {config.DB_SYNCHRONOUS}")
 
     # 设置缓存大小（负数表示 KB，这里设置为 10MB）
     cursor.execute("PRAGMA cache_size = -10000")
@@ -271,6 +278,28 @@ def set_sqlite_pragma(dbapi_conn, connection_record):
     cursor.close()
 
 
+def ensure_daily_report_columns(engine):
+    """
+    为已存在的 daily_reports 表补充新增列（SQLite ALTER TABLE ADD COLUMN）
+
+    Args:
+        engine: 数据库引擎
+    """
+    from datetime import datetime
+
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA table_info(daily_reports)")
+        existing = {row[1] for row in cursor.fetchall()}
+        if 'content_hash' not in existing:
+            cursor.execute("ALTER TABLE daily_reports ADD COLUMN content_hash VARCHAR(64)")
+            conn.commit()
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [DB] column_added table=daily_reports column=content_hash")
+    finally:
+        conn.close()
+
+
 def init_database(test=False):
     """
     初始化数据库 + journal_mode 硬化
@@ -294,15 +323,24 @@ def init_database(test=False):
     # 创建数据库引擎
     db_key = 'test' if test else 'prod'
 
+    # 连接池：LIFO 复用最近使用的连接（SQLite 页缓存更热），定期回收长连接
     engine = create_engine(
         f'sqlite:///{db_path}',
         echo=False,
-        connect_args={'check_same_thread': False}
+        connect_args={'check_same_thread': False},
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        pool_pre_ping=config.DB_POOL_PRE_PING,
+        pool_use_lifo=True
     )
 
     # 创建所有表（包括索引）
     Base.metadata.create_all(engine)
 
+    # 旧库补列（create_all 不会给已存在的表加列）
+    ensure_daily_report_columns(engine)
+
     # 设置 journal_mode（默认 DELETE，可通过 config 覆盖）
     target_mode = getattr(config, 'DB_JOURNAL_MODE', 'DELETE').upper()
 
@@ -370,16 +408,25 @@ def save_message(session, message_id, date, text, is_block_trade=False):
         is_block_trade: 是否为大宗交易
 
     Returns:
-        Message 对象，如果消息已存在则返回 None
+        Message 对象（未绑定会话，只携带写入的字段），如果消息已存在则返回 None
     """
     try:
-        # 检查消息是否已存在
-        existing = session.query(Message).filter_by(message_id=message_id).first()
-        if existing:
+        # INSERT ... ON CONFLICT(message_id) DO NOTHING：按唯一键一次写入，
+        # 已存在时影响行数为 0（不再先 SELECT 再 INSERT 两次往返）
+        insert_stmt = sqlite_insert(Message).values(
+            message_id=message_id,
+            date=date,
+            text=text,
+            is_block_trade=is_block_trade
+        ).on_conflict_do_nothing(index_elements=['message_id'])
+
+        result = session.execute(insert_stmt)
+        session.commit()
+
+        if result.rowcount == 0:
             print(f"⚠ 消息 {message_id} 已存在，跳过")
             return None
 
-        # 创建新消息记录
         message = Message(
             message_id=message_id,
             date=date,
@@ -387,9 +434,6 @@ def save_message(session, message_id, date, text, is_block_trade=False):
             is_block_trade=is_block_trade
         )
 
-        session.add(message)
-        session.commit()
-
         print(f"✓ 消息已保存: ID={message_id}, Block={is_block_trade}")
         return message
 
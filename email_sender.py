@@ -9,12 +9,18 @@ from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
 import pytz
 import argparse
+import re
 import sys
+import time
 
 import config
 from database import get_session, get_messages_by_date_range
 from report_generator import parse_block_trade_message
 
+# HTML 转纯文本 fallback 用的预编译正则
+_RE_HTML_TAG = re.compile(r'<[^>]+>')
+_RE_WHITESPACE = re.compile(r'\s+')
+
 
 # ============================================
 # 邮件收件人路由（唯一入口）
@@ -133,17 +139,18 @@ def query_daily_stats(report_date: str) -> dict:
 
         messages = get_messages_by_date_range(session, start_date, end_date)
 
-        # 筛选大宗交易
-        block_trades = [msg for msg in messages if msg.is_block_trade]
-
         # 初始化统计
+        total_trades = 0
         btc_total_volume = 0.0
         eth_total_volume = 0.0
         btc_trade_count = 0
         eth_trade_count = 0
 
-        # 解析每笔大宗交易
-        for trade in block_trades:
+        # 筛选并解析每笔大宗交易（同一遍循环内完成，不再先构建 block_trades 列表）
+        for trade in messages:
+            if not trade.is_block_trade:
+                continue
+            total_trades += 1
             parsed = parse_block_trade_message(trade.text or '')
             asset = parsed.get('asset', 'Unknown')
             volume = parsed.get('volume', 0.0)
@@ -158,7 +165,7 @@ def query_daily_stats(report_date: str) -> dict:
         return {
             'date': report_date,
             'total_messages': len(messages),
-            'total_trades': len(block_trades),
+            'total_trades': total_trades,
             'btc_total_volume': btc_total_volume,
             'eth_total_volume': eth_total_volume,
             'btc_trade_count': btc_trade_count,
@@ -169,6 +176,19 @@ def query_daily_stats(report_date: str) -> dict:
         session.close()
 
 
+def _open_smtp():
+    """创建并返回已登录的 SMTP 连接（单次尝试，失败时关闭连接并抛出 smtplib.SMTPException / OSError）"""
+    smtp = smtplib.SMTP(config.SMTP_SERVER, config.SMTP_PORT, timeout=10)
+    try:
+        if config.SMTP_USE_TLS:
+            smtp.starttls()
+        smtp.login(config.EMAIL_SENDER, config.EMAIL_PASSWORD)
+    except BaseException:
+        smtp.close()
+        raise
+    return smtp
+
+
 def create_smtp_connection(max_retries=3):
     """
     创建并返回已登录的 SMTP 连接（带重试）
@@ -179,15 +199,11 @@ def create_smtp_connection(max_retries=3):
     Returns:
         SMTP 连接对象或 None（失败时）
     """
-    import time
     delay = 2  # 初始延迟2秒
 
     for attempt in range(1, max_retries + 1):
         try:
-            smtp = smtplib.SMTP(config.SMTP_SERVER, config.SMTP_PORT, timeout=10)
-            if config.SMTP_USE_TLS:
-                smtp.starttls()
-            smtp.login(config.EMAIL_SENDER, config.EMAIL_PASSWORD)
+            smtp = _open_smtp()
 
             if attempt > 1:
                 print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [EMAIL] smtp_connected_retry attempt={attempt}/{max_retries}")
@@ -222,8 +238,6 @@ def send_email(subject: str, body: str, recipients: list = None, email_type: str
         True: 发送成功
         False: 发送失败
     """
-    import time
-
     # ============================================
     # STEP 1: 收件人路由（若未提供 recipients）
     # ============================================
@@ -296,7 +310,7 @@ def send_email(subject: str, body: str, recipients: list = None, email_type: str
     return False
 
 
-def send_html_email(subject: str, html_body: str, recipients: list = None, email_type: str = 'unknown', mode: str = None, msg_id: str = None, report_date: str = None) -> bool:
+def send_html_email(subject: str, html_body: str, recipients: list = None, email_type: str = 'unknown', mode: str = None, msg_id: str = None, report_date: str = None, retry: bool = True) -> bool:
     """
     发送 HTML 格式邮件（带纯文本 fallback、重试和收件人路由）
 
@@ -308,13 +322,15 @@ def send_html_email(subject: str, html_body: str, recipients: list = None, email
         mode: 邮件模式 ('test', 'prod', None=自动)
         msg_id: 消息 ID（用于日志）
         report_date: 报告日期（用于日志）
+        retry: 是否在本函数内重试；False 时只连接/发送一次，SMTP 异常直接抛出，由调用方决定是否重试
 
     Returns:
         True: 发送成功
-        False: 发送失败
-    """
-    import time, re
+        False: 发送失败（retry=False 时只表示被拦截的永久失败，如无收件人/标题不合法）
 
+    Raises:
+        smtplib.SMTPException / OSError: 仅 retry=False 时，SMTP 连接或发送失败
+    """
     # ============================================
     # STEP 1: 收件人路由（若未提供 recipients）
     # ============================================
@@ -354,22 +370,39 @@ def send_html_email(subject: str, html_body: str, recipients: list = None, email
     # ============================================
     # STEP 5: 实际发送（带重试）
     # ============================================
+    msg = MIMEMultipart('alternative')
+    msg['From'] = config.EMAIL_SENDER
+    msg['To'] = ', '.join(recipients)
+    msg['Subject'] = final_subject
+
+    text_body = _RE_HTML_TAG.sub('', html_body)
+    text_body = _RE_WHITESPACE.sub(' ', text_body).strip()
+
+    msg.attach(MIMEText(text_body, 'plain', 'utf-8'))
+    msg.attach(MIMEText(html_body, 'html', 'utf-8'))
+
+    if not retry:
+        # 单次尝试：重试与退避交给调用方（避免与调用方的重试层层叠加）
+        # with：退出时发送 QUIT（忽略服务器已断开）并总是关闭 socket，发送失败不泄漏连接；
+        # 邮件已发出后 QUIT 再出错只记日志，不抛给调用方（否则会被当作瞬时错误重发同一封邮件）
+        sent = False
+        try:
+            with _open_smtp() as smtp:
+                smtp.send_message(msg)
+                sent = True
+        except Exception as e:
+            if not sent:
+                print(f"[EMAIL_FAIL] mode={resolved_mode} email_type={email_type} attempt=1/1 error={type(e).__name__}: {str(e)}")
+                raise
+            print(f"[EMAIL_QUIT_FAIL] mode={resolved_mode} email_type={email_type} error={type(e).__name__}: {str(e)}")
+        print(f"[EMAIL_SENT] mode={resolved_mode} email_type={email_type} recipients_count={len(recipients)} subject={final_subject[:60]}")
+        return True
+
     max_retries = 3
     delay = 2  # 初始延迟2秒
 
     for attempt in range(1, max_retries + 1):
         try:
-            msg = MIMEMultipart('alternative')
-            msg['From'] = config.EMAIL_SENDER
-            msg['To'] = ', '.join(recipients)
-            msg['Subject'] = final_subject
-
-            text_body = re.sub(r'<[^>]+>', '', html_body)
-            text_body = re.sub(r'\s+', ' ', text_body).strip()
-
-            msg.attach(MIMEText(text_body, 'plain', 'utf-8'))
-            msg.attach(MIMEText(html_body, 'html', 'utf-8'))
-
             smtp = create_smtp_connection()
             if smtp is None:
                 raise Exception("SMTP connection failed")
@@ -583,7 +616,44 @@ Generated at: {datetime.now(pytz.timezone(config.REPORT_TIMEZONE)).strftime('%Y-
     return send_email(subject, body)
 
 
-def send_single_trade_alert_html(trade_info: dict, message_data: dict, threshold: int, alert_reasons: list = None, lang: str = 'en', test_mode: bool = False) -> bool:
+# 单笔预警邮件 CSS（中/英文模板），原样存放（无需 {{ }} 转义），f-string 只插值动态字段
+_SINGLE_ALERT_CSS_ZH = """        body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", "Microsoft YaHei", Arial, sans-serif; margin: 0; padding: 20px; background: #f5f5f5; }
+        .container { max-width: 800px; margin: 0 auto; background: white; border-radius: 8px; padding: 30px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
+        .header { background: linear-gradient(135deg, #dc2626 0%, #f59e0b 100%); color: white; padding: 20px; border-radius: 8px; margin-bottom: 20px; }
+        .header h1 { margin: 0; font-size: 24px; }
+        .alert-tag { display: inline-block; background: #dc2626; color: white; padding: 4px 12px; border-radius: 4px; font-size: 12px; font-weight: bold; margin-top: 8px; margin-right: 8px; }
+        .section { margin: 20px 0; }
+        .section-title { font-size: 16px; font-weight: bold; color: #1f2937; margin-bottom: 10px; border-bottom: 2px solid #e5e7eb; padding-bottom: 5px; }
+        .field-row { margin: 8px 0; padding: 8px; background: #f9fafb; border-radius: 4px; }
+        .field-label { color: #6b7280; min-width: 100px; display: inline-block; }
+        .field-value { color: #1f2937; font-weight: 600; }
+        .volume-highlight { font-size: 20px; color: #dc2626; font-weight: bold; }
+        .greeks-grid { display: grid; grid-template-columns: repeat(5, 1fr); gap: 10px; margin-top: 10px; }
+        .greek-item { text-align: center; padding: 8px; background: #f3f4f6; border-radius: 4px; }
+        .greek-label { font-size: 11px; color: #6b7280; margin-bottom: 4px; }
+        .greek-value { font-size: 14px; color: #1f2937; font-weight: 600; }
+        .message-box { background: #f3f4f6; border: 1px solid #d1d5db; padding: 15px; border-radius: 6px; margin: 10px 0; font-size: 13px; color: #374151; white-space: pre-wrap; font-family: "Courier New", monospace; max-height: 400px; overflow-y: auto; }
+        .footer { text-align: center; color: #9ca3af; font-size: 12px; margin-top: 30px; padding-top: 20px; border-top: 1px solid #e5e7eb; }"""
+_SINGLE_ALERT_CSS_EN = """        body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Arial, sans-serif; margin: 0; padding: 20px; background: #f5f5f5; }
+        .container { max-width: 800px; margin: 0 auto; background: white; border-radius: 8px; padding: 30px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
+        .header { background: linear-gradient(135deg, #dc2626 0%, #f59e0b 100%); color: white; padding: 20px; border-radius: 8px; margin-bottom: 20px; }
+        .header h1 { margin: 0; font-size: 24px; }
+        .alert-tag { display: inline-block; background: #dc2626; color: white; padding: 4px 12px; border-radius: 4px; font-size: 12px; font-weight: bold; margin-top: 8px; margin-right: 8px; }
+        .trade-card { background: #fef3c7; border-left: 4px solid #f59e0b; padding: 20px; border-radius: 8px; margin: 20px 0; }
+        .trade-field { margin: 12px 0; }
+        .trade-field strong { color: #4b5563; min-width: 140px; display: inline-block; }
+        .trade-value { color: #1f2937; font-weight: 600; }
+        .volume-highlight { font-size: 20px; color: #dc2626; font-weight: bold; }
+        .greeks-section { margin-top: 20px; padding: 15px; background: #f3f4f6; border-radius: 6px; }
+        .greeks-grid { display: grid; grid-template-columns: repeat(5, 1fr); gap: 10px; margin-top: 10px; }
+        .greek-item { text-align: center; padding: 8px; background: white; border-radius: 4px; }
+        .greek-label { font-size: 11px; color: #6b7280; margin-bottom: 4px; }
+        .greek-value { font-size: 14px; color: #1f2937; font-weight: 600; }
+        .message-box { background: #f3f4f6; border: 1px solid #d1d5db; padding: 15px; border-radius: 6px; margin: 20px 0; font-size: 13px; color: #374151; white-space: pre-wrap; font-family: monospace; max-height: 400px; overflow-y: auto; }
+        .footer { text-align: center; color: #9ca3af; font-size: 12px; margin-top: 30px; padding-top: 20px; border-top: 1px solid #e5e7eb; }"""
+
+
+def send_single_trade_alert_html(trade_info: dict, message_data: dict, threshold: int, alert_reasons: list = None, lang: str = 'en', test_mode: bool = False, retry: bool = True) -> bool:
     """
     发送单笔 OPTIONS 交易预警邮件（HTML 格式，OPTIONS ONLY）
 
@@ -594,6 +664,7 @@ def send_single_trade_alert_html(trade_info: dict, message_data: dict, threshold
         alert_reasons: 预警原因列表 ['volume'] 或 ['premium'] 或 ['volume', 'premium']
         lang: 语言模式 ('en' 或 'zh')
         test_mode: 测试模式（在邮件标题添加【TEST】标记）
+        retry: 透传给 send_html_email；False 时只发送一次，SMTP 异常直接抛出
 
     Returns:
         True: 发送成功
@@ -669,23 +740,7 @@ def send_single_trade_alert_html(trade_info: dict, message_data: dict, threshold
 <head>
     <meta charset="UTF-8">
     <style>
-        body {{ font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", "Microsoft YaHei", Arial, sans-serif; margin: 0; padding: 20px; background: #f5f5f5; }}
-        .container {{ max-width: 800px; margin: 0 auto; background: white; border-radius: 8px; padding: 30px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }}
-        .header {{ background: linear-gradient(135deg, #dc2626 0%, #f59e0b 100%); color: white; padding: 20px; border-radius: 8px; margin-bottom: 20px; }}
-        .header h1 {{ margin: 0; font-size: 24px; }}
-        .alert-tag {{ display: inline-block; background: #dc2626; color: white; padding: 4px 12px; border-radius: 4px; font-size: 12px; font-weight: bold; margin-top: 8px; margin-right: 8px; }}
-        .section {{ margin: 20px 0; }}
-        .section-title {{ font-size: 16px; font-weight: bold; color: #1f2937; margin-bottom: 10px; border-bottom: 2px solid #e5e7eb; padding-bottom: 5px; }}
-        .field-row {{ margin: 8px 0; padding: 8px; background: #f9fafb; border-radius: 4px; }}
-        .field-label {{ color: #6b7280; min-width: 100px; display: inline-block; }}
-        .field-value {{ color: #1f2937; font-weight: 600; }}
-        .volume-highlight {{ font-size: 20px; color: #dc2626; font-weight: bold; }}
-        .greeks-grid {{ display: grid; grid-template-columns: repeat(5, 1fr); gap: 10px; margin-top: 10px; }}
-        .greek-item {{ text-align: center; padding: 8px; background: #f3f4f6; border-radius: 4px; }}
-        .greek-label {{ font-size: 11px; color: #6b7280; margin-bottom: 4px; }}
-        .greek-value {{ font-size: 14px; color: #1f2937; font-weight: 600; }}
-        .message-box {{ background: #f3f4f6; border: 1px solid #d1d5db; padding: 15px; border-radius: 6px; margin: 10px 0; font-size: 13px; color: #374151; white-space: pre-wrap; font-family: "Courier New", monospace; max-height: 400px; overflow-y: auto; }}
-        .footer {{ text-align: center; color: #9ca3af; font-size: 12px; margin-top: 30px; padding-top: 20px; border-top: 1px solid #e5e7eb; }}
+{_SINGLE_ALERT_CSS_ZH}
     </style>
 </head>
 <body>
@@ -882,23 +937,7 @@ def send_single_trade_alert_html(trade_info: dict, message_data: dict, threshold
 <head>
     <meta charset="UTF-8">
     <style>
-        body {{ font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Arial, sans-serif; margin: 0; padding: 20px; background: #f5f5f5; }}
-        .container {{ max-width: 800px; margin: 0 auto; background: white; border-radius: 8px; padding: 30px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }}
-        .header {{ background: linear-gradient(135deg, #dc2626 0%, #f59e0b 100%); color: white; padding: 20px; border-radius: 8px; margin-bottom: 20px; }}
-        .header h1 {{ margin: 0; font-size: 24px; }}
-        .alert-tag {{ display: inline-block; background: #dc2626; color: white; padding: 4px 12px; border-radius: 4px; font-size: 12px; font-weight: bold; margin-top: 8px; margin-right: 8px; }}
-        .trade-card {{ background: #fef3c7; border-left: 4px solid #f59e0b; padding: 20px; border-radius: 8px; margin: 20px 0; }}
-        .trade-field {{ margin: 12px 0; }}
-        .trade-field strong {{ color: #4b5563; min-width: 140px; display: inline-block; }}
-        .trade-value {{ color: #1f2937; font-weight: 600; }}
-        .volume-highlight {{ font-size: 20px; color: #dc2626; font-weight: bold; }}
-        .greeks-section {{ margin-top: 20px; padding: 15px; background: #f3f4f6; border-radius: 6px; }}
-        .greeks-grid {{ display: grid; grid-template-columns: repeat(5, 1fr); gap: 10px; margin-top: 10px; }}
-        .greek-item {{ text-align: center; padding: 8px; background: white; border-radius: 4px; }}
-        .greek-label {{ font-size: 11px; color: #6b7280; margin-bottom: 4px; }}
-        .greek-value {{ font-size: 14px; color: #1f2937; font-weight: 600; }}
-        .message-box {{ background: #f3f4f6; border: 1px solid #d1d5db; padding: 15px; border-radius: 6px; margin: 20px 0; font-size: 13px; color: #374151; white-space: pre-wrap; font-family: monospace; max-height: 400px; overflow-y: auto; }}
-        .footer {{ text-align: center; color: #9ca3af; font-size: 12px; margin-top: 30px; padding-top: 20px; border-top: 1px solid #e5e7eb; }}
+{_SINGLE_ALERT_CSS_EN}
     </style>
 </head>
 <body>
@@ -1051,7 +1090,7 @@ def send_single_trade_alert_html(trade_info: dict, message_data: dict, threshold
     print(f"  [发送] OPTIONS 预警邮件: {asset} options_sum={options_sum:.1f}x options_legs={options_count} @ {exchange}")
     msg_id_str = str(message_data.get('message_id', 'Unknown'))
     mode = 'test' if test_mode else None  # test_mode 参数决定是否强制 test 模式
-    return send_html_email(subject, html_body, recipients=None, email_type='alert', mode=mode, msg_id=msg_id_str, report_date=None)
+    return send_html_email(subject, html_body, recipients=None, email_type='alert', mode=mode, msg_id=msg_id_str, report_date=None, retry=retry)
 
 
 def send_single_trade_alert(asset: str, volume: float, exchange: str,
@@ -1337,6 +1376,38 @@ def main():
 # ============================================
 # STEP 3：权利金预警邮件发送函数
 # ============================================
+# 权利金预警邮件 CSS（中/英文模板），原样存放（无需 {{ }} 转义），f-string 只插值动态字段
+_PREMIUM_ALERT_CSS_ZH = """        body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", "Microsoft YaHei", Arial, sans-serif; margin: 0; padding: 20px; background: #f5f5f5; }
+        .container { max-width: 800px; margin: 0 auto; background: white; border-radius: 8px; padding: 30px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
+        .header { background: linear-gradient(135deg, #7c3aed 0%, #db2777 100%); color: white; padding: 20px; border-radius: 8px; margin-bottom: 20px; }
+        .header h1 { margin: 0; font-size: 24px; }
+        .alert-tag { display: inline-block; background: #7c3aed; color: white; padding: 4px 12px; border-radius: 4px; font-size: 12px; font-weight: bold; margin-top: 8px; margin-right: 8px; }
+        .section { margin: 20px 0; }
+        .section-title { font-size: 16px; font-weight: bold; color: #1f2937; margin-bottom: 10px; border-bottom: 2px solid #e5e7eb; padding-bottom: 5px; }
+        .field-row { margin: 8px 0; padding: 8px; background: #f9fafb; border-radius: 4px; }
+        .field-label { color: #6b7280; min-width: 100px; display: inline-block; }
+        .field-value { color: #1f2937; font-weight: 600; }
+        .premium-highlight { font-size: 22px; color: #7c3aed; font-weight: bold; }
+        .greeks-grid { display: grid; grid-template-columns: repeat(5, 1fr); gap: 10px; margin-top: 10px; }
+        .greek-item { text-align: center; padding: 8px; background: #f3f4f6; border-radius: 4px; }
+        .greek-label { font-size: 11px; color: #6b7280; margin-bottom: 4px; }
+        .greek-value { font-size: 14px; color: #1f2937; font-weight: 600; }
+        .message-box { background: #f3f4f6; border: 1px solid #d1d5db; padding: 15px; border-radius: 6px; margin: 10px 0; font-size: 13px; color: #374151; white-space: pre-wrap; font-family: "Courier New", monospace; max-height: 400px; overflow-y: auto; }
+        .footer { text-align: center; color: #9ca3af; font-size: 12px; margin-top: 30px; padding-top: 20px; border-top: 1px solid #e5e7eb; }"""
+_PREMIUM_ALERT_CSS_EN = """        body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Arial, sans-serif; margin: 0; padding: 20px; background: #f5f5f5; }
+        .container { max-width: 800px; margin: 0 auto; background: white; border-radius: 8px; padding: 30px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
+        .header { background: linear-gradient(135deg, #7c3aed 0%, #db2777 100%); color: white; padding: 20px; border-radius: 8px; margin-bottom: 20px; }
+        .header h1 { margin: 0; font-size: 24px; }
+        .alert-tag { display: inline-block; background: #7c3aed; color: white; padding: 4px 12px; border-radius: 4px; font-size: 12px; font-weight: bold; margin-top: 8px; margin-right: 8px; }
+        .trade-card { background: #f3e8ff; border-left: 4px solid #7c3aed; padding: 20px; border-radius: 8px; margin: 20px 0; }
+        .trade-field { margin: 12px 0; }
+        .trade-field strong { color: #4b5563; min-width: 180px; display: inline-block; }
+        .trade-value { color: #1f2937; font-weight: 600; }
+        .premium-highlight { font-size: 22px; color: #7c3aed; font-weight: bold; }
+        .message-box { background: #f3f4f6; border: 1px solid #d1d5db; padding: 15px; border-radius: 6px; margin: 20px 0; font-size: 13px; color: #374151; white-space: pre-wrap; font-family: monospace; max-height: 400px; overflow-y: auto; }
+        .footer { text-align: center; color: #9ca3af; font-size: 12px; margin-top: 30px; padding-top: 20px; border-top: 1px solid #e5e7eb; }"""
+
+
 def send_premium_alert_html(trade_info: dict, message_data: dict, premium_usd_sum: float, threshold: float, lang: str = 'zh', test_mode: bool = False) -> bool:
     """
     发送权利金预警邮件（Premium USD Alert）
@@ -1405,23 +1476,7 @@ def send_premium_alert_html(trade_info: dict, message_data: dict, premium_usd_su
 <head>
     <meta charset="UTF-8">
     <style>
-        body {{ font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", "Microsoft YaHei", Arial, sans-serif; margin: 0; padding: 20px; background: #f5f5f5; }}
-        .container {{ max-width: 800px; margin: 0 auto; background: white; border-radius: 8px; padding: 30px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }}
-        .header {{ background: linear-gradient(135deg, #7c3aed 0%, #db2777 100%); color: white; padding: 20px; border-radius: 8px; margin-bottom: 20px; }}
-        .header h1 {{ margin: 0; font-size: 24px; }}
-        .alert-tag {{ display: inline-block; background: #7c3aed; color: white; padding: 4px 12px; border-radius: 4px; font-size: 12px; font-weight: bold; margin-top: 8px; margin-right: 8px; }}
-        .section {{ margin: 20px 0; }}
-        .section-title {{ font-size: 16px; font-weight: bold; color: #1f2937; margin-bottom: 10px; border-bottom: 2px solid #e5e7eb; padding-bottom: 5px; }}
-        .field-row {{ margin: 8px 0; padding: 8px; background: #f9fafb; border-radius: 4px; }}
-        .field-label {{ color: #6b7280; min-width: 100px; display: inline-block; }}
-        .field-value {{ color: #1f2937; font-weight: 600; }}
-        .premium-highlight {{ font-size: 22px; color: #7c3aed; font-weight: bold; }}
-        .greeks-grid {{ display: grid; grid-template-columns: repeat(5, 1fr); gap: 10px; margin-top: 10px; }}
-        .greek-item {{ text-align: center; padding: 8px; background: #f3f4f6; border-radius: 4px; }}
-        .greek-label {{ font-size: 11px; color: #6b7280; margin-bottom: 4px; }}
-        .greek-value {{ font-size: 14px; color: #1f2937; font-weight: 600; }}
-        .message-box {{ background: #f3f4f6; border: 1px solid #d1d5db; padding: 15px; border-radius: 6px; margin: 10px 0; font-size: 13px; color: #374151; white-space: pre-wrap; font-family: "Courier New", monospace; max-height: 400px; overflow-y: auto; }}
-        .footer {{ text-align: center; color: #9ca3af; font-size: 12px; margin-top: 30px; padding-top: 20px; border-top: 1px solid #e5e7eb; }}
+{_PREMIUM_ALERT_CSS_ZH}
     </style>
 </head>
 <body>
@@ -1593,18 +1648,7 @@ def send_premium_alert_html(trade_info: dict, message_data: dict, premium_usd_su
 <head>
     <meta charset="UTF-8">
     <style>
-        body {{ font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Arial, sans-serif; margin: 0; padding: 20px; background: #f5f5f5; }}
-        .container {{ max-width: 800px; margin: 0 auto; background: white; border-radius: 8px; padding: 30px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }}
-        .header {{ background: linear-gradient(135deg, #7c3aed 0%, #db2777 100%); color: white; padding: 20px; border-radius: 8px; margin-bottom: 20px; }}
-        .header h1 {{ margin: 0; font-size: 24px; }}
-        .alert-tag {{ display: inline-block; background: #7c3aed; color: white; padding: 4px 12px; border-radius: 4px; font-size: 12px; font-weight: bold; margin-top: 8px; margin-right: 8px; }}
-        .trade-card {{ background: #f3e8ff; border-left: 4px solid #7c3aed; padding: 20px; border-radius: 8px; margin: 20px 0; }}
-        .trade-field {{ margin: 12px 0; }}
-        .trade-field strong {{ color: #4b5563; min-width: 180px; display: inline-block; }}
-        .trade-value {{ color: #1f2937; font-weight: 600; }}
-        .premium-highlight {{ font-size: 22px; color: #7c3aed; font-weight: bold; }}
-        .message-box {{ background: #f3f4f6; border: 1px solid #d1d5db; padding: 15px; border-radius: 6px; margin: 20px 0; font-size: 13px; color: #374151; white-space: pre-wrap; font-family: monospace; max-height: 400px; overflow-y: auto; }}
-        .footer {{ text-align: center; color: #9ca3af; font-size: 12px; margin-top: 30px; padding-top: 20px; border-top: 1px solid #e5e7eb; }}
+{_PREMIUM_ALERT_CSS_EN}
     </style>
 </head>
 <body>
@@ -6,6 +6,8 @@
 """
 
 import os
+import re
+import time
 import json
 import csv
 import zipfile
@@ -23,6 +25,10 @@ from email import encoders
 # 时区
 TZ = pytz.timezone(config.REPORT_TIMEZONE)
 
+# HTML 转纯文本备用正文（模块加载时编译一次）
+_RE_HTML_TAG = re.compile(r'<[^>]+>')
+_RE_WHITESPACE = re.compile(r'\s+')
+
 # 导出时间范围（东八区）
 START_TIME = TZ.localize(datetime(2025, 12, 11, 16, 0, 0))
 END_TIME = TZ.localize(datetime(2025, 12, 12, 16, 0, 0))
@@ -50,13 +56,13 @@ def export_raw_messages(messages):
     print(f"✓ 已生成: {output_path} ({len(messages)} 条消息)")
     return output_path
 
-def export_normalized_trades(messages):
+def export_normalized_trades(block_trades):
     """
     导出归一化交易数据为 JSONL 和 CSV 格式
-    """
-    # 筛选大宗交易消息（normalize_block_trades 需要 Message 对象）
-    block_trades = [msg for msg in messages if msg.is_block_trade]
 
+    Args:
+        block_trades: 大宗交易 Message 对象列表（normalize_block_trades 需要 Message 对象）
+    """
     # 归一化处理（不过滤，保留所有类型）
     normalized = normalize_block_trades(block_trades, filter_non_options=False)
 
@@ -81,13 +87,14 @@ def export_normalized_trades(messages):
 
     return jsonl_path, csv_path, len(normalized)
 
-def export_daily_snapshot(messages):
+def export_daily_snapshot(messages, block_trades):
     """
     导出日报聚合快照为 JSON 格式
-    """
-    # 筛选大宗交易消息
-    block_trades = [msg for msg in messages if msg.is_block_trade]
 
+    Args:
+        messages: 全部消息列表
+        block_trades: 大宗交易 Message 对象列表（与步骤 3 共用同一份）
+    """
     # 使用 build_daily_report_data 生成聚合数据
     report_data = build_daily_report_data(
         messages=messages,
@@ -140,12 +147,12 @@ def send_email_with_attachment(subject: str, html_body: str, attachment_path: st
         True: 发送成功
         False: 发送失败
     """
-    import time
-    import re
-
     if recipients is None:
         recipients = config.EMAIL_RECIPIENTS
 
+    # 纯文本备用正文与重试次数无关，只生成一次
+    text_body = _RE_WHITESPACE.sub(' ', _RE_HTML_TAG.sub('', html_body)).strip()
+
     for attempt in range(2):
         try:
             # 创建混合类型邮件（支持附件）
@@ -156,8 +163,6 @@ def send_email_with_attachment(subject: str, html_body: str, attachment_path: st
 
             # 添加HTML正文和纯文本备用
             msg_alternative = MIMEMultipart('alternative')
-            text_body = re.sub(r'<[^>]+>', '', html_body)
-            text_body = re.sub(r'\s+', ' ', text_body).strip()
             msg_alternative.attach(MIMEText(text_body, 'plain', 'utf-8'))
             msg_alternative.attach(MIMEText(html_body, 'html', 'utf-8'))
             msg.attach(msg_alternative)
@@ -302,14 +307,17 @@ def main():
     export_raw_messages(messages)
     print()
 
+    # 筛选大宗交易消息（步骤 3/4 共用；两步对同一批文本的解析由 parse_block_trade_message 的缓存命中）
+    block_trades = [msg for msg in messages if msg.is_block_trade]
+
     # 3. 导出归一化交易
     print("【步骤 3】导出归一化交易数据...")
-    jsonl_path, csv_path, trade_count = export_normalized_trades(messages)
+    jsonl_path, csv_path, trade_count = export_normalized_trades(block_trades)
     print()
 
     # 4. 导出日报快照
     print("【步骤 4】导出日报聚合快照...")
-    export_daily_snapshot(messages)
+    export_daily_snapshot(messages, block_trades)
     print()
 
     # 5. 打包 zip
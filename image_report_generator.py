@@ -321,11 +321,11 @@ class ImageReportGenerator:
 
         # 希腊字母
         y += 10
-        greeks_text = f"Delta: {trade['greeks']['delta'] or 'N/A'}  |  "
-        greeks_text += f"Gamma: {trade['greeks']['gamma'] or 'N/A'}  |  "
-        greeks_text += f"Vega: {trade['greeks']['vega'] or 'N/A'}  |  "
-        greeks_text += f"Theta: {trade['greeks']['theta'] or 'N/A'}  |  "
-        greeks_text += f"Rho: {trade['greeks']['rho'] or 'N/A'}"
+        greeks = trade['greeks']
+        greeks_text = "  |  ".join(
+            f"{key.capitalize()}: {greeks[key] or 'N/A'}"
+            for key in ('delta', 'gamma', 'vega', 'theta', 'rho')
+        )
 
         draw.text((x_text, y), greeks_text,
                  fill=self.hex_to_rgb(self.colors['text_light']),
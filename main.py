@@ -357,6 +357,8 @@ class TelegramReportBot:
             print(f"  总消息: {stats['total_messages']}")
             print(f"  大宗交易: {stats['block_trades']}")
             print(f"  警报发送: {stats['alerts_sent']}")
+            print(f"  警报失败: {stats['alerts_failed']}")
+            print(f"  背压丢弃: {stats['dropped']}")
 
         if self.scheduler:
             print(f"\n定时任务:")
@@ -460,6 +462,8 @@ def run_test_report():
 if __name__ == '__main__':
     import sys
 
+    config.setup_logging()
+
     if len(sys.argv) > 1:
         command = sys.argv[1]
 
@@ -3,11 +3,48 @@
 监听 Telegram 群组的新消息，保存到数据库并触发警报
 """
 
+import asyncio
+import functools
+import logging
+import re
+import smtplib
+import time
 from datetime import datetime
 from telethon import events
 import config
 from database import save_message, get_session
 
+log = logging.getLogger(__name__)
+
+# 大宗交易标签匹配（模块加载时编译一次；扩展多个标签时用 | 拼接即可）
+_BLOCK_TAG_SEARCH = re.compile(re.escape(config.BLOCK_TRADE_TAG)).search
+
+
+# 期权成交量阈值表（按资产查表；配置变更后调用 reload_thresholds 重建）
+_VOLUME_THRESHOLDS = {}
+
+# SMTP 退避截止时间（time.monotonic）：瞬时 SMTP 错误后所有预警共享同一退避窗口，避免持续触发服务器限流
+_smtp_backoff_until = 0.0
+
+# 永久性 SMTP 错误（重试不会成功）：不重试，也不推迟共享退避窗口
+_SMTP_PERMANENT_ERRORS = (
+    smtplib.SMTPAuthenticationError,
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPSenderRefused,
+)
+
+
+def reload_thresholds():
+    """根据当前 config 重建阈值表（测试模式下 ETH 使用降低的阈值）"""
+    global _VOLUME_THRESHOLDS
+    _VOLUME_THRESHOLDS = {
+        'BTC': config.BTC_VOLUME_THRESHOLD,  # 默认 200
+        'ETH': config.ETH_VOLUME_THRESHOLD_TEST if config.ALERT_TEST_MODE else config.ETH_VOLUME_THRESHOLD,  # 测试 1000 / 正式 5000
+    }
+
+
+reload_thresholds()
+
 
 class MessageListener:
     """消息监听器类"""
@@ -26,18 +63,74 @@ class MessageListener:
         self.total_messages = 0
         self.block_trades = 0
         self.alerts_sent = 0
+        self.alerts_failed = 0
         self.message_counter = 0
+        self.dropped = 0
         self.HEARTBEAT_INTERVAL = 50
 
+        # 按群组划分的入站消息队列（有界）：handler 只负责入队，每个群组一个 worker 串行处理
+        # 同一群组内保持消息顺序，不同群组之间并发处理，互不阻塞
+        # 队列满时丢弃最旧的消息，防止突发流量导致内存无限增长
+        self._chat_queues = {}
+        self._chat_workers = {}
+
+        # 预警发送队列：SMTP 发送与 Telegram 消息接收解耦，避免阻塞事件循环
+        self._alert_queue = asyncio.Queue()
+        self._alert_semaphore = asyncio.Semaphore(config.ALERT_SEND_CONCURRENCY)
+        self._alert_worker_task = None
+        # 发送中的预警任务（事件循环只弱引用任务，这里持有强引用防止被回收；完成后自动移除，close() 时一并取消）
+        self._alert_tasks = set()
+
+        # 预警开关快照（VOLUME_ALERT_ENABLED 且 EMAIL_ENABLED），关闭时直接跳过预警
+        self._alerts_enabled = False
+        self.reload_config()
+
+    def reload_config(self):
+        """刷新配置快照（修改 config 后调用）"""
+        self._alerts_enabled = config.VOLUME_ALERT_ENABLED and config.EMAIL_ENABLED
+        reload_thresholds()
+
     def setup(self):
         """设置事件监听器"""
         @self.client.on(events.NewMessage(chats=config.TARGET_CHAT_ID))
         async def handler(event):
-            await self.handle_new_message(event)
+            self._enqueue(event)
+
+        # 启动预警发送 worker（在事件循环中后台运行；消息处理 worker 按群组首次收到消息时创建）
+        self._alert_worker_task = asyncio.create_task(self._alert_worker())
 
         print(f"✓ 消息监听器已设置")
         print(f"  监听群组: {config.TARGET_CHAT_NAME} (ID: {config.TARGET_CHAT_ID})")
         print(f"  监听标签: {config.BLOCK_TRADE_TAG}")
+        print(f"  阈值预警: {'启用' if self._alerts_enabled else '关闭'} (VOLUME_ALERT_ENABLED={config.VOLUME_ALERT_ENABLED}, EMAIL_ENABLED={config.EMAIL_ENABLED})")
+        print(f"  成交量阈值: {_VOLUME_THRESHOLDS}{' (测试模式)' if config.ALERT_TEST_MODE else ''}")
+
+    def _enqueue(self, event):
+        """非阻塞入队到所属群组的队列（队列满时丢弃最旧的消息）"""
+        chat_id = event.chat_id
+        queue = self._chat_queues.get(chat_id)
+        if queue is None:
+            queue = asyncio.Queue(maxsize=config.LISTENER_QUEUE_MAXSIZE)
+            self._chat_queues[chat_id] = queue
+            self._chat_workers[chat_id] = asyncio.ensure_future(self._process_loop(queue))
+
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            dropped_event = queue.get_nowait()
+            queue.task_done()
+            queue.put_nowait(event)
+            self.dropped += 1
+            log.warning("[LISTENER] backpressure_drop chat_id=%s msg_id=%s dropped_total=%s queue_max=%s", chat_id, dropped_event.message.id, self.dropped, queue.maxsize)
+
+    async def _process_loop(self, queue):
+        """消息处理 worker：按到达顺序逐条处理单个群组的入站消息"""
+        while True:
+            event = await queue.get()
+            try:
+                await self.handle_new_message(event)
+            finally:
+                queue.task_done()
 
     async def handle_new_message(self, event):
         """
@@ -49,17 +142,20 @@ class MessageListener:
         try:
             self.message_counter += 1
             if self.message_counter % self.HEARTBEAT_INTERVAL == 0:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [LISTENER] heartbeat messages_seen={self.message_counter}")
+                log.info("[LISTENER] heartbeat messages_seen=%s", self.message_counter)
 
             message = event.message
 
             # 提取消息信息
             message_id = message.id
             message_date = message.date
-            message_text = message.text or ''
 
-            # 检查是否为大宗交易
-            is_block_trade = config.BLOCK_TRADE_TAG in message_text
+            # 检查是否为大宗交易：直接在原始文本（message.message）上匹配标签，
+            # 无需 Telethon 先按 entities 渲染出 markdown 文本
+            is_block_trade = _BLOCK_TAG_SEARCH(message.message or '') is not None
+
+            # 入库仍保存 markdown 文本（日报解析依赖 **Ref** 等格式标记）
+            message_text = message.text or ''
 
             # 保存到数据库 - 使用新会话，操作完成后立即关闭
             session = get_session()
@@ -78,46 +174,91 @@ class MessageListener:
                     # 如果是大宗交易，触发警报
                     if is_block_trade:
                         self.block_trades += 1
-                        await self.trigger_alert(result)
+                        await self.trigger_alert(message_id, message_date, message_text)
             finally:
                 # 确保会话被关闭，释放数据库锁
                 session.close()
 
         except Exception as e:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [LISTENER] error={e}")
+            log.error("[LISTENER] error=%s", e)
 
-    async def trigger_alert(self, message):
+    async def trigger_alert(self, message_id, date, text):
         """
-        触发大宗交易警报
+        触发大宗交易警报（只入队，不等待 SMTP 发送完成）
+
+        直接使用已提取的字段构造预警数据，不调用 Message.to_dict()：
+        提交后 ORM 对象属性已过期，to_dict() 会触发一次额外的 SELECT 刷新
 
         Args:
-            message: 消息对象（Message 模型实例）
+            message_id: Telegram 消息ID
+            date: 消息时间
+            text: 消息内容
         """
-        try:
-            # 准备消息数据
-            message_data = message.to_dict()
+        if not self._alerts_enabled:
+            return
 
-            # 调用警报发送函数
-            await send_alert_email(message_data)
+        try:
+            # 准备消息数据（预警只用到 message_id / date / text）
+            message_data = {
+                'message_id': message_id,
+                'date': date.isoformat() if date else None,
+                'text': text
+            }
 
-            self.alerts_sent += 1
+            # 入队，由 _alert_worker 异步发送
+            self._alert_queue.put_nowait(message_data)
 
         except Exception as e:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ALERT] trigger_failed error={e}")
+            log.error("[ALERT] trigger_failed error=%s", e)
+
+    async def _alert_worker(self):
+        """预警发送 worker：从队列取出预警，限制并发数发送"""
+        while True:
+            message_data = await self._alert_queue.get()
+            await self._alert_semaphore.acquire()
+            task = asyncio.create_task(self._send_alert(message_data))
+            self._alert_tasks.add(task)
+            task.add_done_callback(self._alert_tasks.discard)
+
+    async def _send_alert(self, message_data):
+        """发送单条预警（完成后释放并发名额）"""
+        try:
+            sent = await send_alert_email(message_data)
+            if sent:
+                self.alerts_sent += 1
+            elif sent is False:
+                self.alerts_failed += 1
+        except Exception as e:
+            log.error("[ALERT] trigger_failed error=%s", e)
+        finally:
+            self._alert_semaphore.release()
+            self._alert_queue.task_done()
 
     def get_stats(self):
         """获取监听统计信息"""
         return {
             'total_messages': self.total_messages,
             'block_trades': self.block_trades,
-            'alerts_sent': self.alerts_sent
+            'alerts_sent': self.alerts_sent,
+            'alerts_failed': self.alerts_failed,
+            'dropped': self.dropped
         }
 
     def close(self):
         """关闭监听器（不抛异常）"""
         # 由于不再维护持久会话，这里无需关闭会话
         # 每次消息处理已在 finally 块中关闭会话
-        pass
+        for worker in self._chat_workers.values():
+            worker.cancel()
+        self._chat_workers.clear()
+        self._chat_queues.clear()
+        if self._alert_worker_task is not None:
+            self._alert_worker_task.cancel()
+            self._alert_worker_task = None
+        # 取消发送中的预警（_send_alert 的 finally 会释放并发名额）
+        for task in list(self._alert_tasks):
+            task.cancel()
+        self._alert_tasks.clear()
 
 
 async def send_alert_email(message_data):
@@ -129,19 +270,32 @@ async def send_alert_email(message_data):
     2. 排除 FUTURES/PERPETUAL：永续/期货一律跳过
     3. 阈值：BTC options > 200，ETH options > 5000
 
+    仅瞬时 SMTP 错误按指数退避重试（最多 ALERT_SEND_MAX_RETRIES 次，email_sender 内部不再重试），
+    永久失败（邮件未启用/无收件人/认证失败等）直接放弃该预警
+
     Args:
         message_data: 消息数据字典
+
+    Returns:
+        True 发送成功；False 重试后仍失败；None 未达到预警条件（跳过）
     """
+    global _smtp_backoff_until
+
+    # 函数入口一次性读取配置到局部变量（避免多次模块属性查找）
+    volume_alert_enabled = config.VOLUME_ALERT_ENABLED
+    email_enabled = config.EMAIL_ENABLED
+    monitored_exchange = config.MONITORED_EXCHANGE
+
     try:
         msg_id = message_data.get('message_id', 'Unknown')
 
         # 提前返回检查
-        if not config.VOLUME_ALERT_ENABLED:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ALERT_SKIP] reason=volume_alert_disabled msg_id={msg_id}")
+        if not volume_alert_enabled:
+            log.info("[ALERT_SKIP] reason=volume_alert_disabled msg_id=%s", msg_id)
             return
 
-        if not config.EMAIL_ENABLED:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ALERT_SKIP] reason=email_disabled msg_id={msg_id}")
+        if not email_enabled:
+            log.info("[ALERT_SKIP] reason=email_disabled msg_id=%s", msg_id)
             return
 
         from email_sender import send_single_trade_alert_html
@@ -149,14 +303,12 @@ async def send_alert_email(message_data):
 
         raw_text = message_data.get('text', '')
 
-        # 解析交易信息
-        trade_info = parse_block_trade_message(raw_text)
+        # 解析交易信息（正则解析放到线程池执行，避免阻塞事件循环；解析结果由 report_generator 按原文缓存）
+        trade_info = await asyncio.get_running_loop().run_in_executor(None, parse_block_trade_message, raw_text)
 
         # 提取关键字段
         asset = trade_info.get('asset', 'Unknown')
         exchange = trade_info.get('exchange', 'Unknown')
-        instrument_type = trade_info.get('instrument_type', 'Unknown')
-        contract = trade_info.get('contract', 'Unknown')
 
         # ⚠️ 修正：提取 options legs 和 non-options legs（使用推导字段）
         options_legs = trade_info.get('options_legs', [])
@@ -166,26 +318,18 @@ async def send_alert_email(message_data):
 
         # ✅ 硬规则 1: Option Only - 必须有至少一条 OPTIONS 腿
         if not options_legs or options_count == 0:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ALERT_SKIP] reason=no_option_legs asset={asset} options_count={options_count} msg_id={msg_id}")
+            log.info("[ALERT_SKIP] reason=no_option_legs asset=%s options_count=%s msg_id=%s", asset, options_count, msg_id)
             return
 
         # 检查交易所（可选过滤）
-        if exchange != config.MONITORED_EXCHANGE:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ALERT_SKIP] reason=wrong_exchange exchange={exchange} msg_id={msg_id}")
+        if exchange != monitored_exchange:
+            log.info("[ALERT_SKIP] reason=wrong_exchange exchange=%s msg_id=%s", exchange, msg_id)
             return
 
-        # ✅ 硬规则 2: 区分 BTC/ETH 阈值（支持测试模式）
-        if asset == 'BTC':
-            threshold = config.BTC_VOLUME_THRESHOLD  # 默认 200
-        elif asset == 'ETH':
-            # 测试模式下使用降低的阈值
-            if config.ALERT_TEST_MODE:
-                threshold = config.ETH_VOLUME_THRESHOLD_TEST  # 测试模式: 1000
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ALERT] test_mode=enabled eth_threshold={threshold}")
-            else:
-                threshold = config.ETH_VOLUME_THRESHOLD  # 正式: 5000
-        else:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ALERT_SKIP] reason=unknown_asset asset={asset} msg_id={msg_id}")
+        # ✅ 硬规则 2: 按资产查阈值表（测试模式已在建表时处理）
+        threshold = _VOLUME_THRESHOLDS.get(asset)
+        if threshold is None:
+            log.info("[ALERT_SKIP] reason=unknown_asset asset=%s msg_id=%s", asset, msg_id)
             return
 
         # ⚠️ 修正：使用 options_sum（整笔订单期权腿总张数）+ 净权利金做阈值判断
@@ -209,16 +353,17 @@ async def send_alert_email(message_data):
         contracts_str = ', '.join(options_contracts) if options_contracts else 'Unknown'
 
         # 打印结构化日志（包含两种预警的条件）
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ALERT_PREP] msg_id={msg_id} asset={asset} exchange={exchange} options_legs={options_count} non_options_legs={len(non_options_legs)} options_sum={options_sum} premium_paid_usd={premium_paid_usd if premium_paid_usd is not None else 'N/A'} premium_received_usd={premium_received_usd if premium_received_usd is not None else 'N/A'} net_premium_usd={net_premium_usd if net_premium_usd is not None else 'N/A'} abs_net_premium_usd={abs_net_premium_usd if abs_net_premium_usd is not None else 'N/A'} thresholds:vol={threshold} prem={premium_threshold_usd} volume_trigger={volume_trigger} premium_trigger={premium_trigger}")
+        log.info("[ALERT_PREP] msg_id=%s asset=%s exchange=%s options_legs=%s non_options_legs=%s options_sum=%s premium_paid_usd=%s premium_received_usd=%s net_premium_usd=%s abs_net_premium_usd=%s thresholds:vol=%s prem=%s volume_trigger=%s premium_trigger=%s", msg_id, asset, exchange, options_count, len(non_options_legs), options_sum, premium_paid_usd if premium_paid_usd is not None else 'N/A', premium_received_usd if premium_received_usd is not None else 'N/A', net_premium_usd if net_premium_usd is not None else 'N/A', abs_net_premium_usd if abs_net_premium_usd is not None else 'N/A', threshold, premium_threshold_usd, volume_trigger, premium_trigger)
 
-        # 打印每条腿的详细信息（debug级别）
-        for i, leg in enumerate(options_legs, 1):
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ALERT_LEG] leg#{i} type=OPTIONS side={leg.get('side')} contract={leg.get('contract')} volume={leg.get('volume')} price_btc={leg.get('price_btc')} total_usd={leg.get('total_usd')} ref={leg.get('ref_spot_usd')}")
+        # 打印每条腿的详细信息（debug级别，INFO 及以上时整段跳过；腿字段由解析器统一初始化，可直接下标访问）
+        if log.isEnabledFor(logging.DEBUG):
+            for i, leg in enumerate(options_legs, 1):
+                log.debug("[ALERT_LEG] leg#%d type=OPTIONS side=%s contract=%s volume=%s price_btc=%s total_usd=%s ref=%s", i, leg['side'], leg['contract'], leg['volume'], leg['price_btc'], leg['total_usd'], leg['ref_spot_usd'])
 
         if ref_price_usd is not None:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ALERT] ref_extracted=true ref_price_usd={ref_price_usd} spot_price={spot_price_derived} contracts={contracts_str} msg_id={msg_id}")
+            log.info("[ALERT] ref_extracted=true ref_price_usd=%s spot_price=%s contracts=%s msg_id=%s", ref_price_usd, spot_price_derived, contracts_str, msg_id)
         else:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ALERT] ref_extracted=false reason=no_ref_in_text contracts={contracts_str} msg_id={msg_id}")
+            log.info("[ALERT] ref_extracted=false reason=no_ref_in_text contracts=%s msg_id=%s", contracts_str, msg_id)
 
         # ============================================
         # STEP 2：预警入口判断（合并邮件）
@@ -231,7 +376,7 @@ async def send_alert_email(message_data):
 
         if not should_send_alert:
             # 两种预警都未触发
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ALERT_SKIP] reason=both_below_threshold asset={asset} options_sum={options_sum} volume_threshold={threshold} abs_net_premium_usd={abs_net_premium_usd if abs_net_premium_usd is not None else 'N/A'} premium_threshold={premium_threshold_usd} msg_id={msg_id}")
+            log.info("[ALERT_SKIP] reason=both_below_threshold asset=%s options_sum=%s volume_threshold=%s abs_net_premium_usd=%s premium_threshold=%s msg_id=%s", asset, options_sum, threshold, abs_net_premium_usd if abs_net_premium_usd is not None else 'N/A', premium_threshold_usd, msg_id)
             return
 
         # 确定预警原因（reasons）
@@ -244,35 +389,63 @@ async def send_alert_email(message_data):
 
         # 打印触发日志
         if volume_trigger and premium_trigger:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ALERT_MULTI] asset={asset} msg_id={msg_id} reasons={reasons_str}")
+            log.info("[ALERT_MULTI] asset=%s msg_id=%s reasons=%s", asset, msg_id, reasons_str)
 
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ALERT_SEND] msg_id={msg_id} reasons={reasons_str} asset={asset} options_sum={options_sum} abs_net_premium_usd={abs_net_premium_usd if abs_net_premium_usd is not None else 'N/A'} contracts={contracts_str}")
+        log.info("[ALERT_SEND] msg_id=%s reasons=%s asset=%s options_sum=%s abs_net_premium_usd=%s contracts=%s", msg_id, reasons_str, asset, options_sum, abs_net_premium_usd if abs_net_premium_usd is not None else 'N/A', contracts_str)
 
-        # 发送合并预警邮件
-        from email_sender import send_single_trade_alert_html
-
-        success = send_single_trade_alert_html(
+        # 发送合并预警邮件（SMTP 为阻塞调用，放到线程池执行，避免阻塞事件循环）
+        # retry=False：email_sender 内部只连接/发送一次，重试和退避只在这一层做（不与 SMTP 层的重试叠加，也不在线程池里 sleep）
+        send = functools.partial(
+            send_single_trade_alert_html,
             trade_info=trade_info,
             message_data=message_data,
             threshold=threshold,
             alert_reasons=reasons,  # 传递预警原因列表
-            lang='zh'
+            lang='zh',
+            retry=False
         )
 
-        if not success:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ALERT] alert_failed msg_id={msg_id} reasons={reasons_str} error=email_send_failed")
+        loop = asyncio.get_running_loop()
+        max_retries = config.ALERT_SEND_MAX_RETRIES
+        for attempt in range(1, max_retries + 1):
+            # 处于退避窗口内时先等待，再发起 SMTP 连接
+            wait_s = _smtp_backoff_until - time.monotonic()
+            if wait_s > 0:
+                await asyncio.sleep(wait_s)
+
+            try:
+                success = await loop.run_in_executor(None, send)
+            except _SMTP_PERMANENT_ERRORS as e:
+                # 认证失败/收发件人被拒：重试无意义，也不拖慢其他预警
+                log.error("[ALERT] alert_failed msg_id=%s reasons=%s attempt=%s/%s error=%s: %s", msg_id, reasons_str, attempt, max_retries, type(e).__name__, e)
+                return False
+            except (smtplib.SMTPException, OSError) as e:
+                # 瞬时 SMTP 错误（连接失败/超时/服务器临时拒绝）：最后一次失败后不再退避
+                if attempt == max_retries:
+                    log.error("[ALERT] alert_failed msg_id=%s reasons=%s attempts=%s error=%s: %s", msg_id, reasons_str, max_retries, type(e).__name__, e)
+                    return False
+                backoff_s = min(config.ALERT_RETRY_MAX_BACKOFF, 2 ** attempt)
+                _smtp_backoff_until = max(_smtp_backoff_until, time.monotonic() + backoff_s)
+                log.warning("[ALERT] send_retry msg_id=%s attempt=%s/%s backoff_s=%s error=%s", msg_id, attempt, max_retries, backoff_s, type(e).__name__)
+                continue
+
+            if not success:
+                # 返回 False 为永久失败（邮件未启用/无收件人/标题不合法），不重试、不触发共享退避
+                log.error("[ALERT] alert_failed msg_id=%s reasons=%s attempt=%s/%s error=email_send_blocked", msg_id, reasons_str, attempt, max_retries)
+            return success
+        return False
 
     except Exception as e:
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ALERT] alert_failed error={e}")
+        log.error("[ALERT] alert_failed error=%s", e)
+        return False
 
 
 if __name__ == '__main__':
     """测试模块"""
+    config.setup_logging()
     print("此模块应通过 main.py 运行")
     print("测试警报函数...")
 
-    import asyncio
-
     # 测试警报发送
     test_message = {
         'id': 1,
@@ -3,15 +3,233 @@
 从数据库提取过去 24 小时的数据并生成结构化的 HTML 邮件
 """
 
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from html import escape as html_escape
+import asyncio
+import functools
+import hashlib
+import re
 import pytz
+import heapq
+from operator import attrgetter
 import json
+import os
 import sqlite3
 import time
 import config
-from database import get_session, get_messages_by_date_range, get_block_trades_by_date_range, DailyReport
+import database
+from database import get_session, get_messages_by_date_range, DailyReport
+from sqlalchemy import desc, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from filelock import FileLock, Timeout
 
+try:
+    import orjson
+except ImportError:  # 可选依赖：未安装时回退到标准库 json
+    orjson = None
+
+
+# 报表时区（模块加载时解析一次，各函数共用）
+_REPORT_TZ = pytz.timezone(config.REPORT_TIMEZONE)
+
+
+# _ts() 按秒缓存格式化结果：[整数秒, 格式化字符串]
+_ts_cache = [None, '']
+
+
+def _ts():
+    """日志时间戳前缀（本地时间 YYYY-MM-DD HH:MM:SS，同一秒内复用已格式化的字符串，不再每次构造 datetime）"""
+    sec = int(time.time())
+    if sec != _ts_cache[0]:
+        _ts_cache[1] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(sec))
+        _ts_cache[0] = sec
+    return _ts_cache[1]
+
+
+# json 回退路径使用紧凑分隔符，与 orjson 输出格式一致（库里的 report_data 更小，两种路径的哈希也一致）
+_JSON_COMPACT_SEPARATORS = (',', ':')
+
+
+def _dumps_report_data(report_data):
+    """序列化 report_data 写入 DB（优先 orjson，未安装时使用 json）"""
+    if orjson is not None:
+        return orjson.dumps(report_data, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(report_data, ensure_ascii=False, separators=_JSON_COMPACT_SEPARATORS)
+
+
+def _loads_report_data(report_data_json):
+    """反序列化 DB 中的 report_data（优先 orjson，未安装时使用 json）"""
+    if orjson is not None:
+        return orjson.loads(report_data_json)
+    return json.loads(report_data_json)
+
+
+# 渲染逻辑版本号：修改 render_report_html / build_daily_report_html / build_trade_card_html 等渲染代码
+# （而不只是模板常量）后必须递增，否则数据未变化的日期会命中 skip_unchanged，库里和邮件里仍是旧 HTML
+_REPORT_RENDER_VERSION = 1
+
+
+def _render_fingerprint():
+    """渲染指纹：渲染版本号 + 当前模板版本（config.REPORT_TEMPLATE_VERSION）+ 模板常量内容摘要"""
+    template_digest = hashlib.sha256('\0'.join((
+        _REPORT_SKELETON, _REPORT_CSS, _TRADE_CARD_TMPL, _GREEKS_TMPL, _REPORT_V2_CSS,
+    )).encode('utf-8')).hexdigest()
+    return f"{_REPORT_RENDER_VERSION}:{getattr(config, 'REPORT_TEMPLATE_VERSION', 'v1')}:{template_digest}"
+
+
+def _report_content_hash(report_data):
+    """
+    日报内容哈希（SHA-256，键排序后的规范 JSON + 渲染指纹）
+
+    库里存的和邮件发出的是渲染后的 html_content，所以哈希同时覆盖 report_data 和渲染指纹：
+    模板/渲染代码变化后，数据未变化的日期也会重新渲染并写库
+
+    ⚠️ 排除 meta.generated_at：每次生成都会变化，不代表数据变化
+    """
+    meta = {k: v for k, v in report_data.get('meta', {}).items() if k != 'generated_at'}
+    canonical = {**report_data, 'meta': meta, '_render': _render_fingerprint()}
+    if orjson is not None:
+        payload = orjson.dumps(canonical, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    else:
+        payload = json.dumps(canonical, ensure_ascii=False, sort_keys=True, separators=_JSON_COMPACT_SEPARATORS).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+# ============================================
+# 预编译正则（parse_block_trade_message / extract_spot_prices 共用，模块加载时编译一次）
+# 字段标签用 [Rr][Ee][Ff] 这类字符类代替 IGNORECASE（大小写不敏感匹配更慢）
+# ============================================
+# 现货播报：BTC 价格
+_RE_SPOT_BTC = re.compile(r'BTC[^\d$]*\$?\s*([0-9,]+\.?[0-9]*)', re.IGNORECASE)
+# 现货播报：ETH 价格
+_RE_SPOT_ETH = re.compile(r'ETH[^\d$]*\$?\s*([0-9,]+\.?[0-9]*)', re.IGNORECASE)
+# Ref 现货参考价（Ref: $123 / **Ref**: $123 / Ref：$123）
+_RE_REF_PRICE = re.compile(r'[Rr][Ee][Ff][\*:\s：]{1,5}\$([0-9,.]+)')
+# 资产关键字（不区分大小写，替代 text.upper() 后做子串判断，避免整条消息复制一份大写副本；字符类写法同上）
+_RE_BTC_ANYCASE = re.compile(r'[Bb][Tt][Cc]')
+_RE_ETH_ANYCASE = re.compile(r'[Ee][Tt][Hh]')
+# 期权类型关键字
+_RE_PUT_CALL = re.compile(r'(PUT|CALL)', re.IGNORECASE)
+# 期权合约名（BTC-28NOV25-105000-P）
+_RE_OPTION_CONTRACT = re.compile(r'(BTC|ETH)-\d{1,2}[A-Z]{3}\d{2,4}-\d+-[PC]')
+# 策略格式1：**LONG BTC PUT (...)**
+_RE_STRATEGY_1 = re.compile(r'\*\*(LONG|SHORT)\s+(BTC|ETH)\s+([\w\s]+?)\s*\(', re.IGNORECASE)
+# 策略格式2：**LONG BTC PUT**
+_RE_STRATEGY_2 = re.compile(r'\*\*(LONG|SHORT)\s+(BTC|ETH)\s+(PUT|CALL|[\w\s]+)\*\*', re.IGNORECASE)
+# 策略格式3：**BTC FUTURES SPREAD:**
+_RE_STRATEGY_3 = re.compile(r'\*\*(BTC|ETH)\s+(FUTURES|OPTIONS)?\s*(SPREAD|[\w\s]+?)[:：]\*\*', re.IGNORECASE)
+# 交易所名称及其大写形式（按优先级排列）
+_EXCHANGES = tuple((name, name.upper()) for name in ('Deribit', 'OKX', 'Binance', 'Bybit'))
+_RE_BOUGHT = re.compile(r'\bBought\b', re.IGNORECASE)
+_RE_SOLD = re.compile(r'\bSold\b', re.IGNORECASE)
+# 合约数量（50.0x）
+_RE_VOLUME = re.compile(r'(\d+\.?\d*)\s*x')
+# Total Bought/Sold 美元金额
+_RE_TOTAL_AMOUNT = re.compile(r'Total (?:Bought|Sold):[^$]*\$([0-9,.]+[KMB]?)')
+# 合约信息（分组）
+_RE_CONTRACT = re.compile(r'(BTC|ETH)-(\d{1,2}[A-Z]{3}\d{2,4})-(\d+)-([PC])')
+_RE_IV = re.compile(r'\*\*IV\*\*:\s*([\d.]+)%')
+_RE_ASK = re.compile(r'[Aa][Ss][Kk][:\s]+([0-9,.]+)\s*₿')
+_RE_MARK = re.compile(r'[Mm][Aa][Rr][Kk][:\s]+([0-9,.]+)\s*₿')
+_RE_PREMIUM = re.compile(r'[Pp][Rr][Ee][Mm][Ii][Uu][Mm][:\s]+([0-9,.]+)\s*(?:₿|\$|[Bb][Tt][Cc]|[Uu][Ss][Dd])')
+# 希腊字母（符号版本 Δ Γ ν Θ ρ 和英文版本），合并成一个正则 finditer 扫描一遍全文，每个字段取第一次出现的值
+# 大小写用字符类显式展开（含希腊字母的大小写/变体形式及 K 的开尔文符号），与原 IGNORECASE 匹配集合一致；
+# 首字符合并成一个字符类（符号或单词首字母），再用后顾断言区分写法：正则引擎可按首字符类快速跳过
+# 不可能匹配的位置。各希腊字母首字符互不相同，按匹配的首字符即可确定字段名；
+# 匹配区间内（名称、分隔符、数值）不会出现另一个希腊字母的起点，结果与逐个 search 一致
+_GREEK_VALUE = r'[:\s,]+([-+]?[\d,.]+[KMBkmb\u212a]?)'
+_RE_GREEKS = re.compile(
+    r'[ΔδDdΓγGgνΝVvΘθϑϴTtρΡϱRr]'
+    r'(?:(?<=[Dd])[Ee][Ll][Tt][Aa]'
+    r'|(?<=[Gg])[Aa][Mm][Mm][Aa]'
+    r'|(?<=[Vv])[Ee][Gg][Aa]'
+    r'|(?<=[Tt])[Hh][Ee][Tt][Aa]'
+    r'|(?<=[Rr])[Hh][Oo]'
+    r'|(?<=[ΔδΓγνΝΘθϑϴρΡϱ]))'
+    + _GREEK_VALUE
+)
+# 匹配首字符 -> 字段名
+_GREEK_BY_INITIAL = {
+    initial: greek_name
+    for greek_name, initials in (
+        ('delta', 'ΔδDd'),
+        ('gamma', 'ΓγGg'),
+        ('vega', 'νΝVv'),
+        ('theta', 'ΘθϑϴTt'),
+        ('rho', 'ρΡϱRr'),
+    )
+    for initial in initials
+}
+# 单价：at X ₿ ($Y) / at X Ξ ($Y)
+_RE_PRICE_BTC = re.compile(r'at\s+([\d,.]+)\s*₿\s*\(\$([0-9,.]+[KMB]?)\)')
+_RE_PRICE_ETH = re.compile(r'at\s+([\d,.]+)\s*Ξ\s*\(\$([0-9,.]+[KMB]?)\)')
+# 总额：Total Bought/Sold: X ₿ ($Y) / X Ξ ($Y)
+_RE_TOTAL_BTC = re.compile(r'Total (?:Bought|Sold):\s*([\d,.]+)\s*₿\s*\(\$([0-9,.]+[KMB]?)\)')
+_RE_TOTAL_ETH = re.compile(r'Total (?:Bought|Sold):\s*([\d,.]+)\s*Ξ\s*\(\$([0-9,.]+[KMB]?)\)')
+# 单价/总额按币种符号成组：(符号, 单价正则, 总额正则)，BTC 在前
+_PRICE_PATTERNS = (
+    ('₿', _RE_PRICE_BTC, _RE_TOTAL_BTC),
+    ('Ξ', _RE_PRICE_ETH, _RE_TOTAL_ETH),
+)
+# 策略标题（首个 **...**）
+_RE_TITLE = re.compile(r'\*\*(.*?)\*\*')
+# 逐行腿解析：🟢 Bought 225.0x 🔶 BTC-27FEB26-80000-P 📉 at 0.0427 ₿ ($3,716.30) ...
+_RE_LEG = re.compile(r'(Bought|Sold)\s+([\d.]+)x\s+.*?((BTC|ETH)-[\dA-Z-]+)', re.IGNORECASE)
+_RE_OPTION_SUFFIX = re.compile(r'-\d+-[PC]$')
+_RE_LEG_PRICE = re.compile(r'at\s+([\d.]+)\s*₿\s*\(\$([0-9,.]+)\)')
+_RE_LEG_TOTAL = re.compile(r'Total\s+(?:Bought|Sold):\s+([\d.]+)\s*₿\s*\(\$([0-9,.KMB]+)\)')
+_RE_LEG_IV = re.compile(r'\*\*IV\*\*:\s*([\d.]+)%|IV:\s*([\d.]+)%')
+_RE_LEG_REF = re.compile(r'\*\*Ref\*\*:\s*\$([0-9,.]+)|Ref:\s*\$([0-9,.]+)')
+# 报价行：bid: 0.042 (size: 78.0), mark: 0.0425, ask: 0.043 (size: 20.0)
+_RE_QUOTE_LINE = re.compile(r'bid.*mark.*ask', re.IGNORECASE)
+_RE_QUOTE_BID = re.compile(r'bid:\s*([\d.]+)(?:\s*\(size:\s*([\d.]+)\))?', re.IGNORECASE)
+_RE_QUOTE_MARK = re.compile(r'mark:\s*([\d.]+)', re.IGNORECASE)
+_RE_QUOTE_ASK = re.compile(r'ask:\s*([\d.]+)(?:\s*\(size:\s*([\d.]+)\))?', re.IGNORECASE)
+
+# 数值后缀倍数（$181.24K / 1.5M / 2B）
+_SUFFIX_MULTIPLIERS = {'K': 1000, 'M': 1000000, 'B': 1000000000}
+
+
+def _parse_suffixed_number(num_str):
+    """
+    解析带 K/M/B 后缀的数字（如 '1,234.5K' → 1234500.0）
+
+    Raises:
+        ValueError: 数字格式无法解析
+    """
+    # 入参只可能含千分位逗号（正则已排除 $、₿、空白），单次 replace 即可；
+    # str.translate 删除字符表对这类短串要慢 20 倍以上（逐字符查表），不适用
+    num_str = num_str.replace(',', '')
+    multiplier = _SUFFIX_MULTIPLIERS.get(num_str[-1:])
+    if multiplier is None:
+        return float(num_str)
+    return float(num_str[:-1]) * multiplier
+
+
+def _parse_plain_number(num_str):
+    """
+    解析只含 [0-9,.] 的数字串（去千分位逗号），格式不合法时返回 None
+
+    先做字符串校验再 float()，畸形输入（如正则只捕获到 ','）不走异常路径
+    """
+    num_str = num_str.replace(',', '')
+    if num_str.count('.') > 1 or not num_str.strip('.'):
+        return None
+    return float(num_str)
+
+
+def _parse_amount(amt_str, default=0.0):
+    """
+    解析美元金额（支持 K/M/B 后缀），无法解析时返回 default
+
+    入参都是正则在 $ 符号之后捕获的 [0-9,.KMB] 串，不含 $ 和空白，直接交给 _parse_suffixed_number
+    """
+    try:
+        return _parse_suffixed_number(amt_str)
+    except ValueError:
+        return default
+
 
 def normalize_block_trades(block_trades, filter_non_options=False):
     """
@@ -26,98 +244,244 @@ def normalize_block_trades(block_trades, filter_non_options=False):
     Returns:
         list[dict]: normalized trades
     """
-    normalized = []
+    return list(_iter_normalized_trades(block_trades, filter_non_options))
+
+
+def normalize_block_trades_bucketed(block_trades, filter_non_options=True):
+    """
+    标准化交易并按资产分桶（单次遍历，调用方无需再按 asset 重新筛选）
+
+    Args:
+        block_trades: DB 模型列表
+        filter_non_options: 是否过滤掉 FUTURES/PERPETUAL，只保留 OPTIONS
+
+    Returns:
+        dict[str, list[dict]]: {'BTC': [...], 'ETH': [...], 'Other': [...]}，桶内保持原始顺序
+    """
+    buckets = {'BTC': [], 'ETH': [], 'Other': []}
+    other = buckets['Other']
+    for item in _iter_normalized_trades(block_trades, filter_non_options):
+        buckets.get(item['asset'], other).append(item)
+    return buckets
+
+
+def _iter_normalized_trades(block_trades, filter_non_options=False):
+    """
+    逐条标准化交易（生成器，见 normalize_block_trades）
+
+    Args:
+        block_trades: DB 模型列表
+        filter_non_options: 是否过滤掉 FUTURES/PERPETUAL
+
+    Yields:
+        dict: normalized trade
+    """
     for trade in block_trades:
         try:
-            parsed = parse_block_trade_message(trade.text or '')
+            # 只读使用解析结果（_build_normalized_trade 只取字段不修改），直接取缓存对象，省去每条一次顶层拷贝
+            parsed = _parse_block_trade_message_cached(trade.text or '')
 
-            # ✅ 过滤逻辑：如果 filter_non_options=True，跳过 FUTURES/PERPETUAL
-            if filter_non_options:
-                instrument_type = parsed.get('instrument_type', 'Unknown')
-                if instrument_type in ['FUTURES', 'PERPETUAL']:
-                    continue
+            # ✅ 过滤逻辑：如果 filter_non_options=True，跳过 FUTURES/PERPETUAL（不构建 dict）
+            if filter_non_options and parsed.get('instrument_type', 'Unknown') in _NON_OPTION_TYPES:
+                continue
+
+            item = _build_normalized_trade(trade, parsed)
+        except Exception:
+            # 解析失败，添加默认值
+            item = _fallback_normalized_trade(trade)
+
+        yield item
+
+
+# 非期权工具类型（日报 volume 统计和 TopN 排名时过滤）
+_NON_OPTION_TYPES = ('FUTURES', 'PERPETUAL')
 
-            # 安全获取 date
-            ts = None
-            date_str = 'Unknown'
+
+def _normalized_volume_amount(parsed):
+    """
+    计算展示口径的 volume 和 amount_usd
+
+    ⚠️ 修正：对于多腿策略，重新计算 volume 和 amount_usd（从 options_legs 推导）
+    """
+    options_legs = parsed.get('options_legs', [])
+
+    if len(options_legs) >= 1:
+        # 有期权腿：使用 options_sum 作为 volume（所有期权腿张数总和）
+        volume_display = parsed.get('options_sum', 0)
+
+        # 计算 amount_usd：所有期权腿的 total_usd 总和
+        amount_usd_display = sum(
+            leg.get('total_usd', 0) for leg in options_legs if leg.get('total_usd')
+        )
+
+        # 如果 amount_usd 为0，回退到全局解析值
+        if amount_usd_display == 0:
+            amount_usd_display = parsed.get('amount_usd', 0.0)
+    else:
+        # 无期权腿：使用全局解析值
+        volume_display = parsed.get('volume', 0.0)
+        amount_usd_display = parsed.get('amount_usd', 0.0)
+
+    return volume_display, amount_usd_display
+
+
+def _build_normalized_trade(trade, parsed):
+    """由 DB 记录和解析结果构建标准化交易 dict"""
+    # 安全获取 date
+    ts = None
+    date_str = 'Unknown'
+    try:
+        if hasattr(trade, 'date') and trade.date:
+            ts = trade.date.isoformat()
+            date_str = trade.date.strftime('%Y-%m-%d %H:%M:%S')
+    except Exception:
+        pass
+
+    options_legs = parsed.get('options_legs', [])
+    volume_display, amount_usd_display = _normalized_volume_amount(parsed)
+
+    return {
+        'asset': parsed.get('asset', 'Unknown'),
+        'volume': volume_display,  # ⚠️ 修正：多腿时为 options_sum
+        'exchange': parsed.get('exchange', 'Unknown'),
+        'amount_usd': amount_usd_display,  # ⚠️ 修正：多腿时为各腿总和
+        'ts': ts,
+        'date': date_str,  # 兼容 legacy template
+        'raw_text': trade.text or '',
+        'strategy': parsed.get('strategy', 'Unknown'),
+        'strategy_title': parsed.get('strategy_title', 'Unknown'),  # ⚠️ 新增
+        'contract': parsed.get('contract', 'Unknown'),
+        'price': parsed.get('price', 'Unknown'),
+        'iv': parsed.get('iv', 'Unknown'),
+        'ask': parsed.get('ask', 'Unknown'),
+        'mark': parsed.get('mark', 'Unknown'),
+        'premium': parsed.get('premium', 'Unknown'),
+        'instrument_type': parsed.get('instrument_type', 'Unknown'),
+        'greeks': parsed.get('greeks', {}),
+        'options_legs': options_legs,  # ⚠️ 新增
+        'non_options_legs': parsed.get('non_options_legs', []),  # ⚠️ 新增
+        'msg_id': getattr(trade, 'message_id', 'Unknown'),  # 添加 message_id
+        'side': parsed.get('side', 'Unknown'),  # 添加 side
+        'spot_price': parsed.get('spot_price', 'N/A'),  # 添加 spot_price
+        # ⚠️ 新增：添加推导字段用于调试和验证
+        'options_sum': parsed.get('options_sum', 0),  # 期权腿总张数（推导字段）
+        'options_count': len(options_legs),  # 期权腿数量
+    }
+
+
+def _fallback_normalized_trade(trade):
+    """解析失败时的默认标准化交易 dict"""
+    return {
+        'asset': 'Unknown',
+        'volume': 0.0,
+        'exchange': 'Unknown',
+        'amount_usd': 0.0,
+        'ts': None,
+        'date': 'Unknown',  # 兼容 legacy template
+        'raw_text': getattr(trade, 'text', ''),
+        'strategy': 'Unknown',
+        'contract': 'Unknown',
+        'price': 'Unknown',
+        'iv': 'Unknown',
+        'ask': 'Unknown',
+        'mark': 'Unknown',
+        'premium': 'Unknown',
+        'instrument_type': 'Unknown',
+        'greeks': {},
+        'msg_id': getattr(trade, 'message_id', 'Unknown'),
+        'side': 'Unknown',
+        'spot_price': 'N/A'
+    }
+
+
+@dataclass(slots=True)
+class _OptionTradeRecord:
+    """
+    日报聚合用的轻量期权交易记录（slots，只保留计数/排序字段）
+
+    完整的标准化 dict 只在入选 TopN 后通过 to_dict() 构建一次（同一记录多次调用返回同一个 dict）
+    """
+    asset: str
+    volume: float
+    amount_usd: float
+    exchange: str
+    trade: object
+    parsed: dict = None
+    item: dict = None
+
+    def to_dict(self):
+        if self.item is None:
             try:
-                if hasattr(trade, 'date') and trade.date:
-                    ts = trade.date.isoformat()
-                    date_str = trade.date.strftime('%Y-%m-%d %H:%M:%S')
+                self.item = _build_normalized_trade(self.trade, self.parsed)
             except Exception:
-                pass
+                self.item = _fallback_normalized_trade(self.trade)
+        return self.item
 
-            # ⚠️ 修正：对于多腿策略，重新计算 volume 和 amount_usd（从 options_legs 推导）
-            options_legs = parsed.get('options_legs', [])
 
-            if len(options_legs) >= 1:
-                # 有期权腿：使用 options_sum 作为 volume（所有期权腿张数总和）
-                volume_display = parsed.get('options_sum', 0)
+@functools.lru_cache(maxsize=config.PARSE_CACHE_SIZE)
+def _option_trade_fields(text):
+    """
+    按消息原文缓存聚合所需的精简字段：(asset, volume, amount_usd, exchange, parsed)
 
-                # 计算 amount_usd：所有期权腿的 total_usd 总和
-                amount_usd_display = sum(
-                    leg.get('total_usd', 0) for leg in options_legs if leg.get('total_usd')
-                )
+    FUTURES/PERPETUAL 返回 None；重复构建日报（内容哈希比对、回补、验收）时不再逐条遍历期权腿求和
+    """
+    parsed = _parse_block_trade_message_cached(text)
+    if parsed.get('instrument_type', 'Unknown') in _NON_OPTION_TYPES:
+        return None
+    volume, amount_usd = _normalized_volume_amount(parsed)
+    return parsed.get('asset', 'Unknown'), volume, amount_usd, parsed.get('exchange', 'Unknown'), parsed
 
-                # 如果 amount_usd 为0，回退到全局解析值
-                if amount_usd_display == 0:
-                    amount_usd_display = parsed.get('amount_usd', 0.0)
-            else:
-                # 无期权腿：使用全局解析值
-                volume_display = parsed.get('volume', 0.0)
-                amount_usd_display = parsed.get('amount_usd', 0.0)
-
-            normalized.append({
-                'asset': parsed.get('asset', 'Unknown'),
-                'volume': volume_display,  # ⚠️ 修正：多腿时为 options_sum
-                'exchange': parsed.get('exchange', 'Unknown'),
-                'amount_usd': amount_usd_display,  # ⚠️ 修正：多腿时为各腿总和
-                'ts': ts,
-                'date': date_str,  # 兼容 legacy template
-                'raw_text': trade.text or '',
-                'strategy': parsed.get('strategy', 'Unknown'),
-                'strategy_title': parsed.get('strategy_title', 'Unknown'),  # ⚠️ 新增
-                'contract': parsed.get('contract', 'Unknown'),
-                'price': parsed.get('price', 'Unknown'),
-                'iv': parsed.get('iv', 'Unknown'),
-                'ask': parsed.get('ask', 'Unknown'),
-                'mark': parsed.get('mark', 'Unknown'),
-                'premium': parsed.get('premium', 'Unknown'),
-                'instrument_type': parsed.get('instrument_type', 'Unknown'),
-                'greeks': parsed.get('greeks', {}),
-                'options_legs': options_legs,  # ⚠️ 新增
-                'non_options_legs': parsed.get('non_options_legs', []),  # ⚠️ 新增
-                'msg_id': getattr(trade, 'message_id', 'Unknown'),  # 添加 message_id
-                'side': parsed.get('side', 'Unknown'),  # 添加 side
-                'spot_price': parsed.get('spot_price', 'N/A'),  # 添加 spot_price
-                # ⚠️ 新增：添加推导字段用于调试和验证
-                'options_sum': parsed.get('options_sum', 0),  # 期权腿总张数（推导字段）
-                'options_count': len(options_legs),  # 期权腿数量
-            })
-        except Exception as e:
-            # 解析失败，添加默认值
-            normalized.append({
-                'asset': 'Unknown',
-                'volume': 0.0,
-                'exchange': 'Unknown',
-                'amount_usd': 0.0,
-                'ts': None,
-                'date': 'Unknown',  # 兼容 legacy template
-                'raw_text': getattr(trade, 'text', ''),
-                'strategy': 'Unknown',
-                'contract': 'Unknown',
-                'price': 'Unknown',
-                'iv': 'Unknown',
-                'ask': 'Unknown',
-                'mark': 'Unknown',
-                'premium': 'Unknown',
-                'instrument_type': 'Unknown',
-                'greeks': {},
-                'msg_id': getattr(trade, 'message_id', 'Unknown'),
-                'side': 'Unknown',
-                'spot_price': 'N/A'
-            })
-    return normalized
+
+def _iter_option_trade_records(block_trades, stats):
+    """
+    逐条解析并过滤出期权交易记录（生成器，口径与 normalize_block_trades(filter_non_options=True) 一致）
+
+    Args:
+        block_trades: DB 模型列表
+        stats: dict，stats['total'] 累加输入交易总数（含被过滤的）
+
+    Yields:
+        _OptionTradeRecord
+    """
+    for trade in block_trades:
+        stats['total'] += 1
+        try:
+            # 只读使用缓存的解析结果（_build_normalized_trade 只取字段不修改）
+            fields = _option_trade_fields(trade.text or '')
+            if fields is None:
+                continue
+            asset, volume, amount_usd, exchange, parsed = fields
+            record = _OptionTradeRecord(asset, volume, amount_usd, exchange, trade, parsed)
+        except Exception:
+            # 解析失败，使用默认值（立即构建 dict）
+            item = _fallback_normalized_trade(trade)
+            record = _OptionTradeRecord(item['asset'], item['volume'], item['amount_usd'], item['exchange'], trade, item=item)
+
+        yield record
+
+
+def _push_top_k(heap, k, key, seq, item):
+    """
+    维护大小为 k 的最小堆，保留 key 最大的 k 条
+
+    堆元素为 (key, -seq, item)：key 相同时先出现的记录优先保留，
+    与 sorted(..., reverse=True)[:k] 的稳定排序结果一致；seq 唯一，不会比较到 item
+    """
+    if len(heap) < k:
+        heapq.heappush(heap, (key, -seq, item))
+    elif k > 0 and key > heap[0][0]:
+        # seq 递增，key 相等时新记录的 -seq 更小、不会胜出，只比较 key 即可（多数记录在此直接淘汰，不构建元组）
+        heapq.heapreplace(heap, (key, -seq, item))
+
+
+def _top_k_ranked(heap):
+    """堆内记录按 key 降序输出为 dict，构建时直接写入 rank（从 1 开始）"""
+    ranked = []
+    for rank, entry in enumerate(sorted(heap, reverse=True), 1):
+        trade = entry[2].to_dict()
+        trade['rank'] = rank
+        ranked.append(trade)
+    return ranked
 
 
 def build_daily_report_data(messages, block_trades, start_date, end_date, top_limit=3):
@@ -141,33 +505,62 @@ def build_daily_report_data(messages, block_trades, start_date, end_date, top_li
     # 提取现货价格（传递时间范围）
     spot_prices = extract_spot_prices(messages, start_date, end_date)
 
-    # 标准化交易（全量，用于展示所有交易）
-    normalized_all = normalize_block_trades(block_trades, filter_non_options=False)
-
-    # ✅ 修正：用于 volume 统计和 TopN 排名的只包含 OPTIONS
-    normalized_options = normalize_block_trades(block_trades, filter_non_options=True)
-
-    # ✅ 计算统计指标（只基于期权）
-    btc_count = sum(1 for t in normalized_options if t['asset'] == 'BTC')
-    eth_count = sum(1 for t in normalized_options if t['asset'] == 'ETH')
-    other_count = len(normalized_options) - btc_count - eth_count
+    # ✅ 修正：用于 volume 统计和 TopN 排名的只包含 OPTIONS（逐条解析，FUTURES/PERPETUAL 不构建 dict）
+    # ✅ 单次遍历完成计数、最大 volume、交易所分布，并用大小为 K 的最小堆增量维护各 TopN
+    trade_stats = {'total': 0}
+    options_count = 0
+    max_volume = 0
+    btc_volumes = []
+    eth_volumes = []
+    breakdown_exchange = {}
 
-    btc_volume = sum(t['volume'] for t in normalized_options if t['asset'] == 'BTC')
-    eth_volume = sum(t['volume'] for t in normalized_options if t['asset'] == 'ETH')
+    # TopN 堆（BTC/ETH 独立生成；全局 TopN 取 top_limit * 2 用于兼容旧模板）
+    # 堆在同一遍循环里增量维护，O(N log K)，多数记录在 _push_top_k 一次比较即淘汰；
+    # 30 天样本上 TopN 维护只占聚合耗时约一成，不值得为 argpartition 先把 volume/amount 拷进数组再扫一遍
+    btc_volume_heap = []
+    eth_volume_heap = []
+    btc_amount_heap = []
+    eth_amount_heap = []
+    all_volume_heap = []
+    global_limit = top_limit * 2
+
+    for seq, r in enumerate(_iter_option_trade_records(block_trades, trade_stats)):
+        options_count += 1
+        asset = r.asset
+        v = r.volume
+        # ⚠️ 按金额排序：必须基于 amount_usd != null 且 > 0 的集合（期权腿总权利金）
+        amount = r.amount_usd
+        if asset == 'BTC':
+            btc_volumes.append(v)
+            _push_top_k(btc_volume_heap, top_limit, v, seq, r)
+            if amount > 0:
+                _push_top_k(btc_amount_heap, top_limit, amount, seq, r)
+        elif asset == 'ETH':
+            eth_volumes.append(v)
+            _push_top_k(eth_volume_heap, top_limit, v, seq, r)
+            if amount > 0:
+                _push_top_k(eth_amount_heap, top_limit, amount, seq, r)
+        _push_top_k(all_volume_heap, global_limit, v, seq, r)
+
+        if v > max_volume:
+            max_volume = v
+
+        # breakdown by exchange (只基于期权)
+        ex = r.exchange
+        bucket = breakdown_exchange.get(ex)
+        if bucket is None:
+            bucket = breakdown_exchange[ex] = {'count': 0, 'total_volume': 0.0}
+        bucket['count'] += 1
+        bucket['total_volume'] += v
+
+    # 分资产 volume 用 sum 求和（sum 对浮点做补偿求和，结果与逐条累加不同，保持原口径）
+    btc_count = len(btc_volumes)
+    eth_count = len(eth_volumes)
+    other_count = options_count - btc_count - eth_count
+    btc_volume = sum(btc_volumes)
+    eth_volume = sum(eth_volumes)
     total_volume = btc_volume + eth_volume
-
-    all_volumes = [t['volume'] for t in normalized_options if t['volume'] > 0]
-    avg_volume = total_volume / len(normalized_options) if normalized_options else 0
-    max_volume = max(all_volumes) if all_volumes else 0
-
-    # breakdown by exchange (只基于期权)
-    breakdown_exchange = {}
-    for t in normalized_options:
-        ex = t['exchange']
-        if ex not in breakdown_exchange:
-            breakdown_exchange[ex] = {'count': 0, 'total_volume': 0.0}
-        breakdown_exchange[ex]['count'] += 1
-        breakdown_exchange[ex]['total_volume'] += t['volume']
+    avg_volume = total_volume / options_count if options_count else 0
 
     # breakdown by asset (只基于期权)
     breakdown_asset = {
@@ -176,41 +569,19 @@ def build_daily_report_data(messages, block_trades, start_date, end_date, top_li
         'Other': {'count': other_count, 'total_volume': 0.0}
     }
 
-    # ✅ 修正：BTC/ETH 独立生成 TopN（各自按 volume 排序）
-    btc_trades = [t for t in normalized_options if t['asset'] == 'BTC']
-    eth_trades = [t for t in normalized_options if t['asset'] == 'ETH']
-
-    # ⚠️ 按数量排序：只要 volume > 0 即可（期权张数）
-    btc_by_volume = sorted(btc_trades, key=lambda x: x['volume'], reverse=True)[:top_limit]
-    eth_by_volume = sorted(eth_trades, key=lambda x: x['volume'], reverse=True)[:top_limit]
-
-    # ⚠️ 按金额排序：必须基于 amount_usd != null 且 > 0 的集合（期权腿总权利金）
-    btc_trades_with_amount = [t for t in btc_trades if t.get('amount_usd', 0) > 0]
-    eth_trades_with_amount = [t for t in eth_trades if t.get('amount_usd', 0) > 0]
-
-    btc_by_amount = sorted(btc_trades_with_amount, key=lambda x: x['amount_usd'], reverse=True)[:top_limit]
-    eth_by_amount = sorted(eth_trades_with_amount, key=lambda x: x['amount_usd'], reverse=True)[:top_limit]
-
-    # 添加 rank（从1开始递增）
-    for i, t in enumerate(btc_by_volume, 1):
-        t['rank'] = i
-    for i, t in enumerate(eth_by_volume, 1):
-        t['rank'] = i
-    for i, t in enumerate(btc_by_amount, 1):
-        t['rank'] = i
-    for i, t in enumerate(eth_by_amount, 1):
-        t['rank'] = i
-
-    # ⚠️ 打印 Top3 统计日志（用于验证）
-    for t in btc_by_volume[:3]:
-        legs_opts = len(t.get('options_legs', []))
-        legs_non_opts = len(t.get('non_options_legs', []))
-        print(f"[TOP] rank={t['rank']} asset=BTC sort=volume legs_options={legs_opts} legs_non_options={legs_non_opts} volume={t['volume']} amount_usd={t.get('amount_usd', 0):.2f}")
-
-    for t in btc_by_amount[:3]:
-        legs_opts = len(t.get('options_legs', []))
-        legs_non_opts = len(t.get('non_options_legs', []))
-        print(f"[TOP] rank={t['rank']} asset=BTC sort=amount legs_options={legs_opts} legs_non_options={legs_non_opts} volume={t['volume']} amount_usd={t.get('amount_usd', 0):.2f}")
+    # ✅ 修正：BTC/ETH 独立生成 TopN（堆中只有 K 条，排序开销可忽略；只为入选记录构建完整 dict，rank 在构建时写入）
+    btc_by_volume = _top_k_ranked(btc_volume_heap)
+    eth_by_volume = _top_k_ranked(eth_volume_heap)
+    btc_by_amount = _top_k_ranked(btc_amount_heap)
+    eth_by_amount = _top_k_ranked(eth_amount_heap)
+
+    # ⚠️ 打印 Top3 统计日志（用于验证；默认关闭，REPORT_DEBUG_TOP=true 时输出）
+    if config.REPORT_DEBUG_TOP:
+        for sort_name, top_list in (('volume', btc_by_volume), ('amount', btc_by_amount)):
+            for t in top_list[:3]:
+                legs_opts = len(t.get('options_legs', []))
+                legs_non_opts = len(t.get('non_options_legs', []))
+                print(f"[TOP] rank={t['rank']} asset=BTC sort={sort_name} legs_options={legs_opts} legs_non_options={legs_non_opts} volume={t['volume']} amount_usd={t.get('amount_usd', 0):.2f}")
 
     top_trades = {
         'btc_by_amount': btc_by_amount,
@@ -220,25 +591,23 @@ def build_daily_report_data(messages, block_trades, start_date, end_date, top_li
     }
 
     # 全局 TopN（用于兼容旧模板，也只基于期权）
-    top_trades_list = sorted(normalized_options, key=lambda x: x['volume'], reverse=True)[:top_limit * 2]
-    for i, t in enumerate(top_trades_list, 1):
-        t['rank'] = i
+    top_trades_list = _top_k_ranked(all_volume_heap)
 
     return {
         'meta': {
             'report_date': start_date.strftime('%Y-%m-%d'),
             'start_ts': start_date.isoformat(),
             'end_ts': end_date.isoformat(),
-            'generated_at': datetime.now(pytz.timezone(config.REPORT_TIMEZONE)).isoformat(),
+            'generated_at': datetime.now(_REPORT_TZ).isoformat(),
             'filter_note': 'Volume 统计只包含期权交易（OPTIONS），已过滤 FUTURES/PERPETUAL'
         },
         'counts': {
             'total_messages': len(messages),
-            'block_trades': len(normalized_options),  # 只统计期权
+            'block_trades': options_count,  # 只统计期权
             'btc_count': btc_count,
             'eth_count': eth_count,
             'other_count': other_count,
-            'total_trades_all': len(normalized_all)  # 全部交易数（包含期货）
+            'total_trades_all': trade_stats['total']  # 全部交易数（包含期货）
         },
         'volume_stats': {
             'total_volume': total_volume,
@@ -253,7 +622,7 @@ def build_daily_report_data(messages, block_trades, start_date, end_date, top_li
         'top_trades': top_trades,
         'top_trades_list': top_trades_list,
         'trade_statistics': {
-            'total': len(normalized_options),  # 只统计期权
+            'total': options_count,  # 只统计期权
             'btc_count': btc_count,
             'eth_count': eth_count,
             'other_count': other_count
@@ -300,6 +669,14 @@ def render_report_html(report_data):
         return build_daily_report_html(legacy_data)
 
 
+# v2 模板 CSS（原样存放，无需 {{ }} 转义）
+_REPORT_V2_CSS = """        body { font-family: Arial; max-width: 800px; margin: 20px auto; }
+        h1 { color: #2c3e50; }
+        table { width: 100%; border-collapse: collapse; margin: 20px 0; }
+        th, td { padding: 10px; text-align: left; border: 1px solid #ddd; }
+        th { background: #3498db; color: white; }"""
+
+
 def render_report_html_v2(report_data):
     """v2 简化模板：时间范围 + counts + volume_stats + Top3 表格"""
     meta = report_data['meta']
@@ -307,28 +684,26 @@ def render_report_html_v2(report_data):
     vol = report_data['volume_stats']
     top_list = report_data.get('top_trades_list', [])[:3]
 
-    top_rows = ""
+    # 消息解析出的文本字段转义后再插入 HTML（策略名等来自外部消息）
+    row_parts = []
     for i, t in enumerate(top_list, 1):
-        top_rows += f"""
+        row_parts.append(f"""
         <tr>
             <td>{i}</td>
-            <td>{t['asset']}</td>
-            <td>{t['exchange']}</td>
+            <td>{html_escape(str(t['asset']), quote=False)}</td>
+            <td>{html_escape(str(t['exchange']), quote=False)}</td>
             <td>{t['volume']:.1f}</td>
-            <td>{t['strategy']}</td>
+            <td>{html_escape(str(t['strategy']), quote=False)}</td>
         </tr>
-        """
+        """)
+    top_rows = ''.join(row_parts)
 
     return f"""<!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
     <style>
-        body {{ font-family: Arial; max-width: 800px; margin: 20px auto; }}
-        h1 {{ color: #2c3e50; }}
-        table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
-        th, td {{ padding: 10px; text-align: left; border: 1px solid #ddd; }}
-        th {{ background: #3498db; color: white; }}
+{_REPORT_V2_CSS}
     </style>
 </head>
 <body>
@@ -380,7 +755,7 @@ async def generate_daily_report(target_date=None):
         报告数据字典
     """
     # 计算时间范围（东八区 16:00 - 16:00）
-    tz = pytz.timezone(config.REPORT_TIMEZONE)
+    tz = _REPORT_TZ
 
     if target_date:
         # 使用指定日期
@@ -422,20 +797,29 @@ async def generate_daily_report(target_date=None):
         all_messages = get_messages_by_date_range(session, start_date, end_date)
         print(f"✓ 获取到 {len(all_messages)} 条消息")
 
-        # 3. 获取大宗交易
-        block_trades = get_block_trades_by_date_range(session, start_date, end_date)
+        # 3. 大宗交易是同一时间范围内 is_block_trade 的子集：直接从已加载的消息中筛选
+        #    （顺序同为 date 倒序），不再对同一范围发第二次查询、重复水合同一批行
+        block_trades = [msg for msg in all_messages if msg.is_block_trade]
         print(f"✓ 获取到 {len(block_trades)} 条大宗交易")
 
         # 4. 聚合数据（纯函数）
         report_data = build_daily_report_data(all_messages, block_trades, start_date, end_date)
         print(f"✓ 统计完成: blocks={report_data['counts']['block_trades']} vol={report_data['volume_stats']['total_volume']:.1f}")
 
-        # 5. 渲染 HTML
+        # 5. 内容未变化则跳过渲染、序列化和写库（例如短时间内重复运行）
+        report_date = start_date.strftime('%Y-%m-%d')
+        content_hash = _report_content_hash(report_data)
+        stored_hash = session.query(DailyReport.content_hash).filter(DailyReport.report_date == report_date).scalar()
+        if stored_hash == content_hash:
+            print(f"[{_ts()}] [GENERATE_REPORT] skip_unchanged report_date={report_date} content_hash={content_hash[:12]}")
+            return report_data
+
+        # 6. 渲染 HTML，并在加锁前序列化 report_data（缩短持锁时间）
         html_content = render_report_html(report_data)
+        report_data_json = _dumps_report_data(report_data)
 
-        # 6. 保存报告到数据库（加锁防止并发写入）
-        report_date = start_date.strftime('%Y-%m-%d')
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [GENERATE_REPORT] start report_date={report_date}")
+        # 7. 保存报告到数据库（加锁防止并发写入）
+        print(f"[{_ts()}] [GENERATE_REPORT] start report_date={report_date}")
 
         # 使用文件锁确保串行写入
         lock_path = '/tmp/dailyreport.lock'
@@ -443,89 +827,53 @@ async def generate_daily_report(target_date=None):
 
         try:
             with lock:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [DB] lock_acquired path={lock_path}")
-
-                # 检查是否已存在该日期的报告
-                existing_report = session.query(DailyReport).filter_by(report_date=report_date).first()
-
-                if existing_report:
-                    # 更新现有报告
-                    existing_report.start_time = start_date
-                    existing_report.end_time = end_date
-                    existing_report.total_messages = report_data['counts']['total_messages']
-                    existing_report.total_block_trades = report_data['counts']['block_trades']
-                    existing_report.btc_trade_count = report_data['counts']['btc_count']
-                    existing_report.btc_total_volume = int(report_data['volume_stats']['btc_volume'])
-                    existing_report.eth_trade_count = report_data['counts']['eth_count']
-                    existing_report.eth_total_volume = int(report_data['volume_stats']['eth_volume'])
+                print(f"[{_ts()}] [DB] lock_acquired path={lock_path}")
+
+                # UPSERT：按 report_date 唯一键插入，已存在则整行覆盖（一次往返，无需先 SELECT）
+                report_values = {
+                    'start_time': start_date,
+                    'end_time': end_date,
+                    'total_messages': report_data['counts']['total_messages'],
+                    'total_block_trades': report_data['counts']['block_trades'],
+                    'btc_trade_count': report_data['counts']['btc_count'],
+                    'btc_total_volume': int(report_data['volume_stats']['btc_volume']),
+                    'eth_trade_count': report_data['counts']['eth_count'],
+                    'eth_total_volume': int(report_data['volume_stats']['eth_volume']),
                     # 处理 None 值：转换为字符串
-                    existing_report.btc_spot_price = str(report_data['spot_prices']['btc']) if report_data['spot_prices']['btc'] is not None else None
-                    existing_report.eth_spot_price = str(report_data['spot_prices']['eth']) if report_data['spot_prices']['eth'] is not None else None
-                    existing_report.report_data = json.dumps(report_data, ensure_ascii=False)
-                    existing_report.html_content = html_content
-                    existing_report.is_sent = False
-                    existing_report.sent_at = None
-                    existing_report.created_at = datetime.utcnow()
-                    print(f"✓ 更新已存在的报告: {report_date}")
-                else:
-                    # 创建新报告
-                    new_report = DailyReport(
-                        report_date=report_date,
-                        start_time=start_date,
-                        end_time=end_date,
-                        total_messages=report_data['counts']['total_messages'],
-                        total_block_trades=report_data['counts']['block_trades'],
-                        btc_trade_count=report_data['counts']['btc_count'],
-                        btc_total_volume=int(report_data['volume_stats']['btc_volume']),
-                        eth_trade_count=report_data['counts']['eth_count'],
-                        eth_total_volume=int(report_data['volume_stats']['eth_volume']),
-                        # 处理 None 值：转换为字符串
-                        btc_spot_price=str(report_data['spot_prices']['btc']) if report_data['spot_prices']['btc'] is not None else None,
-                        eth_spot_price=str(report_data['spot_prices']['eth']) if report_data['spot_prices']['eth'] is not None else None,
-                        report_data=json.dumps(report_data, ensure_ascii=False),
-                        html_content=html_content,
-                        is_sent=False
-                    )
-                    session.add(new_report)
-                    print(f"✓ 创建新报告: {report_date}")
-
-                # 提交事务，带重试机制
-                max_retries = 3
-                retry_delay = 1.0
-
-                for retry in range(max_retries):
-                    try:
-                        session.flush()  # 先检测问题
-                        session.commit()
-                        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [DB] commit_success report_date={report_date}")
-                        break  # 成功则退出重试循环
-                    except sqlite3.OperationalError as op_err:
-                        if 'database is locked' in str(op_err):
-                            if retry < max_retries - 1:
-                                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [DB] commit_retry attempt={retry+1}/{max_retries} delay={retry_delay}s err='{op_err}'")
-                                session.rollback()
-                                time.sleep(retry_delay)
-                                retry_delay *= 2  # 指数退避
-                            else:
-                                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [DB] commit_failed max_retries_exceeded err='{op_err}'")
-                                session.rollback()
-                                raise
-                        else:
-                            print(f"✗ 保存报告失败（非锁错误）: {op_err}")
-                            session.rollback()
-                            raise
-                    except Exception as commit_err:
-                        print(f"✗ 保存报告失败: {commit_err}")
-                        session.rollback()
-                        raise  # generate 失败要抛出
-
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [DB] lock_released path={lock_path}")
+                    'btc_spot_price': str(report_data['spot_prices']['btc']) if report_data['spot_prices']['btc'] is not None else None,
+                    'eth_spot_price': str(report_data['spot_prices']['eth']) if report_data['spot_prices']['eth'] is not None else None,
+                    'report_data': report_data_json,
+                    'html_content': html_content,
+                    'content_hash': content_hash,
+                    'is_sent': False,
+                    'sent_at': None,
+                    'created_at': datetime.utcnow()
+                }
+                upsert_stmt = sqlite_insert(DailyReport).values(report_date=report_date, **report_values)
+                upsert_stmt = upsert_stmt.on_conflict_do_update(index_elements=['report_date'], set_=report_values)
+
+                # 执行并提交事务（单条 UPSERT；写锁冲突由连接上的 PRAGMA busy_timeout 在 SQLite 内部等待，
+                # 见 config.DB_BUSY_TIMEOUT，超时仍失败则直接抛出，不在 Python 层 sleep 重试）
+                try:
+                    session.execute(upsert_stmt)
+                    session.commit()
+                    print(f"✓ 保存报告: {report_date}")
+                    print(f"[{_ts()}] [DB] commit_success report_date={report_date}")
+                except Exception as commit_err:
+                    print(f"✗ 保存报告失败: {commit_err}")
+                    print(f"[{_ts()}] [DB] commit_failed report_date={report_date} err='{commit_err}'")
+                    session.rollback()
+                    raise  # generate 失败要抛出
+
+                print(f"[{_ts()}] [DB] lock_released path={lock_path}")
 
         except Timeout:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [DB] lock_timeout err='Failed to acquire lock within 10s'")
+            print(f"[{_ts()}] [DB] lock_timeout err='Failed to acquire lock within 10s'")
             raise
 
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [GENERATE_REPORT] end report_date={report_date} total_messages={report_data['counts']['total_messages']} total_block_trades={report_data['counts']['block_trades']}")
+        # 解析缓存命中情况（进程内累计），用于确认重复消息/重复生成日报没有重新跑正则
+        parse_cache = _parse_block_trade_message_cached.cache_info()
+        print(f"[{_ts()}] [GENERATE_REPORT] end report_date={report_date} total_messages={report_data['counts']['total_messages']} total_block_trades={report_data['counts']['block_trades']} parse_cache_hits={parse_cache.hits} parse_cache_misses={parse_cache.misses}")
 
         print("\n" + "=" * 60)
         print("✓ 每日报告已生成并保存到数据库！")
@@ -533,15 +881,53 @@ async def generate_daily_report(target_date=None):
         print(f"  待发送邮件: 将在 {config.EMAIL_SEND_TIME} 自动发送")
         print("=" * 60)
 
-        session.close()
         return report_data
 
     except Exception as e:
         rd = report_date if report_date else "unknown"
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [GENERATE_REPORT] error report_date={rd} error={str(e)}")
-        session.close()
+        print(f"[{_ts()}] [GENERATE_REPORT] error report_date={rd} error={str(e)}")
         raise
 
+    finally:
+        # 无论成功或失败都归还连接
+        session.close()
+
+
+def _ensure_aware(dt):
+    """
+    确保 datetime 有时区信息（naive 视为 UTC）
+
+    只用于和窗口边界比较：aware datetime 按绝对时刻比较，与所在时区无关，
+    已带时区的直接返回，不再 astimezone 换算（每条消息少分配一个 datetime）
+    """
+    if dt.tzinfo is None:
+        return pytz.utc.localize(dt)
+    return dt
+
+
+def _parse_spot_message(text):
+    """解析单条 Spot Prices 消息，返回 (btc_price, eth_price)，不合理或缺失的为 None"""
+    btc_price = None
+    eth_price = None
+
+    # 提取 BTC 价格
+    btc_match = _RE_SPOT_BTC.search(text)
+    if btc_match:
+        price_val = _parse_plain_number(btc_match.group(1))
+        # 合理性检查：现货价格应该在 1000-200000 范围
+        if price_val is not None and 1000 < price_val < 200000:
+            btc_price = price_val
+
+    # 提取 ETH 价格
+    eth_match = _RE_SPOT_ETH.search(text)
+    if eth_match:
+        price_val = _parse_plain_number(eth_match.group(1))
+        # 合理性检查：现货价格应该在 100-10000 范围
+        if price_val is not None and 100 < price_val < 10000:
+            eth_price = price_val
+
+    return btc_price, eth_price
+
 
 def extract_spot_prices(messages, start_date, end_date):
     """
@@ -567,62 +953,34 @@ def extract_spot_prices(messages, start_date, end_date):
             'source_msg_id': int or None
         }
     """
-    import re
-    import pytz
-
-    def parse_spot_message(text):
-        """解析单条 Spot Prices 消息"""
-        btc_price = None
-        eth_price = None
-
-        # 提取 BTC 价格
-        btc_match = re.search(r'BTC[^\d$]*\$?\s*([0-9,]+\.?[0-9]*)', text, re.IGNORECASE)
-        if btc_match:
-            try:
-                price_val = float(btc_match.group(1).replace(',', ''))
-                # 合理性检查：现货价格应该在 1000-200000 范围
-                if 1000 < price_val < 200000:
-                    btc_price = price_val
-            except:
-                pass
-
-        # 提取 ETH 价格
-        eth_match = re.search(r'ETH[^\d$]*\$?\s*([0-9,]+\.?[0-9]*)', text, re.IGNORECASE)
-        if eth_match:
-            try:
-                price_val = float(eth_match.group(1).replace(',', ''))
-                # 合理性检查：现货价格应该在 100-10000 范围
-                if 100 < price_val < 10000:
-                    eth_price = price_val
-            except:
-                pass
-
-        return btc_price, eth_price
-
-    def ensure_aware(dt, target_tz):
-        """确保 datetime 有时区信息"""
-        if dt.tzinfo is None:
-            return pytz.utc.localize(dt).astimezone(target_tz)
-        else:
-            return dt.astimezone(target_tz)
-
-    # 获取目标时区
-    target_tz = start_date.tzinfo if start_date.tzinfo else pytz.timezone(config.REPORT_TIMEZONE)
-
-    # 筛选所有 Spot Prices 消息
-    spot_messages = [msg for msg in messages
-                     if ('🏷️ Spot Prices' in (msg.text or '') or '🏷️Spot Prices' in (msg.text or ''))]
-
-    # 步骤1：在窗口内查找最后一条 Spot Prices
-    in_window_msgs = []
-    for msg in spot_messages:
-        msg_date_aware = ensure_aware(msg.date, target_tz)
+    # 步骤1/2：单次遍历 messages，同时找窗口内最后一条和窗口开始前最近一条 Spot Prices
+    # （C 层子串匹配预筛：先查 ASCII 的 'Spot Prices'，比先查 emoji 快约一倍，命中后再区分两种带 emoji 写法；
+    #  只有命中的消息才做时区换算；不再先收集中间列表）
+    # Ref 回退只在两者都没有时才需要，单独扫描，避免每条消息都多跑一次 Ref 正则
+    # 当前最新值的 date 单独存一份局部变量（滚动求最大值，不排序；比较时不必反复读 ORM 属性）
+    latest_in_window = None
+    latest_in_window_date = None
+    latest_before_window = None
+    latest_before_window_date = None
+    for msg in messages:
+        text = msg.text
+        if not (text and 'Spot Prices' in text and ('🏷️ Spot Prices' in text or '🏷️Spot Prices' in text)):
+            continue
+        msg_date = msg.date
+        msg_date_aware = _ensure_aware(msg_date)
         if start_date <= msg_date_aware <= end_date:
-            in_window_msgs.append(msg)
+            if latest_in_window is None or msg_date > latest_in_window_date:
+                latest_in_window = msg
+                latest_in_window_date = msg_date
+        elif msg_date_aware < start_date:
+            if latest_before_window is None or msg_date > latest_before_window_date:
+                latest_before_window = msg
+                latest_before_window_date = msg_date
 
-    if in_window_msgs:
-        latest_msg = sorted(in_window_msgs, key=lambda x: x.date, reverse=True)[0]
-        btc_price, eth_price = parse_spot_message(latest_msg.text or '')
+    # 步骤1：在窗口内查找最后一条 Spot Prices
+    if latest_in_window is not None:
+        latest_msg = latest_in_window
+        btc_price, eth_price = _parse_spot_message(latest_msg.text or '')
 
         print(f"[SPOT] source=spot_prices_tag msg_id={latest_msg.message_id} btc={btc_price} eth={eth_price} spot_ts={latest_msg.date.isoformat()}")
         return {
@@ -634,15 +992,9 @@ def extract_spot_prices(messages, start_date, end_date):
         }
 
     # 步骤2：回退到窗口开始前最近一条 Spot Prices
-    before_window_msgs = []
-    for msg in spot_messages:
-        msg_date_aware = ensure_aware(msg.date, target_tz)
-        if msg_date_aware < start_date:
-            before_window_msgs.append(msg)
-
-    if before_window_msgs:
-        latest_msg = sorted(before_window_msgs, key=lambda x: x.date, reverse=True)[0]
-        btc_price, eth_price = parse_spot_message(latest_msg.text or '')
+    if latest_before_window is not None:
+        latest_msg = latest_before_window
+        btc_price, eth_price = _parse_spot_message(latest_msg.text or '')
 
         print(f"[SPOT] source=spot_prices_fallback msg_id={latest_msg.message_id} btc={btc_price} eth={eth_price} spot_ts={latest_msg.date.isoformat()}")
         return {
@@ -653,68 +1005,65 @@ def extract_spot_prices(messages, start_date, end_date):
             'source_msg_id': latest_msg.message_id
         }
 
-    # 步骤3：从交易消息的 Ref 推断（窗口内最新）
-    ref_messages = []
+    # 步骤3：从交易消息的 Ref 推断（窗口内最新，BTC/ETH 各取一条）
+    btc_price = None
+    eth_price = None
+    latest_btc_msg = None
+    latest_eth_msg = None
+    latest_btc_date = None
+    latest_eth_date = None
+    # BTC/ETH 都已找到时，不晚于两者中较早那条的消息不可能再更新任何一方，直接跳过（不跑正则）；
+    # 调用方按 date 倒序传入时（get_messages_by_date_range），两者找到后其余消息只做一次日期比较
+    skip_not_after = None
+
     for msg in messages:
+        msg_date = msg.date
+        if skip_not_after is not None:
+            try:
+                if msg_date <= skip_not_after:
+                    continue
+            except TypeError:
+                pass
         text = msg.text or ''
         # 提取 Ref 价格和资产类型
-        ref_match = re.search(r'(?:Ref|REF)[\*:\s：]{1,5}\$([0-9,.]+)', text, re.IGNORECASE)
+        ref_match = _RE_REF_PRICE.search(text)
         if ref_match:
+            ref_val = _parse_plain_number(ref_match.group(1))
+            if ref_val is None:
+                continue
             try:
-                ref_val = float(ref_match.group(1).replace(',', ''))
                 # 判断资产类型
-                asset = None
-                if 'BTC' in text.upper():
-                    asset = 'BTC'
-                elif 'ETH' in text.upper():
-                    asset = 'ETH'
-
-                if asset:
-                    msg_date_aware = ensure_aware(msg.date, target_tz)
-                    if start_date <= msg_date_aware <= end_date:
-                        ref_messages.append({
-                            'msg': msg,
-                            'asset': asset,
-                            'ref_price': ref_val,
-                            'date': msg.date
-                        })
+                if _RE_BTC_ANYCASE.search(text):
+                    if latest_btc_msg is not None and msg_date <= latest_btc_date:
+                        continue
+                    if start_date <= _ensure_aware(msg_date) <= end_date:
+                        btc_price = ref_val
+                        latest_btc_msg = msg
+                        latest_btc_date = msg_date
+                elif _RE_ETH_ANYCASE.search(text):
+                    if latest_eth_msg is not None and msg_date <= latest_eth_date:
+                        continue
+                    if start_date <= _ensure_aware(msg_date) <= end_date:
+                        eth_price = ref_val
+                        latest_eth_msg = msg
+                        latest_eth_date = msg_date
+                if latest_btc_msg is not None and latest_eth_msg is not None:
+                    skip_not_after = min(latest_btc_date, latest_eth_date)
             except:
                 pass
 
-    if ref_messages:
-        # 按时间倒序排序
-        ref_messages_sorted = sorted(ref_messages, key=lambda x: x['date'], reverse=True)
-
-        # 提取最新的 BTC 和 ETH Ref
-        btc_price = None
-        eth_price = None
-        latest_btc_msg = None
-        latest_eth_msg = None
-
-        for ref_msg in ref_messages_sorted:
-            if ref_msg['asset'] == 'BTC' and btc_price is None:
-                btc_price = ref_msg['ref_price']
-                latest_btc_msg = ref_msg['msg']
-            elif ref_msg['asset'] == 'ETH' and eth_price is None:
-                eth_price = ref_msg['ref_price']
-                latest_eth_msg = ref_msg['msg']
-
-            # 如果两者都找到了，退出
-            if btc_price is not None and eth_price is not None:
-                break
+    # 使用最新的一条作为代表（取BTC优先，ETH次之）
+    latest_msg = latest_btc_msg if latest_btc_msg else latest_eth_msg
 
-        # 使用最新的一条作为代表（取BTC优先，ETH次之）
-        latest_msg = latest_btc_msg if latest_btc_msg else latest_eth_msg
-
-        if latest_msg:
-            print(f"[SPOT] source=ref_fallback msg_id={latest_msg.message_id} btc={btc_price} eth={eth_price} spot_ts={latest_msg.date.isoformat()}")
-            return {
-                'btc': btc_price,
-                'eth': eth_price,
-                'spot_source': 'ref_fallback',
-                'spot_ts': latest_msg.date.isoformat() if latest_msg.date else None,  # ⚠️ 修正：转为ISO字符串
-                'source_msg_id': latest_msg.message_id
-            }
+    if latest_msg:
+        print(f"[SPOT] source=ref_fallback msg_id={latest_msg.message_id} btc={btc_price} eth={eth_price} spot_ts={latest_msg.date.isoformat()}")
+        return {
+            'btc': btc_price,
+            'eth': eth_price,
+            'spot_source': 'ref_fallback',
+            'spot_ts': latest_msg.date.isoformat() if latest_msg.date else None,  # ⚠️ 修正：转为ISO字符串
+            'source_msg_id': latest_msg.message_id
+        }
 
     # 步骤4：都没有
     print(f"[SPOT] source=missing reason=no_spot_message_and_no_ref btc=None eth=None spot_ts=None")
@@ -746,11 +1095,13 @@ def calculate_trade_statistics(block_trades):
     btc_count = 0
     eth_count = 0
 
+    btc_search = _RE_BTC_ANYCASE.search
+    eth_search = _RE_ETH_ANYCASE.search
     for trade in block_trades:
-        text = (trade.text or '').upper()
-        if 'BTC' in text:
+        text = trade.text or ''
+        if btc_search(text):
             btc_count += 1
-        elif 'ETH' in text:
+        elif eth_search(text):
             eth_count += 1
 
     return {
@@ -761,6 +1112,32 @@ def calculate_trade_statistics(block_trades):
     }
 
 
+@dataclass(slots=True)
+class _TopTradeCandidate:
+    """
+    extract_top_trades 的轻量候选记录（slots，排序只读 volume/amount_usd 属性）
+
+    完整 trade_info dict 只在入选 TopN 后通过 to_dict() 构建一次（同时入选金额榜和数量榜时返回同一个 dict）
+    """
+    volume: float
+    amount_usd: float
+    trade: object
+    parsed: dict
+    item: dict = None
+
+    def to_dict(self):
+        if self.item is None:
+            trade = self.trade
+            item = dict(self.parsed)
+            item.update({
+                'message_id': trade.message_id,
+                'date': trade.date.strftime('%Y-%m-%d %H:%M:%S'),
+                'raw_text': trade.text
+            })
+            self.item = item
+        return self.item
+
+
 def extract_top_trades(block_trades, limit=3):
     """
     提取 Top 3 交易（按金额和数量分类，按币种分类）
@@ -778,42 +1155,36 @@ def extract_top_trades(block_trades, limit=3):
             'eth_by_volume': [...]  # ETH 按数量 Top 3
         }
     """
-    # 1. 解析所有交易
-    parsed_trades = []
+    # 1. 解析所有交易，同一遍循环内按币种分桶（不再对解析结果做两次列表筛选）
+    # 只读使用缓存的解析结果，桶里放 slots 候选记录；拷贝 dict、格式化日期推迟到入选 TopN 之后
+    btc_trades = []
+    eth_trades = []
+    buckets = {'BTC': btc_trades, 'ETH': eth_trades}
 
     for trade in block_trades:
-        trade_info = parse_block_trade_message(trade.text or '')
-        trade_info.update({
-            'message_id': trade.message_id,
-            'date': trade.date.strftime('%Y-%m-%d %H:%M:%S'),
-            'raw_text': trade.text
-        })
-        parsed_trades.append(trade_info)
-
-    # 2. 按币种分类
-    btc_trades = [t for t in parsed_trades if t['asset'] == 'BTC']
-    eth_trades = [t for t in parsed_trades if t['asset'] == 'ETH']
-
-    # 3. 按金额排序
-    btc_by_amount = sorted(btc_trades, key=lambda x: x.get('amount_usd', 0), reverse=True)[:limit]
-    eth_by_amount = sorted(eth_trades, key=lambda x: x.get('amount_usd', 0), reverse=True)[:limit]
-
-    # 4. 按数量排序
-    btc_by_volume = sorted(btc_trades, key=lambda x: x.get('volume', 0), reverse=True)[:limit]
-    eth_by_volume = sorted(eth_trades, key=lambda x: x.get('volume', 0), reverse=True)[:limit]
-
-    # 5. 添加排名
-    for i, trade in enumerate(btc_by_amount, 1):
-        trade['rank'] = i
-
-    for i, trade in enumerate(btc_by_volume, 1):
-        trade['rank'] = i
-
-    for i, trade in enumerate(eth_by_amount, 1):
-        trade['rank'] = i
-
-    for i, trade in enumerate(eth_by_volume, 1):
-        trade['rank'] = i
+        parsed = _parse_block_trade_message_cached(trade.text or '')
+
+        # 2. 按币种分类（其他币种不参与 TopN）
+        bucket = buckets.get(parsed['asset'])
+        if bucket is not None:
+            bucket.append(_TopTradeCandidate(parsed['volume'], parsed['amount_usd'], trade, parsed))
+
+    # 3. 按金额取 TopN（heapq.nlargest 只维护 limit 条，O(N log limit)，结果与 sorted(..., reverse=True)[:limit] 一致）
+    # 不用 numpy argpartition：它对相同 key 不保证先出现者优先（volume 整数值并列很常见，榜单顺序会变），
+    # 单日每币种通常只有几百笔，nlargest 一次约十几微秒，拷贝数组的开销反而更大
+    by_amount = attrgetter('amount_usd')
+    btc_by_amount = [c.to_dict() for c in heapq.nlargest(limit, btc_trades, key=by_amount)]
+    eth_by_amount = [c.to_dict() for c in heapq.nlargest(limit, eth_trades, key=by_amount)]
+
+    # 4. 按数量取 TopN
+    by_volume = attrgetter('volume')
+    btc_by_volume = [c.to_dict() for c in heapq.nlargest(limit, btc_trades, key=by_volume)]
+    eth_by_volume = [c.to_dict() for c in heapq.nlargest(limit, eth_trades, key=by_volume)]
+
+    # 5. 添加排名（金额榜与数量榜共享同一批 dict，按原顺序写入，同时入选两榜的交易保留数量榜排名）
+    for top_list in (btc_by_amount, btc_by_volume, eth_by_amount, eth_by_volume):
+        for i, trade in enumerate(top_list, 1):
+            trade['rank'] = i
 
     return {
         'btc_by_amount': btc_by_amount,
@@ -832,14 +1203,26 @@ def parse_block_trade_message(text):
     - 支持不以 LONG/SHORT 开头的格式（如 FUTURES SPREAD）
     - 提取更多字段（ask/mark/premium/instrument_type）
 
+    解析结果按消息原文缓存（同一进程内重复生成日报/回补多天/重试/预警不再重复跑正则，
+    容量见 config.PARSE_CACHE_SIZE）；返回顶层浅拷贝，调用方可以 update/添加字段，但不要修改 legs/greeks 等嵌套结构
+
     Args:
         text: 消息文本
 
     Returns:
         交易信息字典
     """
-    import re
+    return dict(_parse_block_trade_message_cached(text))
+
+
+@functools.lru_cache(maxsize=config.PARSE_CACHE_SIZE)
+def _parse_block_trade_message_cached(text):
+    """parse_block_trade_message 的缓存层（返回共享对象，只读）"""
+    return _parse_block_trade_message(text)
 
+
+def _parse_block_trade_message(text):
+    """解析大宗交易消息内容（无缓存实现，见 parse_block_trade_message）"""
     result = {
         'asset': 'Unknown',      # BTC or ETH
         'strategy': 'Unknown',
@@ -871,31 +1254,34 @@ def parse_block_trade_message(text):
     if not text:
         return result
 
+    # 大写副本只生成一次，关键字存在性判断都用 in 在它上面做，不再反复 text.upper()
+    text_upper = text.upper()
+
     # 1. 提取资产类型 (BTC or ETH)
-    if 'BTC' in text.upper():
+    if 'BTC' in text_upper:
         result['asset'] = 'BTC'
-    elif 'ETH' in text.upper():
+    elif 'ETH' in text_upper:
         result['asset'] = 'ETH'
 
-    # 2. 识别交易工具类型（OPTIONS / FUTURES / PERPETUAL）
-    if 'PERPETUAL' in text.upper() or 'PERP' in text.upper():
+    # 2. 识别交易工具类型（OPTIONS / FUTURES / PERPETUAL）（'PERP' 已覆盖 'PERPETUAL'）
+    if 'PERP' in text_upper:
         result['instrument_type'] = 'PERPETUAL'
-    elif 'FUTURES' in text.upper() or '-FUT' in text.upper():
+    elif 'FUTURES' in text_upper or '-FUT' in text_upper:
         result['instrument_type'] = 'FUTURES'
-    elif re.search(r'(PUT|CALL)', text, re.IGNORECASE):
+    elif _RE_PUT_CALL.search(text):
         result['instrument_type'] = 'OPTIONS'
-    elif re.search(r'(BTC|ETH)-\d{1,2}[A-Z]{3}\d{2,4}-\d+-[PC]', text):
+    elif _RE_OPTION_CONTRACT.search(text):
         result['instrument_type'] = 'OPTIONS'
 
     # 3. 提取策略类型和方向 (支持多种格式)
     # 格式1: **LONG BTC PUT (...)**
-    strategy_match = re.search(r'\*\*(LONG|SHORT)\s+(BTC|ETH)\s+([\w\s]+?)\s*\(', text, re.IGNORECASE)
+    strategy_match = _RE_STRATEGY_1.search(text)
     if not strategy_match:
         # 格式2: **LONG BTC PUT**
-        strategy_match = re.search(r'\*\*(LONG|SHORT)\s+(BTC|ETH)\s+(PUT|CALL|[\w\s]+)\*\*', text, re.IGNORECASE)
+        strategy_match = _RE_STRATEGY_2.search(text)
     if not strategy_match:
         # 格式3: **BTC FUTURES SPREAD:** (不以 LONG/SHORT 开头)
-        strategy_match = re.search(r'\*\*(BTC|ETH)\s+(FUTURES|OPTIONS)?\s*(SPREAD|[\w\s]+?)[:：]\*\*', text, re.IGNORECASE)
+        strategy_match = _RE_STRATEGY_3.search(text)
 
     if strategy_match:
         try:
@@ -918,181 +1304,90 @@ def parse_block_trade_message(text):
             result['strategy'] = strategy_match.group(0).strip('*').strip(':：')
 
     # 如果 side 还是 Unknown，尝试从 Bought/Sold 提取
+    # 先用子串判断排除，再用正则确认单词边界
     if result['side'] == 'Unknown':
-        if re.search(r'\bBought\b', text, re.IGNORECASE):
+        if 'BOUGHT' in text_upper and _RE_BOUGHT.search(text):
             result['side'] = 'LONG'
-        elif re.search(r'\bSold\b', text, re.IGNORECASE):
+        elif 'SOLD' in text_upper and _RE_SOLD.search(text):
             result['side'] = 'SHORT'
 
     # 4. 提取合约数量 (50.0x)
-    volume_match = re.search(r'(\d+\.?\d*)\s*x', text)
+    volume_match = _RE_VOLUME.search(text)
     if volume_match:
         result['volume'] = float(volume_match.group(1))
 
     # 5. 提取交易所 (Deribit / OKX / Binance / Bybit)
-    exchanges = ['Deribit', 'OKX', 'Binance', 'Bybit']
-    for exchange in exchanges:
-        if exchange.lower() in text.lower():
+    for exchange, exchange_upper in _EXCHANGES:
+        if exchange_upper in text_upper:
             result['exchange'] = exchange
             break
 
     # 4. 提取美元金额 (从 Total Bought/Sold 中提取)
     # 格式: Total Bought: 1.7300 ₿ ($181.24K)
-    total_amount_matches = re.findall(r'Total (?:Bought|Sold):[^$]*\$([0-9,.]+[KMB]?)', text)
+    total_amount_matches = _RE_TOTAL_AMOUNT.findall(text)
     if total_amount_matches:
-        # 转换为数值
-        def parse_amount(amt_str):
-            amt_str = amt_str.replace(',', '')
-            multiplier = 1
-            if amt_str.endswith('K'):
-                multiplier = 1000
-                amt_str = amt_str[:-1]
-            elif amt_str.endswith('M'):
-                multiplier = 1000000
-                amt_str = amt_str[:-1]
-            elif amt_str.endswith('B'):
-                multiplier = 1000000000
-                amt_str = amt_str[:-1]
-            try:
-                return float(amt_str) * multiplier
-            except:
-                return 0.0
-
-        amounts = [parse_amount(amt) for amt in total_amount_matches]
+        amounts = [_parse_amount(amt) for amt in total_amount_matches]
         result['amount_usd'] = max(amounts) if amounts else 0.0
 
     # 5. 提取合约信息 (BTC-28NOV25-105000-P)
-    contract_match = re.search(r'(BTC|ETH)-(\d{1,2}[A-Z]{3}\d{2,4})-(\d+)-([PC])', text)
+    contract_match = _RE_CONTRACT.search(text)
     if contract_match:
         result['contract'] = contract_match.group(0)
 
     # 6. 提取 IV (隐含波动率)
-    iv_match = re.search(r'\*\*IV\*\*:\s*([\d.]+)%', text)
+    iv_match = _RE_IV.search(text)
     if iv_match:
         result['iv'] = f"{iv_match.group(1)}%"
 
     # 7. 提取 Ask / Mark / Premium（权利金）
     # Ask
-    ask_match = re.search(r'(?:Ask|ASK)[:\s]+([0-9,.]+)\s*₿', text, re.IGNORECASE)
+    ask_match = _RE_ASK.search(text)
     if ask_match:
         result['ask'] = ask_match.group(1) + ' ₿'
 
     # Mark
-    mark_match = re.search(r'(?:Mark|MARK)[:\s]+([0-9,.]+)\s*₿', text, re.IGNORECASE)
+    mark_match = _RE_MARK.search(text)
     if mark_match:
         result['mark'] = mark_match.group(1) + ' ₿'
 
     # Premium (权利金，币本位/金本位)
-    premium_match = re.search(r'(?:Premium|PREMIUM)[:\s]+([0-9,.]+)\s*(?:₿|\$|BTC|USD)', text, re.IGNORECASE)
+    premium_match = _RE_PREMIUM.search(text)
     if premium_match:
         result['premium'] = premium_match.group(0)
 
     # 8. 提取希腊字母（支持符号版本 Δ Γ ν Θ ρ 和英文版本）
     # ⚠️ 修正：支持从 "📖 Risks: Δ: ..., Γ: ..., ν: ..., Θ: ..., ρ: ..." 解析
 
-    # Delta (Δ / Delta)
-    delta_match = re.search(r'(?:Δ|Delta|DELTA)[:\s,]+([-+]?[\d,.]+[KMB]?)', text, re.IGNORECASE)
-    if delta_match:
-        try:
-            val_str = delta_match.group(1).replace(',', '')
-            multiplier = 1
-            if val_str.endswith('K'):
-                multiplier = 1000
-                val_str = val_str[:-1]
-            elif val_str.endswith('M'):
-                multiplier = 1000000
-                val_str = val_str[:-1]
-            elif val_str.endswith('B'):
-                multiplier = 1000000000
-                val_str = val_str[:-1]
-            result['greeks']['delta'] = float(val_str) * multiplier
-        except:
-            pass
-
-    # Gamma (Γ / Gamma)
-    gamma_match = re.search(r'(?:Γ|Gamma|GAMMA)[:\s,]+([-+]?[\d,.]+[KMB]?)', text, re.IGNORECASE)
-    if gamma_match:
-        try:
-            val_str = gamma_match.group(1).replace(',', '')
-            multiplier = 1
-            if val_str.endswith('K'):
-                multiplier = 1000
-                val_str = val_str[:-1]
-            elif val_str.endswith('M'):
-                multiplier = 1000000
-                val_str = val_str[:-1]
-            result['greeks']['gamma'] = float(val_str) * multiplier
-        except:
-            pass
-
-    # Vega (ν / Vega)
-    vega_match = re.search(r'(?:ν|Vega|VEGA)[:\s,]+([-+]?[\d,.]+[KMB]?)', text, re.IGNORECASE)
-    if vega_match:
-        try:
-            val_str = vega_match.group(1).replace(',', '')
-            multiplier = 1
-            if val_str.endswith('K'):
-                multiplier = 1000
-                val_str = val_str[:-1]
-            elif val_str.endswith('M'):
-                multiplier = 1000000
-                val_str = val_str[:-1]
-            result['greeks']['vega'] = float(val_str) * multiplier
-        except:
-            pass
-
-    # Theta (Θ / Theta)
-    theta_match = re.search(r'(?:Θ|Theta|THETA)[:\s,]+([-+]?[\d,.]+[KMB]?)', text, re.IGNORECASE)
-    if theta_match:
-        try:
-            val_str = theta_match.group(1).replace(',', '')
-            multiplier = 1
-            if val_str.endswith('K'):
-                multiplier = 1000
-                val_str = val_str[:-1]
-            elif val_str.endswith('M'):
-                multiplier = 1000000
-                val_str = val_str[:-1]
-            result['greeks']['theta'] = float(val_str) * multiplier
-        except:
-            pass
-
-    # Rho (ρ / Rho)
-    rho_match = re.search(r'(?:ρ|Rho|RHO)[:\s,]+([-+]?[\d,.]+[KMB]?)', text, re.IGNORECASE)
-    if rho_match:
+    greeks = result['greeks']
+    seen_greeks = set()
+    for greek_match in _RE_GREEKS.finditer(text):
+        greek_name = _GREEK_BY_INITIAL[greek_match.group(0)[0]]
+        if greek_name in seen_greeks:
+            continue
+        seen_greeks.add(greek_name)
         try:
-            val_str = rho_match.group(1).replace(',', '')
-            multiplier = 1
-            if val_str.endswith('K'):
-                multiplier = 1000
-                val_str = val_str[:-1]
-            elif val_str.endswith('M'):
-                multiplier = 1000000
-                val_str = val_str[:-1]
-            result['greeks']['rho'] = float(val_str) * multiplier
-        except:
+            greeks[greek_name] = _parse_suffixed_number(greek_match.group(1))
+        except ValueError:
             pass
+        if len(seen_greeks) == len(greeks):
+            break
 
     # 8. 提取价格信息（支持 BTC ₿ 和 ETH Ξ）
     price_native = None
     price_usd = None
     price_inferred = False
 
-    # 尝试从 "at X ₿ ($Y)" 格式提取 BTC 价格
-    btc_price_match = re.search(r'at\s+([\d,.]+)\s*₿\s*\(\$([0-9,.]+[KMB]?)\)', text)
-    if btc_price_match:
-        price_native_val = btc_price_match.group(1).replace(',', '')
-        price_usd_val = btc_price_match.group(2).replace(',', '')
-        price_native = f"{price_native_val} ₿"
-        price_usd = f"${price_usd_val}"
-
-    # 尝试从 "at X Ξ ($Y)" 格式提取 ETH 价格
-    eth_price_match = re.search(r'at\s+([\d,.]+)\s*Ξ\s*\(\$([0-9,.]+[KMB]?)\)', text)
-    if eth_price_match:
-        price_native_val = eth_price_match.group(1).replace(',', '')
-        price_usd_val = eth_price_match.group(2).replace(',', '')
-        price_native = f"{price_native_val} Ξ"
-        price_usd = f"${price_usd_val}"
+    # 先用子串判断币种符号是否出现（C 层 find，远快于正则整串扫描），没有符号时跳过对应正则
+    symbols_present = [entry for entry in _PRICE_PATTERNS if entry[0] in text]
+
+    # 尝试从 "at X ₿ ($Y)" / "at X Ξ ($Y)" 格式提取价格（两者都有时以 ETH 为准）
+    for symbol, price_pattern, _ in symbols_present:
+        price_match = price_pattern.search(text)
+        if price_match:
+            price_native_val = price_match.group(1).replace(',', '')
+            price_usd_val = price_match.group(2).replace(',', '')
+            price_native = f"{price_native_val} {symbol}"
+            price_usd = f"${price_usd_val}"
 
     # 如果找到了价格，保存到 result
     if price_native and price_usd:
@@ -1100,63 +1395,34 @@ def parse_block_trade_message(text):
         result['price_usd'] = price_usd
         result['price'] = f"{price_native} ({price_usd})"
         result['price_inferred'] = price_inferred
-    else:
+    elif result['volume'] > 0:
         # 尝试反推：如果有 Total 和 volume
-        # 辅助函数：解析金额（支持 K/M/B 后缀）
-        def parse_amount(amt_str):
-            amt_str = amt_str.replace(',', '')
-            multiplier = 1
-            if amt_str.endswith('K'):
-                multiplier = 1000
-                amt_str = amt_str[:-1]
-            elif amt_str.endswith('M'):
-                multiplier = 1000000
-                amt_str = amt_str[:-1]
-            elif amt_str.endswith('B'):
-                multiplier = 1000000000
-                amt_str = amt_str[:-1]
-            try:
-                return float(amt_str) * multiplier
-            except:
-                return 0.0
-
-        # 从 Total Bought/Sold: X ₿ ($Y) 提取
-        total_btc_match = re.search(r'Total (?:Bought|Sold):\s*([\d,.]+)\s*₿\s*\(\$([0-9,.]+[KMB]?)\)', text)
-        total_eth_match = re.search(r'Total (?:Bought|Sold):\s*([\d,.]+)\s*Ξ\s*\(\$([0-9,.]+[KMB]?)\)', text)
-
-        if total_btc_match and result['volume'] > 0:
-            total_native = float(total_btc_match.group(1).replace(',', ''))
-            price_native = f"{total_native / result['volume']:.4f} ₿"
-            total_usd = parse_amount(total_btc_match.group(2))
-            price_usd = f"${total_usd / result['volume']:,.2f}"
-            result['price_native'] = price_native
-            result['price_usd'] = price_usd
-            result['price'] = f"{price_native} ({price_usd})"
-            result['price_inferred'] = True
-        elif total_eth_match and result['volume'] > 0:
-            total_native = float(total_eth_match.group(1).replace(',', ''))
-            price_native = f"{total_native / result['volume']:.4f} Ξ"
-            total_usd = parse_amount(total_eth_match.group(2))
-            price_usd = f"${total_usd / result['volume']:,.2f}"
-            result['price_native'] = price_native
-            result['price_usd'] = price_usd
-            result['price'] = f"{price_native} ({price_usd})"
-            result['price_inferred'] = True
+        # 从 Total Bought/Sold: X ₿ ($Y) / X Ξ ($Y) 提取（BTC 优先）
+        for symbol, _, total_pattern in symbols_present:
+            total_match = total_pattern.search(text)
+            if total_match:
+                total_native = float(total_match.group(1).replace(',', ''))
+                price_native = f"{total_native / result['volume']:.4f} {symbol}"
+                total_usd = _parse_amount(total_match.group(2))
+                price_usd = f"${total_usd / result['volume']:,.2f}"
+                result['price_native'] = price_native
+                result['price_usd'] = price_usd
+                result['price'] = f"{price_native} ({price_usd})"
+                result['price_inferred'] = True
+                break
 
     # 9. 提取现货参考价格 (Ref: $105234.56)
     # 支持多种格式：Ref: $123 / **Ref**: $123 / Ref**: $123 / Ref：$123（中文冒号）
-    spot_match = re.search(r'(?:Ref|REF)[\*:\s：]{1,5}\$([0-9,.]+)', text, re.IGNORECASE)
+    spot_match = _RE_REF_PRICE.search(text)
     if spot_match:
-        try:
-            spot_val = float(spot_match.group(1).replace(',', ''))
+        spot_val = _parse_plain_number(spot_match.group(1))
+        if spot_val is not None:
             result['spot_price'] = f"${spot_val:,.2f}"
             result['ref_price_usd'] = spot_val  # 新增：数值字段（用于日志和进一步处理）
-        except:
-            pass
 
     # 10. 提取 strategy_title（完整策略标题）
     # 从消息第一行提取，通常格式为 **✅OPENED ...** 或 **CUSTOM ... STRATEGY:**
-    title_match = re.search(r'\*\*(.*?)\*\*', text)
+    title_match = _RE_TITLE.search(text)
     if title_match:
         result['strategy_title'] = title_match.group(1).strip()
 
@@ -1165,50 +1431,24 @@ def parse_block_trade_message(text):
     # 格式：🟢 Bought 225.0x 🔶 BTC-27FEB26-80000-P 📉 at 0.0427 ₿ ($3,716.30) Total Bought: 9.6075 ₿ ($836.17K), IV: 46.71%, Ref: $87032.71
     #       bid: 0.042 (size: 78.0), mark: 0.0425, ask: 0.043 (size: 20.0)
 
-    def parse_amount_with_suffix(amt_str):
-        """解析金额（支持K/M/B后缀）"""
-        amt_str = amt_str.replace(',', '').replace('$', '').strip()
-        multiplier = 1
-        if amt_str.endswith('K'):
-            multiplier = 1000
-            amt_str = amt_str[:-1]
-        elif amt_str.endswith('M'):
-            multiplier = 1000000
-            amt_str = amt_str[:-1]
-        elif amt_str.endswith('B'):
-            multiplier = 1000000000
-            amt_str = amt_str[:-1]
-        try:
-            return float(amt_str) * multiplier
-        except:
-            return None
-
     # 分行处理
     lines = text.split('\n')
     current_leg = None
 
     for line in lines:
         # 检查是否是新的腿（Bought/Sold 开头）
-        leg_match = re.search(r'(Bought|Sold)\s+([\d.]+)x\s+.*?((BTC|ETH)-[\dA-Z-]+)', line, re.IGNORECASE)
+        # 先在 casefold 副本上做子串预筛，多数行不含 bought/sold，直接跳过带 .*? 回溯的腿正则
+        # （casefold 会把 IGNORECASE 视为等价的 ſ/K 折叠成 s/k，预筛不会漏掉正则能匹配的行）
+        line_folded = line.casefold()
+        if 'ought' in line_folded or 'old' in line_folded:
+            leg_match = _RE_LEG.search(line)
+        else:
+            leg_match = None
 
         if leg_match:
             # 如果有未完成的腿，先保存
             if current_leg:
-                # 根据合约名判断instrument_type
-                contract_name = current_leg['contract']
-                if 'PERPETUAL' in contract_name.upper() or 'PERP' in contract_name.upper():
-                    current_leg['instrument_type'] = 'PERPETUAL'
-                    result['non_options_legs'].append(current_leg)
-                elif 'FUTURES' in contract_name.upper() or 'FUT' in contract_name.upper():
-                    current_leg['instrument_type'] = 'FUTURES'
-                    result['non_options_legs'].append(current_leg)
-                elif re.search(r'-\d+-[PC]$', contract_name):  # 以 -数字-P/C 结尾
-                    current_leg['instrument_type'] = 'OPTIONS'
-                    result['options_legs'].append(current_leg)
-                else:
-                    # 未分类的合约（如 BTC-27MAR26，可能是 FUTURES 或 SPOT）
-                    current_leg['instrument_type'] = 'FUTURES'
-                    result['non_options_legs'].append(current_leg)
+                _append_leg(result, current_leg)
 
             # 开始新的腿
             side_str = leg_match.group(1)  # Bought / Sold
@@ -1233,41 +1473,41 @@ def parse_block_trade_message(text):
             }
 
             # 提取价格：at 0.0427 ₿ ($3,716.30)
-            price_match = re.search(r'at\s+([\d.]+)\s*₿\s*\(\$([0-9,.]+)\)', line)
+            price_match = _RE_LEG_PRICE.search(line)
             if price_match:
                 current_leg['price_btc'] = float(price_match.group(1))
-                current_leg['price_usd'] = parse_amount_with_suffix(price_match.group(2))
+                current_leg['price_usd'] = _parse_amount(price_match.group(2), default=None)
 
             # 提取Total：Total Bought: 9.6075 ₿ ($836.17K)
-            total_match = re.search(r'Total\s+(?:Bought|Sold):\s+([\d.]+)\s*₿\s*\(\$([0-9,.KMB]+)\)', line)
+            total_match = _RE_LEG_TOTAL.search(line)
             if total_match:
                 current_leg['total_btc'] = float(total_match.group(1))
-                current_leg['total_usd'] = parse_amount_with_suffix(total_match.group(2))
+                current_leg['total_usd'] = _parse_amount(total_match.group(2), default=None)
 
             # 提取IV：IV: 46.71% 或 **IV**: 46.71%
-            iv_match = re.search(r'\*\*IV\*\*:\s*([\d.]+)%|IV:\s*([\d.]+)%', line)
+            iv_match = _RE_LEG_IV.search(line)
             if iv_match:
                 current_leg['iv'] = float(iv_match.group(1) or iv_match.group(2))
 
             # 提取Ref：Ref: $87032.71 或 **Ref**: $87032.71
-            ref_match = re.search(r'\*\*Ref\*\*:\s*\$([0-9,.]+)|Ref:\s*\$([0-9,.]+)', line)
+            ref_match = _RE_LEG_REF.search(line)
             if ref_match:
                 current_leg['ref_spot_usd'] = float((ref_match.group(1) or ref_match.group(2)).replace(',', ''))
 
         # 检查是否是quote行（bid/mark/ask）
-        elif current_leg and re.search(r'bid.*mark.*ask', line, re.IGNORECASE):
+        elif current_leg and 'ask' in line_folded and _RE_QUOTE_LINE.search(line):
             # bid: 0.042 (size: 78.0), mark: 0.0425, ask: 0.043 (size: 20.0)
-            bid_match = re.search(r'bid:\s*([\d.]+)(?:\s*\(size:\s*([\d.]+)\))?', line, re.IGNORECASE)
+            bid_match = _RE_QUOTE_BID.search(line)
             if bid_match:
                 current_leg['bid'] = float(bid_match.group(1))
                 if bid_match.group(2):
                     current_leg['bid_size'] = float(bid_match.group(2))
 
-            mark_match = re.search(r'mark:\s*([\d.]+)', line, re.IGNORECASE)
+            mark_match = _RE_QUOTE_MARK.search(line)
             if mark_match:
                 current_leg['mark'] = float(mark_match.group(1))
 
-            ask_match = re.search(r'ask:\s*([\d.]+)(?:\s*\(size:\s*([\d.]+)\))?', line, re.IGNORECASE)
+            ask_match = _RE_QUOTE_ASK.search(line)
             if ask_match:
                 current_leg['ask'] = float(ask_match.group(1))
                 if ask_match.group(2):
@@ -1275,20 +1515,7 @@ def parse_block_trade_message(text):
 
     # 保存最后一条腿
     if current_leg:
-        contract_name = current_leg['contract']
-        if 'PERPETUAL' in contract_name.upper() or 'PERP' in contract_name.upper():
-            current_leg['instrument_type'] = 'PERPETUAL'
-            result['non_options_legs'].append(current_leg)
-        elif 'FUTURES' in contract_name.upper() or 'FUT' in contract_name.upper():
-            current_leg['instrument_type'] = 'FUTURES'
-            result['non_options_legs'].append(current_leg)
-        elif re.search(r'-\d+-[PC]$', contract_name):
-            current_leg['instrument_type'] = 'OPTIONS'
-            result['options_legs'].append(current_leg)
-        else:
-            # 未分类的合约（如 BTC-27MAR26，可能是 FUTURES 或 SPOT）
-            current_leg['instrument_type'] = 'FUTURES'
-            result['non_options_legs'].append(current_leg)
+        _append_leg(result, current_leg)
 
     # 如果有多个期权腿，更新 contract 显示
     if len(result['options_legs']) > 1:
@@ -1419,6 +1646,80 @@ def parse_block_trade_message(text):
     return result
 
 
+# 缺失值占位（字面量本身已驻留，这里只是统一引用，避免各处散落的 'N/A'）
+_NA = 'N/A'
+
+# 卡片展示的希腊值字段（顺序即展示顺序）
+_GREEK_KEYS = ('delta', 'gamma', 'vega', 'theta', 'rho')
+
+
+@functools.lru_cache(maxsize=4096)
+def _classify_leg_contract(contract_name):
+    """
+    根据合约名判断腿的 instrument_type（PERPETUAL / FUTURES / OPTIONS）
+
+    合约名在不同消息间大量重复，按名称缓存（'PERP' 已覆盖 'PERPETUAL'，'FUT' 已覆盖 'FUTURES'）
+    """
+    name_upper = contract_name.upper()
+    if 'PERP' in name_upper:
+        return 'PERPETUAL'
+    if 'FUT' in name_upper:
+        return 'FUTURES'
+    if _RE_OPTION_SUFFIX.search(contract_name):  # 以 -数字-P/C 结尾
+        return 'OPTIONS'
+    # 未分类的合约（如 BTC-27MAR26，可能是 FUTURES 或 SPOT）
+    return 'FUTURES'
+
+
+def _append_leg(result, leg):
+    """写入腿的 instrument_type 并归入 options_legs / non_options_legs"""
+    instrument_type = _classify_leg_contract(leg['contract'])
+    leg['instrument_type'] = instrument_type
+    if instrument_type == 'OPTIONS':
+        result['options_legs'].append(leg)
+    else:
+        result['non_options_legs'].append(leg)
+
+
+def _format_greek(value):
+    """格式化希腊值（处理大数和None）"""
+    if value is None:
+        return _NA
+    if abs(value) >= 1000:
+        return f"{value:,.0f}"  # 大数不显示小数
+    else:
+        return f"{value:.2f}"
+
+
+# 交易卡片模板（模块级静态字符串，每张卡片只做一次 format_map，输出与原 f-string 逐字节一致）
+_GREEKS_TMPL = """
+        <div class="greeks-inline">
+            <span class="greek-tag">Δ: {delta}</span>
+            <span class="greek-tag">Γ: {gamma}</span>
+            <span class="greek-tag">ν: {vega}</span>
+            <span class="greek-tag">Θ: {theta}</span>
+            <span class="greek-tag">ρ: {rho}</span>
+        </div>
+        """
+
+_TRADE_CARD_TMPL = """
+        <div class="trade-card">
+            <div class="trade-header">#{rank} - {date}{also_in_html}</div>
+            <table>
+                <tr><td><strong>交易策略:</strong></td><td>{strategy_display}</td></tr>
+                {sort_value_html}
+                {contract_html}
+                <tr><td><strong>价格:</strong></td><td>{price_display}</td></tr>
+                <tr><td><strong>IV:</strong></td><td>{iv}</td></tr>
+            </table>
+            <div style="margin-top: 10px;">
+                <strong>希腊字母:</strong>
+                {greeks_html}
+            </div>
+        </div>
+        """
+
+
 def build_trade_card_html(trades, title, sort_type):
     """
     构建交易卡片 HTML
@@ -1439,30 +1740,13 @@ def build_trade_card_html(trades, title, sort_type):
     if not trades:
         return f"<h3>{title}</h3><p>暂无数据</p>"
 
-    html = f"<h3>{title}</h3>"
+    parts = [f"<h3>{title}</h3>"]
 
     # ✅ 修正：使用enumerate直接获取正确的排名（1, 2, 3），不依赖trade['rank']
     for rank, trade in enumerate(trades, 1):
         # ⚠️ 修正：Greeks改为紧凑横排显示（单行，类似标签）
-        def format_greek(value):
-            """格式化希腊值（处理大数和None）"""
-            if value is None:
-                return 'N/A'
-            if abs(value) >= 1000:
-                return f"{value:,.0f}"  # 大数不显示小数
-            else:
-                return f"{value:.2f}"
-
-        greeks = trade.get('greeks', {})
-        greeks_html = f"""
-        <div class="greeks-inline">
-            <span class="greek-tag">Δ: {format_greek(greeks.get('delta'))}</span>
-            <span class="greek-tag">Γ: {format_greek(greeks.get('gamma'))}</span>
-            <span class="greek-tag">ν: {format_greek(greeks.get('vega'))}</span>
-            <span class="greek-tag">Θ: {format_greek(greeks.get('theta'))}</span>
-            <span class="greek-tag">ρ: {format_greek(greeks.get('rho'))}</span>
-        </div>
-        """
+        greeks = trade.get('greeks') or {}
+        greeks_html = _GREEKS_TMPL.format_map({k: _format_greek(greeks.get(k)) for k in _GREEK_KEYS})
 
         # 排序指标高亮显示（注释：字段语义已明确）
         if sort_type == 'amount':
@@ -1477,14 +1761,16 @@ def build_trade_card_html(trades, title, sort_type):
 
         # ⚠️ 修正：支持多腿显示（显示完整信息）
         options_legs = trade.get('options_legs', [])
-        non_options_legs = trade.get('non_options_legs', [])
 
         # 合约字段：单腿显示合约名，多腿显示"合约（X腿）"并列出每条腿的详细信息
+        contract_html = f'<tr><td><strong>合约:</strong></td><td>{trade["contract"]}</td></tr>'
         if len(options_legs) > 1:
-            contract_html = f'<tr><td><strong>合约:</strong></td><td>{trade["contract"]}</td></tr>'
-            contract_html += '<tr><td colspan="2">'
-            contract_html += '<div style="background: #fef3c7; border-left: 3px solid #f59e0b; padding: 8px; margin: 5px 0; border-radius: 4px;">'
-            contract_html += '<strong>期权腿详情:</strong><ul style="margin: 5px 0 0 0; padding-left: 20px; list-style: none;">'
+            contract_parts = [
+                contract_html,
+                '<tr><td colspan="2">',
+                '<div style="background: #fef3c7; border-left: 3px solid #f59e0b; padding: 8px; margin: 5px 0; border-radius: 4px;">',
+                '<strong>期权腿详情:</strong><ul style="margin: 5px 0 0 0; padding-left: 20px; list-style: none;">',
+            ]
             for i, leg in enumerate(options_legs, 1):
                 side_icon = '🟢' if leg.get('side') == 'LONG' else '🔴'
                 leg_volume = leg.get('volume', 0)
@@ -1493,28 +1779,23 @@ def build_trade_card_html(trades, title, sort_type):
                 leg_total_usd = leg.get('total_usd', 0)
                 leg_iv = leg.get('iv', 0)
 
-                leg_html = f'<li style="margin: 4px 0; font-size: 12px; line-height: 1.6;">'
-                leg_html += f'{side_icon} <strong>腿{i}:</strong> {leg.get("side", "?")} {leg_volume:.0f}x {leg_contract}'
+                contract_parts.append('<li style="margin: 4px 0; font-size: 12px; line-height: 1.6;">')
+                contract_parts.append(f'{side_icon} <strong>腿{i}:</strong> {leg.get("side", "?")} {leg_volume:.0f}x {leg_contract}')
 
                 # 添加价格和总金额信息
                 if leg_price_btc:
-                    leg_html += f' @ {leg_price_btc:.4f} ₿'
+                    contract_parts.append(f' @ {leg_price_btc:.4f} ₿')
                 if leg_total_usd:
-                    leg_html += f' (${leg_total_usd:,.0f})'
+                    contract_parts.append(f' (${leg_total_usd:,.0f})')
 
                 # 添加IV信息
                 if leg_iv:
-                    leg_html += f', IV: {leg_iv:.2f}%'
-
-                leg_html += '</li>'
-                contract_html += leg_html
+                    contract_parts.append(f', IV: {leg_iv:.2f}%')
 
-            contract_html += '</ul></div></td></tr>'
-        else:
-            contract_html = f'<tr><td><strong>合约:</strong></td><td>{trade["contract"]}</td></tr>'
+                contract_parts.append('</li>')
 
-        # price字段：单腿每张价格
-        price_display = trade.get('price', 'Unknown')
+            contract_parts.append('</ul></div></td></tr>')
+            contract_html = ''.join(contract_parts)
 
         # ⚠️ 新增：ALSO_IN 标签显示
         also_in_tag = trade.get('also_in')
@@ -1522,178 +1803,135 @@ def build_trade_card_html(trades, title, sort_type):
         if also_in_tag:
             also_in_html = f'<span style="display: inline-block; background: #3498db; color: white; padding: 2px 8px; border-radius: 3px; font-size: 11px; margin-left: 10px;">{also_in_tag}</span>'
 
-        html += f"""
-        <div class="trade-card">
-            <div class="trade-header">#{rank} - {trade['date']}{also_in_html}</div>
-            <table>
-                <tr><td><strong>交易策略:</strong></td><td>{strategy_display}</td></tr>
-                {sort_value_html}
-                {contract_html}
-                <tr><td><strong>价格:</strong></td><td>{price_display}</td></tr>
-                <tr><td><strong>IV:</strong></td><td>{trade['iv']}</td></tr>
-            </table>
-            <div style="margin-top: 10px;">
-                <strong>希腊字母:</strong>
-                {greeks_html}
-            </div>
-        </div>
-        """
+        parts.append(_TRADE_CARD_TMPL.format_map({
+            'rank': rank,
+            'date': trade['date'],
+            'also_in_html': also_in_html,
+            'strategy_display': strategy_display,
+            'sort_value_html': sort_value_html,
+            'contract_html': contract_html,
+            # price字段：单腿每张价格
+            'price_display': trade.get('price', 'Unknown'),
+            'iv': trade['iv'],
+            'greeks_html': greeks_html,
+        }))
 
-    return html
+    return ''.join(parts)
 
 
-def build_daily_report_html(report_data):
-    """
-    构建每日报告 HTML 内容
-
-    ⚠️ 修正：添加 ALSO_IN 交叉引用标签
+def _format_spot_usd(price):
+    """现货价格展示（$1,234.56），缺失时为 N/A"""
+    return _NA if price is None else f"${price:,.2f}"
 
-    Args:
-        report_data: 报告数据字典
 
-    Returns:
-        HTML 字符串
+def _add_also_in_tags(trades_by_amount, trades_by_volume):
     """
-    time_range = report_data['time_range']
-    spot_prices = report_data['spot_prices']
-    stats = report_data['trade_statistics']
-    top_trades = report_data['top_trades']
+    为同时出现在两个榜单的交易添加 ALSO_IN 标签
 
-    # ⚠️ 新增：为交易添加 ALSO_IN 标签（检测同时出现在两个榜单的交易）
-    def add_also_in_tags(trades_by_amount, trades_by_volume):
-        """
-        为同时出现在两个榜单的交易添加 ALSO_IN 标签
+    Args:
+        trades_by_amount: 按金额排名的交易列表
+        trades_by_volume: 按数量排名的交易列表
+    """
+    # 构建 msg_id -> rank 映射（按列表位置，不读 trade['rank']：旧报告数据/共享 dict 的 rank 不一定对应本榜单）
+    amount_map = {t['msg_id']: i for i, t in enumerate(trades_by_amount, 1)}
+    volume_map = {t['msg_id']: i for i, t in enumerate(trades_by_volume, 1)}
 
-        Args:
-            trades_by_amount: 按金额排名的交易列表
-            trades_by_volume: 按数量排名的交易列表
-        """
-        # 构建 msg_id -> rank 映射
-        amount_map = {t['msg_id']: i+1 for i, t in enumerate(trades_by_amount)}
-        volume_map = {t['msg_id']: i+1 for i, t in enumerate(trades_by_volume)}
-
-        # 为 amount 榜单添加标签
-        for trade in trades_by_amount:
-            msg_id = trade['msg_id']
-            if msg_id in volume_map:
-                volume_rank = volume_map[msg_id]
-                trade['also_in'] = f"[ALSO_IN: VOLUME #{volume_rank}]"
-            else:
-                trade['also_in'] = None
-
-        # 为 volume 榜单添加标签
-        for trade in trades_by_volume:
-            msg_id = trade['msg_id']
-            if msg_id in amount_map:
-                amount_rank = amount_map[msg_id]
-                trade['also_in'] = f"[ALSO_IN: AMOUNT #{amount_rank}]"
-            else:
-                trade['also_in'] = None
+    # 每条交易只查一次映射，查找和分支合并为一个表达式
+    for trade in trades_by_amount:
+        trade['also_in'] = f"[ALSO_IN: VOLUME #{rank}]" if (rank := volume_map.get(trade['msg_id'])) else None
+    for trade in trades_by_volume:
+        trade['also_in'] = f"[ALSO_IN: AMOUNT #{rank}]" if (rank := amount_map.get(trade['msg_id'])) else None
 
-    # 处理 BTC 和 ETH 的交叉引用
-    add_also_in_tags(
-        top_trades.get('btc_by_amount', []),
-        top_trades.get('btc_by_volume', [])
-    )
-    add_also_in_tags(
-        top_trades.get('eth_by_amount', []),
-        top_trades.get('eth_by_volume', [])
-    )
 
-    html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <style>
-            body {{
+# 每日报告（v1）HTML 骨架：CSS 原样存放（无需 {{ }} 转义），骨架只含单花括号占位符，每份报告 format_map 一次
+_REPORT_CSS = """            body {
                 font-family: Arial, sans-serif;
                 line-height: 1.6;
                 color: #333;
                 max-width: 800px;
                 margin: 0 auto;
                 padding: 20px;
-            }}
-            h1 {{
+            }
+            h1 {
                 color: #2c3e50;
                 border-bottom: 3px solid #3498db;
                 padding-bottom: 10px;
-            }}
-            h2 {{
+            }
+            h2 {
                 color: #34495e;
                 margin-top: 30px;
-            }}
-            .section {{
+            }
+            .section {
                 background: #f8f9fa;
                 padding: 15px;
                 border-radius: 5px;
                 margin: 15px 0;
-            }}
-            .stats {{
+            }
+            .stats {
                 display: flex;
                 justify-content: space-around;
                 margin: 20px 0;
-            }}
-            .stat-box {{
+            }
+            .stat-box {
                 text-align: center;
                 padding: 15px;
                 background: white;
                 border-radius: 5px;
                 box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-            }}
-            .stat-number {{
+            }
+            .stat-number {
                 font-size: 32px;
                 font-weight: bold;
                 color: #3498db;
-            }}
-            .stat-label {{
+            }
+            .stat-label {
                 font-size: 14px;
                 color: #7f8c8d;
-            }}
-            table {{
+            }
+            table {
                 width: 100%;
                 border-collapse: collapse;
                 margin: 15px 0;
-            }}
-            th, td {{
+            }
+            th, td {
                 padding: 10px;
                 text-align: left;
                 border-bottom: 1px solid #ddd;
-            }}
-            th {{
+            }
+            th {
                 background-color: #3498db;
                 color: white;
-            }}
-            .trade-card {{
+            }
+            .trade-card {
                 background: white;
                 padding: 15px;
                 margin: 15px 0;
                 border-left: 4px solid #e74c3c;
                 box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-            }}
-            .trade-header {{
+            }
+            .trade-header {
                 font-size: 18px;
                 font-weight: bold;
                 color: #e74c3c;
                 margin-bottom: 10px;
-            }}
-            .greeks {{
+            }
+            .greeks {
                 display: grid;
                 grid-template-columns: repeat(5, 1fr);
                 gap: 10px;
                 margin-top: 10px;
-            }}
-            .greek-item {{
+            }
+            .greek-item {
                 text-align: center;
-            }}
+            }
             /* ⚠️ 新增：Greeks横排紧凑显示 */
-            .greeks-inline {{
+            .greeks-inline {
                 display: flex;
                 flex-wrap: wrap;
                 gap: 8px;
                 margin-top: 5px;
-            }}
-            .greek-tag {{
+            }
+            .greek-tag {
                 display: inline-block;
                 padding: 4px 10px;
                 background: #ecf0f1;
@@ -1703,7 +1941,15 @@ def build_daily_report_html(report_data):
                 padding: 8px;
                 background: #ecf0f1;
                 border-radius: 3px;
-            }}
+            }"""
+
+_REPORT_SKELETON = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <style>
+{css}
         </style>
     </head>
     <body>
@@ -1711,20 +1957,20 @@ def build_daily_report_html(report_data):
 
         <div class="section">
             <h2>📅 1. 统计时间范围</h2>
-            <p><strong>开始时间:</strong> {time_range['start']}</p>
-            <p><strong>结束时间:</strong> {time_range['end']}</p>
-            <p><strong>时区:</strong> {time_range['timezone']}</p>
+            <p><strong>开始时间:</strong> {time_start}</p>
+            <p><strong>结束时间:</strong> {time_end}</p>
+            <p><strong>时区:</strong> {timezone}</p>
         </div>
 
         <div class="section">
             <h2>💰 2. 当日关键市场指标</h2>
             <div class="stats">
                 <div class="stat-box">
-                    <div class="stat-number">{'${:,.2f}'.format(spot_prices['btc']) if spot_prices['btc'] is not None else 'N/A'}</div>
+                    <div class="stat-number">{btc_price}</div>
                     <div class="stat-label">BTC 现货价格</div>
                 </div>
                 <div class="stat-box">
-                    <div class="stat-number">{'${:,.2f}'.format(spot_prices['eth']) if spot_prices['eth'] is not None else 'N/A'}</div>
+                    <div class="stat-number">{eth_price}</div>
                     <div class="stat-label">ETH 现货价格</div>
                 </div>
             </div>
@@ -1734,15 +1980,15 @@ def build_daily_report_html(report_data):
             <h2>📈 3. 大宗交易统计</h2>
             <div class="stats">
                 <div class="stat-box">
-                    <div class="stat-number">{stats['total']}</div>
+                    <div class="stat-number">{total_count}</div>
                     <div class="stat-label">总笔数</div>
                 </div>
                 <div class="stat-box">
-                    <div class="stat-number">{stats['btc_count']}</div>
+                    <div class="stat-number">{btc_count}</div>
                     <div class="stat-label">BTC 笔数</div>
                 </div>
                 <div class="stat-box">
-                    <div class="stat-number">{stats['eth_count']}</div>
+                    <div class="stat-number">{eth_count}</div>
                     <div class="stat-label">ETH 笔数</div>
                 </div>
             </div>
@@ -1756,11 +2002,11 @@ def build_daily_report_html(report_data):
                 <h2 style="color: #f39c12;">🔶 BTC 交易</h2>
 
                 <div style="margin: 20px 0;">
-                    """ + build_trade_card_html(top_trades.get('btc_by_amount', []), "💰 按金额排名 Top 3", "amount") + """
+                    {btc_cards_amount}
                 </div>
 
                 <div style="margin: 20px 0;">
-                    """ + build_trade_card_html(top_trades.get('btc_by_volume', []), "📦 按数量排名 Top 3", "volume") + """
+                    {btc_cards_volume}
                 </div>
             </div>
 
@@ -1769,28 +2015,68 @@ def build_daily_report_html(report_data):
                 <h2 style="color: #627eea;">🔷 ETH 交易</h2>
 
                 <div style="margin: 20px 0;">
-                    """ + build_trade_card_html(top_trades.get('eth_by_amount', []), "💰 按金额排名 Top 3", "amount") + """
+                    {eth_cards_amount}
                 </div>
 
                 <div style="margin: 20px 0;">
-                    """ + build_trade_card_html(top_trades.get('eth_by_volume', []), "📦 按数量排名 Top 3", "volume") + """
+                    {eth_cards_volume}
                 </div>
             </div>
-    """
-
-    html += """
+    
         </div>
 
         <hr>
         <p style="text-align: center; color: #7f8c8d; font-size: 12px;">
             此报告由 Telegram 数据采集系统自动生成<br>
-            生成时间: """ + report_data['generated_at'] + """
+            生成时间: {generated_at}
         </p>
     </body>
     </html>
     """
 
-    return html
+
+def build_daily_report_html(report_data):
+    """
+    构建每日报告 HTML 内容
+
+    ⚠️ 修正：添加 ALSO_IN 交叉引用标签
+
+    Args:
+        report_data: 报告数据字典
+
+    Returns:
+        HTML 字符串（一次性返回完整字符串，不做分块生成：html_content 要整体写入 DailyReport、
+        作为 MIMEText 正文发送，落盘时也是一次 encode 后整体写入，分块输出只会在调用方重新拼接）
+    """
+    time_range = report_data['time_range']
+    spot_prices = report_data['spot_prices']
+    stats = report_data['trade_statistics']
+    top_trades = report_data['top_trades']
+    btc_by_amount = top_trades.get('btc_by_amount', [])
+    btc_by_volume = top_trades.get('btc_by_volume', [])
+    eth_by_amount = top_trades.get('eth_by_amount', [])
+    eth_by_volume = top_trades.get('eth_by_volume', [])
+
+    # ⚠️ 新增：为交易添加 ALSO_IN 标签（检测同时出现在两个榜单的交易），处理 BTC 和 ETH 的交叉引用
+    _add_also_in_tags(btc_by_amount, btc_by_volume)
+    _add_also_in_tags(eth_by_amount, eth_by_volume)
+
+    return _REPORT_SKELETON.format_map({
+        'css': _REPORT_CSS,
+        'time_start': time_range['start'],
+        'time_end': time_range['end'],
+        'timezone': time_range['timezone'],
+        'btc_price': _format_spot_usd(spot_prices['btc']),
+        'eth_price': _format_spot_usd(spot_prices['eth']),
+        'total_count': stats['total'],
+        'btc_count': stats['btc_count'],
+        'eth_count': stats['eth_count'],
+        'btc_cards_amount': build_trade_card_html(btc_by_amount, "💰 按金额排名 Top 3", "amount"),
+        'btc_cards_volume': build_trade_card_html(btc_by_volume, "📦 按数量排名 Top 3", "volume"),
+        'eth_cards_amount': build_trade_card_html(eth_by_amount, "💰 按金额排名 Top 3", "amount"),
+        'eth_cards_volume': build_trade_card_html(eth_by_volume, "📦 按数量排名 Top 3", "volume"),
+        'generated_at': report_data['generated_at'],
+    })
 
 
 async def send_daily_report_email(html_content, report_data):
@@ -1813,15 +2099,15 @@ async def send_daily_report_email(html_content, report_data):
         print(f"  [跳过] 邮件发送未启用（EMAIL_ENABLED=false）")
 
         # 保存 HTML 到本地文件（用于测试）
-        import os
         output_dir = os.path.join(os.path.dirname(__file__), 'reports')
         os.makedirs(output_dir, exist_ok=True)
 
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         output_file = os.path.join(output_dir, f'daily_report_{timestamp}.html')
 
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+        # 一次性编码后按字节写入（跳过文本层的增量编码器和缓冲拷贝）
+        with open(output_file, 'wb') as f:
+            f.write(html_content.encode('utf-8'))
 
         print(f"  ✓ 报告已保存到: {output_file}")
 
@@ -1842,10 +2128,10 @@ def send_existing_report_fast(report_date: str):
         True: 发送成功
         False: 发送失败
     """
+    # email_sender 顶层 import 了本模块（parse_block_trade_message），只能在函数内延迟导入，避免循环导入
     from email_sender import send_html_email
-    import json
 
-    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [FAST_TEST] start date={report_date}")
+    print(f"[{_ts()}] [FAST_TEST] start date={report_date}")
 
     session = get_session()
     try:
@@ -1853,30 +2139,29 @@ def send_existing_report_fast(report_date: str):
         report = session.query(DailyReport).filter_by(report_date=report_date).first()
 
         if report:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [FAST_TEST] db_report_found=true has_html={report.html_content is not None and len(report.html_content or '') > 0}")
+            print(f"[{_ts()}] [FAST_TEST] db_report_found=true has_html={report.html_content is not None and len(report.html_content or '') > 0}")
 
             # 情况1：已有 html_content（最快路径）
             if report.html_content and len(report.html_content) > 0:
                 html_content = report.html_content
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [FAST_TEST] mode=existing_html")
+                print(f"[{_ts()}] [FAST_TEST] mode=existing_html")
 
             # 情况2：有 report_data，需要渲染
             elif report.report_data:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [FAST_TEST] mode=render_from_report_data")
-                report_data = json.loads(report.report_data)
+                print(f"[{_ts()}] [FAST_TEST] mode=render_from_report_data")
+                report_data = _loads_report_data(report.report_data)
                 html_content = render_report_html(report_data)
 
             else:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [FAST_TEST] error='report exists but no html_content or report_data'")
+                print(f"[{_ts()}] [FAST_TEST] error='report exists but no html_content or report_data'")
                 return False
 
         else:
             # 情况3：不存在，需要生成（兜底，只执行一次）
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [FAST_TEST] db_report_found=false mode=generated_then_send")
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [FAST_TEST] generating_report date={report_date}")
+            print(f"[{_ts()}] [FAST_TEST] db_report_found=false mode=generated_then_send")
+            print(f"[{_ts()}] [FAST_TEST] generating_report date={report_date}")
 
             # 异步生成日报
-            import asyncio
             report_data = asyncio.run(generate_daily_report(target_date=report_date))
 
             # 重新查询获取生成的报告（注意：report_date 可能是 start_date 的日期）
@@ -1884,34 +2169,33 @@ def send_existing_report_fast(report_date: str):
             report = session.query(DailyReport).filter_by(report_date=report_date).first()
             if not report:
                 # 尝试前一天
-                from datetime import date, timedelta
                 prev_date = (datetime.strptime(report_date, '%Y-%m-%d').date() - timedelta(days=1)).strftime('%Y-%m-%d')
                 report = session.query(DailyReport).filter_by(report_date=prev_date).first()
                 if report:
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [FAST_TEST] using_prev_date actual_report_date={prev_date}")
+                    print(f"[{_ts()}] [FAST_TEST] using_prev_date actual_report_date={prev_date}")
 
             if not report or not report.html_content:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [FAST_TEST] error='report generation failed or html_content empty'")
+                print(f"[{_ts()}] [FAST_TEST] error='report generation failed or html_content empty'")
                 return False
 
             html_content = report.html_content
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [FAST_TEST] generation_complete")
+            print(f"[{_ts()}] [FAST_TEST] generation_complete")
 
         # 步骤2：发送邮件
         subject = f"🧪 TEST Daily Report - {report_date} (From DB)"
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [FAST_TEST] sending_email subject='{subject}'")
+        print(f"[{_ts()}] [FAST_TEST] sending_email subject='{subject}'")
 
         success = send_html_email(subject, html_content)
 
         if success:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [FAST_TEST] email_sent=true")
+            print(f"[{_ts()}] [FAST_TEST] email_sent=true")
         else:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [FAST_TEST] email_sent=false")
+            print(f"[{_ts()}] [FAST_TEST] email_sent=false")
 
         return success
 
     except Exception as e:
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [FAST_TEST] error={e}")
+        print(f"[{_ts()}] [FAST_TEST] error={e}")
         import traceback
         traceback.print_exc()
         return False
@@ -1932,8 +2216,6 @@ async def send_pending_daily_reports(limit: int = None):
     Args:
         limit: 保留参数（兼容性），实际已改为"最多发送1封最新日报"
     """
-    import time
-    from sqlalchemy import desc
     session = get_session()
 
     try:
@@ -1948,7 +2230,7 @@ async def send_pending_daily_reports(limit: int = None):
         )
 
         if not latest_pending_report:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [REPORT_SEND] mode=latest_only action=skip reason=no_pending")
+            print(f"[{_ts()}] [REPORT_SEND] mode=latest_only action=skip reason=no_pending")
             return
 
         latest_date = latest_pending_report.report_date
@@ -1957,53 +2239,56 @@ async def send_pending_daily_reports(limit: int = None):
         # ==========================================
         # B) 统计历史未发送日报（backlog）
         # ==========================================
-        backlog_reports = (
-            session.query(DailyReport)
+        # 只取 COUNT/MIN/MAX 聚合（一行结果），不加载整行（html_content/report_data 每行数 KB）
+        backlog_count, oldest_backlog, newest_backlog = (
+            session.query(
+                func.count(DailyReport.id),
+                func.min(DailyReport.report_date),
+                func.max(DailyReport.report_date)
+            )
             .filter(DailyReport.is_sent == False)
             .filter(DailyReport.report_date < latest_date)
-            .order_by(DailyReport.report_date)
-            .all()
+            .one()
         )
 
-        backlog_count = len(backlog_reports)
-        oldest_backlog = backlog_reports[0].report_date if backlog_reports else None
-        newest_backlog = backlog_reports[-1].report_date if backlog_reports else None
-
         # 结构化日志：候选日报信息
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [REPORT_SEND] mode=latest_only report_date={latest_date} candidate_sent={candidate_sent} pending_old={backlog_count}")
+        ts = _ts()
+        print(f"[{ts}] [REPORT_SEND] mode=latest_only report_date={latest_date} candidate_sent={candidate_sent} pending_old={backlog_count}")
 
         # 告警：历史未发送日报
         if backlog_count > 0:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [REPORT_BACKLOG] count={backlog_count} oldest={oldest_backlog} newest={newest_backlog} action=ignored reason=policy_latest_only")
+            print(f"[{ts}] [REPORT_BACKLOG] count={backlog_count} oldest={oldest_backlog} newest={newest_backlog} action=ignored reason=policy_latest_only")
 
         # ==========================================
         # C) 检查候选日报是否已发送（幂等）
         # ==========================================
         if candidate_sent:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [REPORT_SEND] action=skip report_date={latest_date} reason=already_sent")
+            print(f"[{_ts()}] [REPORT_SEND] action=skip report_date={latest_date} reason=already_sent")
             return
 
         # ==========================================
         # D) 检查邮件配置
         # ==========================================
         if not config.EMAIL_ENABLED:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [REPORT_SEND] action=skip report_date={latest_date} reason=email_disabled")
+            print(f"[{_ts()}] [REPORT_SEND] action=skip report_date={latest_date} reason=email_disabled")
             return
 
         # ==========================================
         # E) 发送最新日报（带幂等保障）
         # ==========================================
+        # 延迟导入：避免与 email_sender 循环导入
         from email_sender import send_html_email, send_email
 
         try:
             subject = f"📊 Daily Trade Report - {latest_pending_report.report_date}"
 
             # 发送前日志（标记开始发送）
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [REPORT_SEND] action=sending report_date={latest_date} subject='{subject[:50]}' recipients={config.EMAIL_RECIPIENTS}")
+            print(f"[{_ts()}] [REPORT_SEND] action=sending report_date={latest_date} subject='{subject[:50]}' recipients={config.EMAIL_RECIPIENTS}")
 
-            # 发送邮件
+            # 发送邮件（SMTP 往返是阻塞 I/O，放到线程池执行，不卡住调度器/监听器共用的事件循环）
+            loop = asyncio.get_running_loop()
             if latest_pending_report.html_content:
-                success = send_html_email(subject, latest_pending_report.html_content)
+                success = await loop.run_in_executor(None, send_html_email, subject, latest_pending_report.html_content)
             else:
                 fallback_body = f"""Daily Trade Report - {latest_pending_report.report_date}
 
@@ -2011,37 +2296,45 @@ BTC: {latest_pending_report.btc_trade_count} 笔, {latest_pending_report.btc_tot
 ETH: {latest_pending_report.eth_trade_count} 笔, {latest_pending_report.eth_total_volume}x
 Total: {latest_pending_report.total_messages} 条消息, {latest_pending_report.total_block_trades} 笔交易
 """
-                success = send_email(subject, fallback_body)
+                success = await loop.run_in_executor(None, send_email, subject, fallback_body)
 
             # ==========================================
             # F) 原子更新发送状态（幂等保障）
             # ==========================================
             if success:
                 try:
-                    # 原子更新：is_sent + sent_at
-                    latest_pending_report.is_sent = True
-                    latest_pending_report.sent_at = datetime.utcnow()
-                    session.flush()
+                    # 原子更新：is_sent + sent_at（单条 UPDATE ... WHERE is_sent=0，一次提交，不走 ORM flush）
+                    sent_at = datetime.utcnow()
+                    updated = (
+                        session.query(DailyReport)
+                        .filter(DailyReport.id == latest_pending_report.id)
+                        .filter(DailyReport.is_sent == False)
+                        .update({'is_sent': True, 'sent_at': sent_at}, synchronize_session=False)
+                    )
                     session.commit()
 
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [REPORT_SEND] action=sent report_date={latest_date} sent_at={latest_pending_report.sent_at.strftime('%Y-%m-%d %H:%M:%S')}")
+                    if updated:
+                        print(f"[{_ts()}] [REPORT_SEND] action=sent report_date={latest_date} sent_at={sent_at.strftime('%Y-%m-%d %H:%M:%S')}")
+                    else:
+                        # 发送期间已被其他进程标记为已发送
+                        print(f"[{_ts()}] [REPORT_SEND] action=sent report_date={latest_date} sent_at={sent_at.strftime('%Y-%m-%d %H:%M:%S')} note=already_marked")
 
                 except Exception as commit_err:
                     session.rollback()
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [REPORT_SEND] action=commit_failed report_date={latest_date} error={type(commit_err).__name__}: {commit_err}")
+                    print(f"[{_ts()}] [REPORT_SEND] action=commit_failed report_date={latest_date} error={type(commit_err).__name__}: {commit_err}")
                     # ⚠️ 发送成功但状态更新失败：下次会重复发送（幂等风险）
                     raise
 
             else:
                 # 发送失败：保持 is_sent=False，记录错误日志
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [REPORT_SEND] action=send_failed report_date={latest_date} reason=email_send_failed")
+                print(f"[{_ts()}] [REPORT_SEND] action=send_failed report_date={latest_date} reason=email_send_failed")
 
         except Exception as send_err:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [REPORT_SEND] action=exception report_date={latest_date} error={type(send_err).__name__}: {send_err}")
+            print(f"[{_ts()}] [REPORT_SEND] action=exception report_date={latest_date} error={type(send_err).__name__}: {send_err}")
             raise
 
     except Exception as e:
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [REPORT_SEND] action=error error={type(e).__name__}: {e}")
+        print(f"[{_ts()}] [REPORT_SEND] action=error error={type(e).__name__}: {e}")
         import traceback
         traceback.print_exc()
 
@@ -2049,11 +2342,280 @@ Total: {latest_pending_report.total_messages} 条消息, {latest_pending_report.
         session.close()
 
 
-if __name__ == '__main__':
-    """测试报告生成和发送"""
-    import asyncio
+def _cmd_send_existing_report(args):
+    """秒级测试发送：从 DB 读取已有日报快速发送（--send-existing-report）"""
+    report_date = args.send_existing_report
+    print(f"\n" + "=" * 60)
+    print(f"秒级测试发送日报：{report_date}")
+    print("=" * 60)
+
+    success = send_existing_report_fast(report_date)
+
+    print("\n" + "=" * 60)
+    if success:
+        print("✓ 测试邮件发送成功！")
+        print(f"  主题: 🧪 TEST Daily Report - {report_date} (From DB)")
+        print("  请检查邮箱收件")
+    else:
+        print("✗ 测试邮件发送失败")
+    print("=" * 60)
+
+
+def _cmd_verify_db(args):
+    """只读验收：DB health + integrity_check + journal_mode（--verify-db）"""
+    print(f"[{_ts()}] [VERIFY_DB] start")
+
+    conn = None
+    try:
+        # 同进程已初始化过生产库引擎时，从连接池借一条连接（用完 close 即归还池），
+        # 不再另开裸连接；独立 CLI 进程没有引擎，直接只读连接即可（init_database 自带健康检查，更重）
+        engine = database.engines.get('prod')
+        if engine is not None:
+            conn = engine.raw_connection()
+        else:
+            conn = sqlite3.connect(config.DB_PATH, timeout=5)
+        cursor = conn.cursor()
+
+        # integrity_check
+        cursor.execute("PRAGMA integrity_check")
+        result = cursor.fetchone()
+        integrity = result[0] if result else 'FAILED'
+        print(f"[{_ts()}] [VERIFY_DB] integrity_check result={integrity}")
+
+        # journal_mode
+        cursor.execute("PRAGMA journal_mode")
+        result = cursor.fetchone()
+        journal = result[0] if result else 'UNKNOWN'
+        print(f"[{_ts()}] [VERIFY_DB] journal_mode actual={journal}")
+
+        print(f"[{_ts()}] [VERIFY_DB] status=success")
+    except Exception as e:
+        print(f"[{_ts()}] [VERIFY_DB] status=failed error={e}")
+    finally:
+        # 失败时也要关闭（池连接则归还），避免池里泄漏一条连接
+        if conn is not None:
+            conn.close()
+
+    print(f"[{_ts()}] [VERIFY_DB] end")
+
+
+def _cmd_verify(args):
+    """快速验收：DB health + generate 昨天 + send 1 条（--verify）"""
+    print(f"[{_ts()}] [VERIFY] start")
+
+    # 步骤1: DB health
+    try:
+        session = get_session()
+        session.query(DailyReport).limit(1).all()
+        session.close()
+        print(f"[{_ts()}] [VERIFY] db_health status=success")
+    except Exception as e:
+        print(f"[{_ts()}] [VERIFY] db_health status=failed error={e}")
+
+    # 步骤2: 生成昨天日报
+    try:
+        tz = _REPORT_TZ
+        yesterday = datetime.now(tz).date() - timedelta(days=1)
+        asyncio.run(generate_daily_report(target_date=yesterday.strftime('%Y-%m-%d')))
+        print(f"[{_ts()}] [VERIFY] generate status=success")
+    except Exception as e:
+        print(f"[{_ts()}] [VERIFY] generate status=failed error={e}")
+
+    # 步骤3: 发送1条
+    try:
+        asyncio.run(send_pending_daily_reports(limit=1))
+        print(f"[{_ts()}] [VERIFY] send status=success")
+    except Exception as e:
+        print(f"[{_ts()}] [VERIFY] send status=failed error={e}")
+
+    print(f"[{_ts()}] [VERIFY] end")
+
+
+def _cmd_fast_smoke_full(args):
+    """完整闭环 Smoke：生成日报 + 发送 1 条（--fast-smoke-full）"""
+    print(f"[{_ts()}] [SMOKE_FULL] start")
+
+    # 确定日期：优先使用 --date，否则使用昨天
+    if args.date:
+        target = args.date
+    else:
+        tz = _REPORT_TZ
+        yesterday = datetime.now(tz).date() - timedelta(days=1)
+        target = yesterday.strftime('%Y-%m-%d')
+
+    # 步骤1：生成日报
+    try:
+        asyncio.run(generate_daily_report(target_date=target))
+        print(f"[{_ts()}] [SMOKE_FULL] generate status=success")
+    except Exception as e:
+        print(f"[{_ts()}] [SMOKE_FULL] generate status=failed error={e}")
+
+    # 步骤2：发送日报
+    try:
+        asyncio.run(send_pending_daily_reports(limit=1))
+        print(f"[{_ts()}] [SMOKE_FULL] send status=success")
+    except Exception as e:
+        print(f"[{_ts()}] [SMOKE_FULL] send status=failed error={e}")
+
+    print(f"[{_ts()}] [SMOKE_FULL] end")
+
+
+def _cmd_backfill(args):
+    """历史回放（--backfill-start/--backfill-end，带天数和超时限制）"""
+    start = datetime.strptime(args.backfill_start, '%Y-%m-%d').date()
+    end = datetime.strptime(args.backfill_end, '%Y-%m-%d').date()
+
+    total = 0
+    ok = 0
+    failed = 0
+    start_time = time.time()
+
+    current = start
+    while current <= end:
+        # 检查 max-days 限制
+        if total >= args.backfill_max_days:
+            print(f"[{_ts()}] [BACKFILL] stopped reason=max_days_reached limit={args.backfill_max_days}")
+            break
+
+        # 检查 timeout 限制（每天只读一次时钟，同时作为当天计时起点）
+        day_start = time.time()
+        if (day_start - start_time) > args.backfill_timeout_seconds:
+            print(f"[{_ts()}] [BACKFILL] stopped reason=timeout_exceeded limit={args.backfill_timeout_seconds}s")
+            break
+
+        total += 1
+        date_str = current.strftime('%Y-%m-%d')
+
+        try:
+            report_data = asyncio.run(generate_daily_report(target_date=date_str))
+            cost_ms = int((time.time() - day_start) * 1000)
+            ts = _ts()  # 同一天的 status 和 summary 共用一个时间戳
+            print(f"[{ts}] [BACKFILL] date={date_str} status=success cost_ms={cost_ms}")
+
+            # 打印 summary
+            vol = report_data['volume_stats']
+            counts = report_data['counts']
+            top_list = report_data.get('top_trades_list', [])
+            top_asset = top_list[0]['asset'] if top_list else 'N/A'
+            top_exchange = top_list[0]['exchange'] if top_list else 'N/A'
+            print(f"[{ts}] [REPORT_SUMMARY] date={date_str} total={counts['total_messages']} blocks={counts['block_trades']} top_volume={vol['max_volume']:.1f} top_asset={top_asset} top_exchange={top_exchange}")
+
+            ok += 1
+        except Exception as e:
+            cost_ms = int((time.time() - day_start) * 1000)
+            print(f"[{_ts()}] [BACKFILL] date={date_str} status=failed cost_ms={cost_ms} error={e}")
+            failed += 1
+
+        current += timedelta(days=1)
+
+    elapsed_s = int(time.time() - start_time)
+    print(f"[{_ts()}] [BACKFILL] done total={total} ok={ok} failed={failed} elapsed_s={elapsed_s}")
+
+    # 发送（如果没有 --no-send）
+    if not args.no_send:
+        try:
+            asyncio.run(send_pending_daily_reports())
+        except Exception as e:
+            print(f"[{_ts()}] [BACKFILL] send_failed error={e}")
+
+
+def _cmd_fast_smoke(args):
+    """快速 Smoke：DB 连接 + 发送 1 条（--fast-smoke）"""
+    print(f"[{_ts()}] [SMOKE_FAST] start")
+    try:
+        session = get_session()
+        session.query(DailyReport).limit(1).all()
+        session.close()
+        asyncio.run(send_pending_daily_reports(limit=1))
+    except Exception as e:
+        print(f"[{_ts()}] [SMOKE_FAST] error={e}")
+    print(f"[{_ts()}] [SMOKE_FAST] end")
+
+
+def _cmd_smoke(args):
+    """Smoke 测试：生成 + 发送，全程捕获异常不崩溃（--smoke）"""
+    tz = _REPORT_TZ
+    test_time = datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S %Z')
+
+    print("\n" + "=" * 60)
+    print("🧪 SMOKE TEST: 生成 + 发送")
+    print("=" * 60)
+    print(f"测试时间: {test_time}")
+    if args.date:
+        print(f"指定日期: {args.date}")
+    print("=" * 60)
+
+    # 步骤1：生成日报
+    try:
+        print("\n[SMOKE] step=generate status=running")
+        asyncio.run(generate_daily_report())
+        print("[SMOKE] step=generate status=success")
+    except Exception as e:
+        print(f"[SMOKE] step=generate status=failed error={e}")
+
+    # 步骤2：发送日报
+    try:
+        print("\n[SMOKE] step=send status=running")
+        asyncio.run(send_pending_daily_reports())
+        print("[SMOKE] step=send status=success")
+    except Exception as e:
+        print(f"[SMOKE] step=send status=failed error={e}")
+
+    print("\n[SMOKE] end")
+
+
+def _cmd_test_send_daily(args):
+    """测试完整链路：生成日报 + 发送邮件（--test-send-daily）"""
+    tz = _REPORT_TZ
+    test_time = datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S %Z')
+
+    print("\n" + "=" * 60)
+    print("📊 测试日报完整链路：生成 + 发送")
+    print("=" * 60)
+    print(f"测试时间: {test_time}")
+    if args.date:
+        print(f"指定日期: {args.date}")
+    print("=" * 60)
+
+    # 步骤1：生成日报
+    print("\n[步骤 1/2] 生成日报...")
+    print("-" * 60)
+    asyncio.run(generate_daily_report())
+
+    # 步骤2：发送日报
+    print("\n[步骤 2/2] 发送日报邮件...")
+    print("-" * 60)
+    asyncio.run(send_pending_daily_reports())
+
+    print("\n" + "=" * 60)
+    print("✓ 测试完成！")
+    print("=" * 60)
+    print("\n📧 请检查邮箱收件（如 EMAIL_ENABLED=true）")
+    print("💡 提示: 如需查看数据库状态，运行: python db_manager.py stats")
+
+
+def _cmd_generate_only(args):
+    """默认：仅生成日报（不发送邮件）"""
+    print("\n仅生成日报（不发送邮件）...")
+    asyncio.run(generate_daily_report())
+
+
+# CLI 命令分发表：按顺序匹配第一个命中的命令执行（顺序即原优先级），都不命中时只生成日报
+_CLI_COMMANDS = [
+    (lambda args: args.send_existing_report, _cmd_send_existing_report),
+    (lambda args: args.verify_db, _cmd_verify_db),
+    (lambda args: args.verify, _cmd_verify),
+    (lambda args: args.fast_smoke_full, _cmd_fast_smoke_full),
+    (lambda args: args.backfill_start and args.backfill_end, _cmd_backfill),
+    (lambda args: args.fast_smoke, _cmd_fast_smoke),
+    (lambda args: args.smoke, _cmd_smoke),
+    (lambda args: args.test_send_daily, _cmd_test_send_daily),
+]
+
+
+def _build_arg_parser():
+    """构建 CLI 参数解析器"""
     import argparse
-    import sys
 
     parser = argparse.ArgumentParser(
         description='日报生成和发送测试工具',
@@ -2072,13 +2634,15 @@ if __name__ == '__main__':
     )
 
     parser.add_argument('--test-send-daily', action='store_true',
-                       help='测试完整链路：生成日报 + 发送邮件')
+                       help='测试完整链路：生成日报 + 发送邮件（当天数据和模板都未变化时跳过重新生成、不会重新入队，'
+                            '已发送过的日报不会再发；重发请用 --send-existing-report）')
     parser.add_argument('--smoke', action='store_true',
                        help='Smoke测试：生成 + 发送，全程捕获异常不崩溃')
     parser.add_argument('--fast-smoke', action='store_true',
                        help='快速Smoke：仅DB连接+发送1条（<10s）')
     parser.add_argument('--fast-smoke-full', action='store_true',
-                       help='完整闭环Smoke：生成昨天日报+发送1条（<30s）')
+                       help='完整闭环Smoke：生成昨天日报+发送1条（<30s；数据和模板都未变化时跳过重新生成、不会重新入队，'
+                            '日报已发送过则不会再发）')
     parser.add_argument('--backfill-start', type=str,
                        help='历史回放起始日期 (格式: YYYY-MM-DD)')
     parser.add_argument('--backfill-end', type=str,
@@ -2090,7 +2654,8 @@ if __name__ == '__main__':
     parser.add_argument('--no-send', action='store_true',
                        help='只生成不发送（配合 backfill 使用）')
     parser.add_argument('--verify', action='store_true',
-                       help='快速验收：DB health + generate昨天 + send 1条（<15s）')
+                       help='快速验收：DB health + generate昨天 + send 1条（<15s；数据和模板都未变化时跳过重新生成、'
+                            '不会重新入队，日报已发送过则不会再发）')
     parser.add_argument('--verify-db', action='store_true',
                        help='只读验收：DB health + integrity_check + journal_mode（<5s）')
     parser.add_argument('--send-existing-report', type=str, metavar='DATE',
@@ -2098,257 +2663,18 @@ if __name__ == '__main__':
     parser.add_argument('--date', type=str,
                        help='指定日期 (格式: YYYY-MM-DD)，默认为今天')
 
-    args = parser.parse_args()
-
-    # 优先处理：秒级测试发送（快速路径）
-    if args.send_existing_report:
-        report_date = args.send_existing_report
-        print(f"\n" + "=" * 60)
-        print(f"秒级测试发送日报：{report_date}")
-        print("=" * 60)
+    return parser
 
-        success = send_existing_report_fast(report_date)
 
-        print("\n" + "=" * 60)
-        if success:
-            print("✓ 测试邮件发送成功！")
-            print(f"  主题: 🧪 TEST Daily Report - {report_date} (From DB)")
-            print("  请检查邮箱收件")
-        else:
-            print("✗ 测试邮件发送失败")
-        print("=" * 60)
-        sys.exit(0)
-
-    if args.verify_db:
-        # 只读验收：DB health + integrity + journal_mode
-        import sqlite3
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [VERIFY_DB] start")
-
-        try:
-            db_path = config.DB_PATH
-            conn = sqlite3.connect(db_path, timeout=5)
-            cursor = conn.cursor()
-
-            # integrity_check
-            cursor.execute("PRAGMA integrity_check")
-            result = cursor.fetchone()
-            integrity = result[0] if result else 'FAILED'
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [VERIFY_DB] integrity_check result={integrity}")
-
-            # journal_mode
-            cursor.execute("PRAGMA journal_mode")
-            result = cursor.fetchone()
-            journal = result[0] if result else 'UNKNOWN'
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [VERIFY_DB] journal_mode actual={journal}")
-
-            conn.close()
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [VERIFY_DB] status=success")
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [VERIFY_DB] status=failed error={e}")
-
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [VERIFY_DB] end")
-        sys.exit(0)
-
-    if args.verify:
-        # 快速验收链路
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [VERIFY] start")
-
-        # 步骤1: DB health
-        try:
-            session = get_session()
-            session.query(DailyReport).limit(1).all()
-            session.close()
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [VERIFY] db_health status=success")
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [VERIFY] db_health status=failed error={e}")
-
-        # 步骤2: 生成昨天日报
-        try:
-            import pytz
-            tz = pytz.timezone(config.REPORT_TIMEZONE)
-            yesterday = datetime.now(tz).date() - timedelta(days=1)
-            asyncio.run(generate_daily_report(target_date=yesterday.strftime('%Y-%m-%d')))
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [VERIFY] generate status=success")
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [VERIFY] generate status=failed error={e}")
-
-        # 步骤3: 发送1条
-        try:
-            asyncio.run(send_pending_daily_reports(limit=1))
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [VERIFY] send status=success")
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [VERIFY] send status=failed error={e}")
-
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [VERIFY] end")
-        sys.exit(0)
-
-    if args.fast_smoke_full:
-        # 完整闭环smoke：生成+发送
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [SMOKE_FULL] start")
-
-        # 确定日期：优先使用 --date，否则使用昨天
-        if args.date:
-            target = args.date
-        else:
-            import pytz
-            tz = pytz.timezone(config.REPORT_TIMEZONE)
-            yesterday = datetime.now(tz).date() - timedelta(days=1)
-            target = yesterday.strftime('%Y-%m-%d')
-
-        # 步骤1：生成日报
-        try:
-            asyncio.run(generate_daily_report(target_date=target))
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [SMOKE_FULL] generate status=success")
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [SMOKE_FULL] generate status=failed error={e}")
-
-        # 步骤2：发送日报
-        try:
-            asyncio.run(send_pending_daily_reports(limit=1))
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [SMOKE_FULL] send status=success")
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [SMOKE_FULL] send status=failed error={e}")
-
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [SMOKE_FULL] end")
-        sys.exit(0)
-
-    if args.backfill_start and args.backfill_end:
-        # 历史回放（带限制）
-        import time
-        from datetime import date
-        start = datetime.strptime(args.backfill_start, '%Y-%m-%d').date()
-        end = datetime.strptime(args.backfill_end, '%Y-%m-%d').date()
-
-        total = 0
-        ok = 0
-        failed = 0
-        start_time = time.time()
-
-        current = start
-        while current <= end:
-            # 检查 max-days 限制
-            if total >= args.backfill_max_days:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [BACKFILL] stopped reason=max_days_reached limit={args.backfill_max_days}")
-                break
-
-            # 检查 timeout 限制
-            if (time.time() - start_time) > args.backfill_timeout_seconds:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [BACKFILL] stopped reason=timeout_exceeded limit={args.backfill_timeout_seconds}s")
-                break
-
-            total += 1
-            date_str = current.strftime('%Y-%m-%d')
-            day_start = time.time()
-
-            try:
-                report_data = asyncio.run(generate_daily_report(target_date=date_str))
-                cost_ms = int((time.time() - day_start) * 1000)
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [BACKFILL] date={date_str} status=success cost_ms={cost_ms}")
-
-                # 打印 summary
-                vol = report_data['volume_stats']
-                counts = report_data['counts']
-                top_list = report_data.get('top_trades_list', [])
-                top_asset = top_list[0]['asset'] if top_list else 'N/A'
-                top_exchange = top_list[0]['exchange'] if top_list else 'N/A'
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [REPORT_SUMMARY] date={date_str} total={counts['total_messages']} blocks={counts['block_trades']} top_volume={vol['max_volume']:.1f} top_asset={top_asset} top_exchange={top_exchange}")
-
-                ok += 1
-            except Exception as e:
-                cost_ms = int((time.time() - day_start) * 1000)
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [BACKFILL] date={date_str} status=failed cost_ms={cost_ms} error={e}")
-                failed += 1
-
-            current += timedelta(days=1)
-
-        elapsed_s = int(time.time() - start_time)
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [BACKFILL] done total={total} ok={ok} failed={failed} elapsed_s={elapsed_s}")
-
-        # 发送（如果没有 --no-send）
-        if not args.no_send:
-            try:
-                asyncio.run(send_pending_daily_reports())
-            except Exception as e:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [BACKFILL] send_failed error={e}")
-
-        sys.exit(0)
-
-    if args.fast_smoke:
-        # 快速smoke：DB连接+发送1条
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [SMOKE_FAST] start")
-        try:
-            session = get_session()
-            session.query(DailyReport).limit(1).all()
-            session.close()
-            asyncio.run(send_pending_daily_reports(limit=1))
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [SMOKE_FAST] error={e}")
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [SMOKE_FAST] end")
-        sys.exit(0)
-
-    if args.smoke:
-        # Smoke测试：保证不崩溃
-        import pytz
-        tz = pytz.timezone(config.REPORT_TIMEZONE)
-        test_time = datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S %Z')
-
-        print("\n" + "=" * 60)
-        print("🧪 SMOKE TEST: 生成 + 发送")
-        print("=" * 60)
-        print(f"测试时间: {test_time}")
-        if args.date:
-            print(f"指定日期: {args.date}")
-        print("=" * 60)
-
-        # 步骤1：生成日报
-        try:
-            print("\n[SMOKE] step=generate status=running")
-            asyncio.run(generate_daily_report())
-            print("[SMOKE] step=generate status=success")
-        except Exception as e:
-            print(f"[SMOKE] step=generate status=failed error={e}")
-
-        # 步骤2：发送日报
-        try:
-            print("\n[SMOKE] step=send status=running")
-            asyncio.run(send_pending_daily_reports())
-            print("[SMOKE] step=send status=success")
-        except Exception as e:
-            print(f"[SMOKE] step=send status=failed error={e}")
-
-        print("\n[SMOKE] end")
-        sys.exit(0)
-
-    if args.test_send_daily:
-        # 测试完整链路
-        import pytz
-        tz = pytz.timezone(config.REPORT_TIMEZONE)
-        test_time = datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S %Z')
-
-        print("\n" + "=" * 60)
-        print("📊 测试日报完整链路：生成 + 发送")
-        print("=" * 60)
-        print(f"测试时间: {test_time}")
-        if args.date:
-            print(f"指定日期: {args.date}")
-        print("=" * 60)
+if __name__ == '__main__':
+    """测试报告生成和发送"""
+    import sys
 
-        # 步骤1：生成日报
-        print("\n[步骤 1/2] 生成日报...")
-        print("-" * 60)
-        asyncio.run(generate_daily_report())
+    args = _build_arg_parser().parse_args()
 
-        # 步骤2：发送日报
-        print("\n[步骤 2/2] 发送日报邮件...")
-        print("-" * 60)
-        asyncio.run(send_pending_daily_reports())
+    for matches, command in _CLI_COMMANDS:
+        if matches(args):
+            command(args)
+            sys.exit(0)
 
-        print("\n" + "=" * 60)
-        print("✓ 测试完成！")
-        print("=" * 60)
-        print("\n📧 请检查邮箱收件（如 EMAIL_ENABLED=true）")
-        print("💡 提示: 如需查看数据库状态，运行: python db_manager.py stats")
-    else:
-        # 默认：仅生成日报
-        print("\n仅生成日报（不发送邮件）...")
-        asyncio.run(generate_daily_report())
+    _cmd_generate_only(args)
@@ -17,7 +17,7 @@ from report_generator import (
     build_daily_report_data,
     build_daily_report_html,
     build_trade_card_html,
-    normalize_block_trades,
+    normalize_block_trades_bucketed,
     parse_block_trade_message
 )
 from email_sender import send_html_email
@@ -115,13 +115,12 @@ def send_test_btc_alert():
         block_trades = [msg for msg in messages if msg.is_block_trade]
 
         # 2. 归一化并过滤 OPTIONS
-        normalized = normalize_block_trades(block_trades, filter_non_options=True)
+        buckets = normalize_block_trades_bucketed(block_trades, filter_non_options=True)
 
         # 3. 筛选符合条件的 BTC OPTIONS 交易
         btc_opts = [
-            t for t in normalized
-            if t['asset'] == 'BTC'
-            and t['instrument_type'] == 'OPTIONS'
+            t for t in buckets['BTC']
+            if t['instrument_type'] == 'OPTIONS'
             and t['volume'] > TEST_THRESHOLD_BTC
         ]
 
@@ -300,22 +299,20 @@ def send_test_eth_alert():
         block_trades = [msg for msg in messages if msg.is_block_trade]
 
         # 2. 归一化并过滤 OPTIONS
-        normalized = normalize_block_trades(block_trades, filter_non_options=True)
+        buckets = normalize_block_trades_bucketed(block_trades, filter_non_options=True)
 
         # 3. 筛选符合条件的 ETH OPTIONS 交易（注意：使用 >= 因为最大值恰好是 1000.0）
         eth_opts = [
-            t for t in normalized
-            if t['asset'] == 'ETH'
-            and t['instrument_type'] == 'OPTIONS'
+            t for t in buckets['ETH']
+            if t['instrument_type'] == 'OPTIONS'
             and t['volume'] >= TEST_THRESHOLD_ETH
         ]
 
         if not eth_opts:
             # 找到最大 volume 的 ETH OPTIONS 交易作为证据
             all_eth_opts = [
-                t for t in normalized
-                if t['asset'] == 'ETH'
-                and t['instrument_type'] == 'OPTIONS'
+                t for t in buckets['ETH']
+                if t['instrument_type'] == 'OPTIONS'
             ]
 
             if all_eth_opts:
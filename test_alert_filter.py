@@ -235,4 +235,5 @@ def main():
 
 
 if __name__ == '__main__':
+    config.setup_logging()
     main()
@@ -287,4 +287,5 @@ async def main():
 
 
 if __name__ == '__main__':
+    config.setup_logging()
     asyncio.run(main())
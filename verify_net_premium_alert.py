@@ -15,6 +15,7 @@ CRITICAL: 必须使用真实历史数据，禁止模拟数据
 import sys
 import os
 from datetime import datetime, timedelta
+from operator import itemgetter
 import config
 from database import get_session, Message
 from report_generator import parse_block_trade_message
@@ -123,7 +124,7 @@ def scan_net_premium_candidates(start_date, end_date, min_abs_net_premium=None):
         print()
 
         # 按 abs_net_premium_usd 降序排序
-        candidates.sort(key=lambda x: x['abs_net_premium_usd'], reverse=True)
+        candidates.sort(key=itemgetter('abs_net_premium_usd'), reverse=True)
 
         return candidates
 
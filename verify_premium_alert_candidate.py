@@ -14,6 +14,7 @@ STEP 4：验收（必须用真实历史数据，不允许模拟）
 import sys
 import os
 from datetime import datetime, timedelta
+from operator import itemgetter
 import config
 from database import get_session, Message
 from report_generator import parse_block_trade_message
@@ -104,7 +105,7 @@ def scan_premium_candidates(start_date, end_date, min_premium=None):
         print()
 
         # 按 premium_usd_sum 降序排序
-        candidates.sort(key=lambda x: x['options_premium_usd_sum'], reverse=True)
+        candidates.sort(key=itemgetter('options_premium_usd_sum'), reverse=True)
 
         return candidates
 